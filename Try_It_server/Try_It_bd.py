@@ -7,18 +7,42 @@ from steam_parser import parse_game
 import traceback
 from datetime import datetime
 import asyncio
+import os
+import time
+from metrics import db_connect_seconds, db_connections_total
+from tracing import TracedAsyncCursor, span
+from profiles import profile_store
+from catalog import Catalog
+from library_cache import CachedLibrary, LibraryCache, LIBRARY_CACHE_DB
 
 
 db_config = {
-    "dbname": "Try_It_db",
-    "user": "postgres",
-    "password": "ari100tel",
-    "host": "localhost",
-    "port": 5432
+    "dbname": os.environ.get("TRYIT_DB_NAME", "Try_It_db"),
+    "user": os.environ.get("TRYIT_DB_USER", "postgres"),
+    "password": os.environ.get("TRYIT_DB_PASSWORD", "ari100tel"),
+    "host": os.environ.get("TRYIT_DB_HOST", "localhost"),
+    "port": int(os.environ.get("TRYIT_DB_PORT", 5432))
     }
+INGEST_PAUSE = float(os.environ.get("TRYIT_INGEST_PAUSE", 1))
 
 
-async def update_user_data(steamid64: str):
+async def db_connect():
+    started = time.perf_counter()
+    try:
+        with span("db_connect"):
+            conn = await psycopg.AsyncConnection.connect(
+                **db_config, row_factory=dict_row, cursor_factory=TracedAsyncCursor
+            )
+    except psycopg.Error:
+        db_connections_total.inc(outcome="error")
+        raise
+    finally:
+        db_connect_seconds.observe(time.perf_counter() - started)
+    db_connections_total.inc(outcome="ok")
+    return conn
+
+
+async def update_user_data(steamid64: str, raise_errors: bool = False):
     try:
         games = await get_games(steamid64)
         friends = await get_friends(steamid64)
@@ -27,23 +51,29 @@ async def update_user_data(steamid64: str):
         print(f"Successfully updated data for user {steamid64}")
     except Exception as e:
         print(f"Error updating data for user {steamid64}: {str(e)}")
+        if raise_errors:
+            raise
 
 
-async def update_all_data():
+async def update_all_users():
     try:
-        conn = await psycopg.AsyncConnection.connect(**db_config, row_factory=dict_row)
+        conn = await db_connect()
         async with conn:
             async with conn.cursor() as cur:
                 await cur.execute("""
                                   SELECT "SteamID64" FROM try_it."Steam_User"
                                   """)
                 users = await cur.fetchall()
-                for user in users:
-                    await update_user_data(user["SteamID64"])
-                    await asyncio.sleep(2)
-                await update_games()
+        for user in users:
+            await update_user_data(user["SteamID64"])
+            await asyncio.sleep(2 * INGEST_PAUSE)
     except Exception as e:
-        print(f"Error in update_all_users_data: {str(e)}")
+        print(f"Error in update_all_users: {str(e)}")
+
+
+async def update_all_data():
+    await update_all_users()
+    await update_games()
 
 
 async def update_games():
@@ -56,7 +86,7 @@ async def update_games():
         for game in games:
             try:
                 appid = str(game['appid'])
-                conn = await psycopg.AsyncConnection.connect(**db_config, row_factory=dict_row)
+                conn = await db_connect()
                 async with conn:
                     async with conn.cursor() as cur:
                         await cur.execute("""
@@ -67,7 +97,7 @@ async def update_games():
                             game_data = await parse_game(appid)
                             if game_data:
                                 await insert_game(game_data)
-                            await asyncio.sleep(1)
+                            await asyncio.sleep(INGEST_PAUSE)
             except Exception as game_err:
                 print(f"Error processing game {game.get('appid')}: {str(game_err)}")
                 continue
@@ -78,7 +108,7 @@ async def update_games():
 
 async def get_all_game_ids():
     try:
-        conn = await psycopg.AsyncConnection.connect(**db_config, row_factory=dict_row)
+        conn = await db_connect()
         async with conn:
             async with conn.cursor() as cur:
                 await cur.execute("""
@@ -93,7 +123,7 @@ async def get_all_game_ids():
 
 async def get_friends_from_db(steamid64: str):
     try:
-        conn = await psycopg.AsyncConnection.connect(**db_config, row_factory=dict_row)
+        conn = await db_connect()
         async with conn:
             async with conn.cursor() as cur:
                 await cur.execute("""
@@ -133,7 +163,7 @@ async def get_friends_from_db(steamid64: str):
 
 async def get_wishlist_from_db(login: str):
     try:
-        conn = await psycopg.AsyncConnection.connect(**db_config, row_factory=dict_row)
+        conn = await db_connect()
         async with conn:
             async with conn.cursor() as cur:
                 await cur.execute("""
@@ -148,7 +178,7 @@ async def get_wishlist_from_db(login: str):
 
 async def add_to_wishlist_in_db(login: str, game_id: str):
     try:
-        conn = await psycopg.AsyncConnection.connect(**db_config, row_factory=dict_row)
+        conn = await db_connect()
         async with conn:
             async with conn.cursor() as cur:
                 await cur.execute("""
@@ -164,7 +194,7 @@ async def add_to_wishlist_in_db(login: str, game_id: str):
 
 async def remove_from_wishlist_in_db(login: str, game_id: str):
     try:
-        conn = await psycopg.AsyncConnection.connect(**db_config, row_factory=dict_row)
+        conn = await db_connect()
         async with conn:
             async with conn.cursor() as cur:
                 await cur.execute("""
@@ -178,7 +208,7 @@ async def remove_from_wishlist_in_db(login: str, game_id: str):
 
 async def get_blacklist_from_db(login: str):
     try:
-        conn = await psycopg.AsyncConnection.connect(**db_config, row_factory=dict_row)
+        conn = await db_connect()
         async with conn:
             async with conn.cursor() as cur:
                 await cur.execute("""
@@ -193,7 +223,7 @@ async def get_blacklist_from_db(login: str):
 
 async def add_to_blacklist_in_db(login: str, game_id: str):
     try:
-        conn = await psycopg.AsyncConnection.connect(**db_config, row_factory=dict_row)
+        conn = await db_connect()
         async with conn:
             async with conn.cursor() as cur:
                 await cur.execute("""
@@ -209,7 +239,7 @@ async def add_to_blacklist_in_db(login: str, game_id: str):
 
 async def remove_from_blacklist_in_db(login: str, game_id: str):
     try:
-        conn = await psycopg.AsyncConnection.connect(**db_config, row_factory=dict_row)
+        conn = await db_connect()
         async with conn:
             async with conn.cursor() as cur:
                 await cur.execute("""
@@ -223,7 +253,7 @@ async def remove_from_blacklist_in_db(login: str, game_id: str):
 
 async def get_short_game_info_from_db(game_id: str):
     try:
-        conn = await psycopg.AsyncConnection.connect(**db_config, row_factory=dict_row)
+        conn = await db_connect()
         async with conn:
             async with conn.cursor() as cur:
                 await cur.execute("""
@@ -236,9 +266,24 @@ async def get_short_game_info_from_db(game_id: str):
         return None
 
 
+async def get_short_games_info_from_db(game_ids):
+    try:
+        conn = await db_connect()
+        async with conn:
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                                  SELECT "GameID", "game_title", "image_url", "rating" FROM try_it."game" WHERE "GameID" = ANY(%s)
+                                  """, (list(game_ids), ))
+                rows = {row["GameID"]: row for row in await cur.fetchall()}
+                return [rows[game_id] for game_id in game_ids if game_id in rows]
+    except psycopg.Error as err:
+        print("DB error in get_short_games_info_from_db:", err)
+        return []
+
+
 async def get_game_info_from_db(game_id: str):
     try:
-        conn = await psycopg.AsyncConnection.connect(**db_config, row_factory=dict_row)
+        conn = await db_connect()
         async with conn:
             async with conn.cursor() as cur:
                 await cur.execute("""
@@ -279,7 +324,7 @@ async def get_game_info_from_db(game_id: str):
 
 async def get_genres_tags_features_from_db():
     try:
-        conn = await psycopg.AsyncConnection.connect(**db_config, row_factory=dict_row)
+        conn = await db_connect()
         async with conn:
             async with conn.cursor() as cur:
                 await cur.execute("""
@@ -297,7 +342,7 @@ async def get_genres_tags_features_from_db():
 
 async def insert_game(game_data):
     try:
-        conn = await psycopg.AsyncConnection.connect(**db_config, row_factory=dict_row)
+        conn = await db_connect()
         async with conn:
             async with conn.cursor() as cur:
                 await cur.execute("""
@@ -353,14 +398,132 @@ async def insert_game(game_data):
                                           ON CONFLICT ("gameID", "featureID") DO NOTHING;
                                           """, (game_data["appid"], feature_row["featureID"], ))
                 await conn.commit()
+        await bump_catalog_version()
     except psycopg.Error as err:
         print("Error while inserting game into DB:", err)
         traceback.print_exc()
 
 
+async def create_catalog_version_table():
+    try:
+        conn = await db_connect()
+        async with conn:
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                                  CREATE TABLE IF NOT EXISTS try_it."catalog_version" (
+                                      "id" INTEGER PRIMARY KEY DEFAULT 1 CHECK ("id" = 1),
+                                      "version" BIGINT NOT NULL DEFAULT 1
+                                  )
+                                  """)
+                await cur.execute("""
+                                  INSERT INTO try_it."catalog_version" ("id", "version") VALUES (1, 1)
+                                  ON CONFLICT ("id") DO NOTHING
+                                  """)
+                await conn.commit()
+    except psycopg.Error as err:
+        print("DB error in create_catalog_version_table:", err)
+
+
+async def create_library_cache_table():
+    if not LIBRARY_CACHE_DB:
+        return
+    try:
+        conn = await db_connect()
+        async with conn:
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                                  CREATE TABLE IF NOT EXISTS try_it."unregistered_library" (
+                                      "SteamID64" TEXT PRIMARY KEY,
+                                      "games" TEXT[] NOT NULL,
+                                      "playtimes" INTEGER[] NOT NULL,
+                                      "fetched_at" TIMESTAMP NOT NULL
+                                  )
+                                  """)
+                await conn.commit()
+    except psycopg.Error as err:
+        print("DB error in create_library_cache_table:", err)
+
+
+async def load_cached_library(steamid64: str):
+    try:
+        conn = await db_connect()
+        async with conn:
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                                  SELECT "games", "playtimes", "fetched_at" FROM try_it."unregistered_library"
+                                  WHERE "SteamID64" = %s
+                                  """, (steamid64, ))
+                row = await cur.fetchone()
+                if row is None:
+                    return None
+                return CachedLibrary(row["fetched_at"].timestamp(), list(zip(row["games"], row["playtimes"])))
+    except psycopg.Error as err:
+        print("DB error in load_cached_library:", err)
+        return None
+
+
+async def store_cached_library(steamid64: str, entry: CachedLibrary):
+    try:
+        conn = await db_connect()
+        async with conn:
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                                  INSERT INTO try_it."unregistered_library" ("SteamID64", "games", "playtimes", "fetched_at")
+                                  VALUES (%s, %s, %s, %s)
+                                  ON CONFLICT ("SteamID64") DO UPDATE SET
+                                      "games" = EXCLUDED."games",
+                                      "playtimes" = EXCLUDED."playtimes",
+                                      "fetched_at" = EXCLUDED."fetched_at"
+                                  """, (steamid64, [game_id for game_id, _ in entry.games],
+                                        [playtime for _, playtime in entry.games], datetime.fromtimestamp(entry.fetched_at), ))
+                await conn.commit()
+    except psycopg.Error as err:
+        print("DB error in store_cached_library:", err)
+
+
+async def fetch_steam_library(steamid64: str):
+    games_data = await get_games(steamid64)
+    return [(str(game["appid"]), game["playtime_forever"]) for game in games_data["response"].get("games", [])]
+
+
+library_cache = LibraryCache(
+    fetch_steam_library,
+    load_cached_library if LIBRARY_CACHE_DB else None,
+    store_cached_library if LIBRARY_CACHE_DB else None
+)
+
+
+async def bump_catalog_version():
+    try:
+        conn = await db_connect()
+        async with conn:
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                                  UPDATE try_it."catalog_version" SET "version" = "version" + 1 WHERE "id" = 1
+                                  """)
+                await conn.commit()
+    except psycopg.Error as err:
+        print("DB error in bump_catalog_version:", err)
+
+
+async def get_catalog_version_from_db():
+    try:
+        conn = await db_connect()
+        async with conn:
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                                  SELECT "version" FROM try_it."catalog_version" WHERE "id" = 1
+                                  """)
+                row = await cur.fetchone()
+                return row["version"] if row else None
+    except psycopg.Error as err:
+        print("DB error in get_catalog_version_from_db:", err)
+        return None
+
+
 async def create_user(login: str, password: str, steamid64: str):
     try:
-        conn = await psycopg.AsyncConnection.connect(**db_config, row_factory=dict_row)
+        conn = await db_connect()
         async with conn:
             async with conn.cursor() as cur:
                 await cur.execute("""
@@ -370,8 +533,6 @@ async def create_user(login: str, password: str, steamid64: str):
                     raise HTTPException(status_code=409, detail="User with this login already exists")
                 try:
                     nickname = await get_nickname(steamid64)
-                    games = await get_games(steamid64)
-                    friends = await get_friends(steamid64)
                 except HTTPException as e:
                     if "Invalid Steam ID" in str(e.detail):
                         raise HTTPException(status_code=409, detail="Invalid Steam ID")
@@ -400,9 +561,12 @@ async def create_user(login: str, password: str, steamid64: str):
                 await cur.execute("""
                                   DELETE FROM try_it."unregistered" WHERE "SteamID64" = %s
                                   """, (steamid64, ))
+                if LIBRARY_CACHE_DB:
+                    await cur.execute("""
+                                      DELETE FROM try_it."unregistered_library" WHERE "SteamID64" = %s
+                                      """, (steamid64, ))
                 await conn.commit()
-                await insert_games(games, steamid64)
-                await insert_friends(friends, steamid64)
+        library_cache.invalidate(steamid64)
     except psycopg.Error as err:
         print("Error while connecting to DB on create_user function:", err)
         raise HTTPException(status_code=500, detail="Database error")
@@ -410,7 +574,8 @@ async def create_user(login: str, password: str, steamid64: str):
 
 async def insert_games(games, steamid64):
     try:
-        conn = await psycopg.AsyncConnection.connect(**db_config, row_factory=dict_row)
+        added = []
+        conn = await db_connect()
         async with conn:
             async with conn.cursor() as cur:
                 for game in games['response'].get("games", []):
@@ -429,18 +594,21 @@ async def insert_games(games, steamid64):
                                               SELECT 1 FROM try_it."game" WHERE "GameID" = %s
                                               """, (str(gameID), ))
                             exists = await cur.fetchone()
-                            await asyncio.sleep(1)
+                            await asyncio.sleep(INGEST_PAUSE)
                         if exists:
                             await cur.execute("""
                                               INSERT INTO try_it."library" ("SteamID64", "GameID", "time_in_game")
                                               VALUES (%s, %s, %s) ON CONFLICT DO NOTHING
                                               """, (steamid64, gameID, playtime))
+                            if cur.rowcount == 1:
+                                added.append((str(gameID), playtime))
                         else:
                             print(f"[WARNING] GameID {gameID} not added in DB — probably, game was deleted from Steam.")
                     except Exception as game_err:
                         print(f"[ERROR] Failed to insert game {game.get('appid')} for user {steamid64}: {game_err}")
                         traceback.print_exc()
                 await conn.commit()
+        profile_store.add_games(steamid64, added)
     except psycopg.Error as err:
         print("[DB ERROR] psycopg error in insert_games:", err)
         traceback.print_exc()
@@ -452,8 +620,9 @@ async def insert_games(games, steamid64):
 
 
 async def insert_friends(friends, steamid64):
+    unregistered = []
     try:
-        conn = await psycopg.AsyncConnection.connect(**db_config, row_factory=dict_row)
+        conn = await db_connect()
         async with conn:
             async with conn.cursor() as cur:
                 for friend in friends['friendslist'].get("friends", []):
@@ -486,10 +655,12 @@ async def insert_friends(friends, steamid64):
                                               INSERT INTO try_it."unregistered_friends" ("registered_SteamID64", "unregistered_SteamID64")
                                               VALUES (%s, %s) ON CONFLICT DO NOTHING
                                               """, (steamid64, friend_id, ))
+                            unregistered.append(friend_id)
                     except Exception as friend_err:
                         print(f"[ERROR] Failed to process friend {friend.get('steamid')}: {friend_err}")
                         traceback.print_exc()
             await conn.commit()
+        library_cache.prefetch(unregistered)
     except Exception as err:
         print("[ERROR] insert_friends general failure:", err)
         traceback.print_exc()
@@ -498,7 +669,7 @@ async def insert_friends(friends, steamid64):
 
 async def get_user_by_login(login:str):
     try:
-        conn = await psycopg.AsyncConnection.connect(**db_config, row_factory=dict_row)
+        conn = await db_connect()
         async with conn:
             async with conn.cursor() as cur:
                 await cur.execute("""
@@ -513,7 +684,7 @@ async def get_user_by_login(login:str):
 
 async def get_user_game_interactions():
     try:
-        conn = await psycopg.AsyncConnection.connect(**db_config, row_factory=dict_row)
+        conn = await db_connect()
         async with conn:
             async with conn.cursor() as cur:
                 await cur.execute("""
@@ -527,70 +698,94 @@ async def get_user_game_interactions():
         return []
 
 
+async def get_registered_user_libraries():
+    try:
+        conn = await db_connect()
+        async with conn:
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                                  SELECT u."SteamID64",
+                                      COALESCE(ARRAY_AGG(l."GameID") FILTER (WHERE l."GameID" IS NOT NULL), '{}') AS games,
+                                      COALESCE(ARRAY_AGG(l."time_in_game") FILTER (WHERE l."GameID" IS NOT NULL), '{}') AS playtimes
+                                  FROM try_it."user" u
+                                  LEFT JOIN try_it."library" l ON l."SteamID64" = u."SteamID64"
+                                  GROUP BY u."SteamID64"
+                                  """)
+                rows = await cur.fetchall()
+                return {row["SteamID64"]: list(zip(row["games"], row["playtimes"])) for row in rows}
+    except psycopg.Error as err:
+        print("DB error in get_registered_user_libraries:", err)
+        return {}
+
+
 async def get_user_games_ids(steamid64):
     try:
-        conn = await psycopg.AsyncConnection.connect(**db_config, row_factory=dict_row)
+        conn = await db_connect()
         async with conn:
             async with conn.cursor() as cur:
                 await cur.execute("""
                                   SELECT 1 FROM try_it."user" WHERE "SteamID64" = %s
                                   """, (steamid64, ))
-                if not await cur.fetchone():
-                    games_data = await get_games(steamid64)
-                    return [(str(game["appid"]), game["playtime_forever"]) 
-                           for game in games_data["response"].get("games", [])]
+                if await cur.fetchone():
+                    await cur.execute("""
+                                      SELECT "GameID", "time_in_game" FROM try_it."library"
+                                      WHERE "SteamID64" = %s
+                                      """, (steamid64, ))
+                    rows = await cur.fetchall()
+                    return [(row["GameID"], row["time_in_game"]) for row in rows]
+        return await library_cache.get(steamid64)
+    except Exception as err:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(err)}")
+
+
+async def get_user_libraries(steamids):
+    try:
+        conn = await db_connect()
+        async with conn:
+            async with conn.cursor() as cur:
                 await cur.execute("""
-                                  SELECT "GameID", "time_in_game" FROM try_it."library"
-                                  WHERE "SteamID64" = %s
-                                  """, (steamid64, ))
-                rows = await cur.fetchall()
-                return [(row["GameID"], row["time_in_game"]) for row in rows]
+                                  SELECT u."SteamID64", l."GameID", l."time_in_game"
+                                  FROM try_it."user" u
+                                  LEFT JOIN try_it."library" l ON l."SteamID64" = u."SteamID64"
+                                  WHERE u."SteamID64" = ANY(%s)
+                                  """, (list(steamids), ))
+                libraries = {}
+                for row in await cur.fetchall():
+                    library = libraries.setdefault(str(row["SteamID64"]), [])
+                    if row["GameID"] is not None:
+                        library.append((row["GameID"], row["time_in_game"]))
+        unregistered = [steamid64 for steamid64 in steamids if steamid64 not in libraries]
+        for steamid64, games in zip(unregistered, await asyncio.gather(*map(library_cache.get, unregistered))):
+            libraries[steamid64] = games
+        return libraries
     except Exception as err:
         raise HTTPException(status_code=500, detail=f"Database error: {str(err)}")
 
 
 async def get_game_features():
     try:
-        conn = await psycopg.AsyncConnection.connect(**db_config, row_factory=dict_row)
+        conn = await db_connect()
         async with conn:
             async with conn.cursor() as cur:
                 await cur.execute("""
                                   SELECT "GameID", "rating" FROM try_it."game"
                                   """)
-                ratings = {row["GameID"]: row["rating"] for row in await cur.fetchall()}
+                ratings = [(row["GameID"], row["rating"]) for row in await cur.fetchall()]
                 await cur.execute("""
-                                  SELECT g."gameID", t.tag
+                                  SELECT g."gameID", t.tag AS "term"
                                   FROM try_it."tags" g
                                   JOIN try_it."tag" t ON g."tagID" = t."tagID"
-                                  """)
-                tag_map = {}
-                for row in await cur.fetchall():
-                    tag_map.setdefault(row["gameID"], []).append(row['tag'])
-                await cur.execute("""
+                                  UNION ALL
                                   SELECT g."gameID", gen.genre
                                   FROM try_it."genres" g
                                   JOIN try_it."genre" gen ON g."genreID" = gen."genreID"
-                                  """)
-                genre_map = {}
-                for row in await cur.fetchall():
-                    genre_map.setdefault(row["gameID"], []).append(row['genre'])
-                await cur.execute("""
+                                  UNION ALL
                                   SELECT g."gameID", f.feature
                                   FROM try_it."features" g
                                   JOIN try_it."feature" f ON g."featureID" = f."featureID"
                                   """)
-                category_map = {}
-                for row in await cur.fetchall():
-                    category_map.setdefault(row["gameID"], []).append(row['feature'])
-                game_features = {}
-                for appid in ratings:
-                    features = []
-                    features.append(f"rating:{ratings[appid]}")
-                    features.extend(tag_map.get(appid, []))
-                    features.extend(genre_map.get(appid, []))
-                    features.extend(category_map.get(appid, []))
-                    game_features[appid] = features
-                return game_features
+                terms = [(row["gameID"], row["term"]) for row in await cur.fetchall()]
+                return Catalog.from_rows(ratings, terms)
     except psycopg.Error as err:
         print("Error while fetching game features:", err)
         return []
@@ -598,7 +793,7 @@ async def get_game_features():
 
 async def check_user_registered(steamid64: str) -> bool:
     try:
-        conn = await psycopg.AsyncConnection.connect(**db_config, row_factory=dict_row)
+        conn = await db_connect()
         async with conn:
             async with conn.cursor() as cur:
                 await cur.execute("""
@@ -1,9 +1,13 @@
 import uvicorn
 import bcrypt
 import asyncio
-from fastapi import FastAPI, HTTPException
+import orjson
+import time
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import ORJSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from recommend import collaborative_recommendations, content_recommendations, hybrid_recommendations
+from fastapi.middleware.gzip import GZipMiddleware
+from recommend import hybrid_recommendations, group_recommendations, GROUP_STRATEGIES
 from Try_It_bd import (
     create_user,
     get_user_by_login,
@@ -11,22 +15,40 @@ from Try_It_bd import (
     get_game_info_from_db,
     get_genres_tags_features_from_db,
     get_short_game_info_from_db,
+    get_short_games_info_from_db,
     get_wishlist_from_db,
     get_blacklist_from_db,
     add_to_wishlist_in_db,
     add_to_blacklist_in_db,
     remove_from_wishlist_in_db,
     remove_from_blacklist_in_db,
-    update_all_data
+    create_catalog_version_table,
+    create_library_cache_table
 )
+from job_queue import enqueue_job, enqueue_coalesced_job, get_job, start_workers
+from scheduler import start_scheduler, get_scheduler_status
+from precompute import get_precomputed_recommendations
+from similar_games import get_neighbor_table, SIMILAR_GAMES_K
+from pagination import ranking_store, encode_cursor, decode_cursor, create_ranking_cursor_table
+from http_cache import catalog_response
+from tracing import tracing_requested, trace, server_timing, dump_trace, Profiler, PROFILE_HEADER, PROFILING_ENABLED
+from metrics import registry, request_seconds, timed_stage, cache_lookup, model_info
+from recommend import get_model_version
+from model_store import store_enabled, current_snapshot_version, activate_snapshot, watch_snapshots
 from pydantic import BaseModel
 from auth import create_access_token, create_refresh_token, verify_token
 from typing import List, Optional
 from fastapi import Query
-from datetime import datetime, timedelta
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    BrotliMiddleware = None
 
 
-app = FastAPI()
+COMPRESSION_MIN_SIZE = 1024
+
+
+app = FastAPI(default_response_class=ORJSONResponse)
 
 
 app.add_middleware(
@@ -36,38 +58,65 @@ app.add_middleware(
     ],
     allow_credentials=True,
     allow_methods=["GET", "POST"],
-    allow_headers=["Authorization", "Content-Type"],
+    allow_headers=["Authorization", "Content-Type", "If-None-Match"],
+    expose_headers=["ETag", "Server-Timing"],
 )
-
-
-last_update_time = datetime.now()
-
-
-async def periodic_update():
-    global last_update_time
-    while True:
-        try:
-            current_time = datetime.now()
-            if last_update_time is None or (current_time - last_update_time) >= timedelta(days=7):
-                print("Starting weekly data update...")
-                await update_all_data()
-                last_update_time = current_time
-                await asyncio.gather(
-                    collaborative_recommendations(force_update=True),
-                    content_recommendations(force_update=True)
-                )
-                print("Weekly update completed")
-            asyncio.create_task(asyncio.sleep(24 * 60 * 60))
-            return
-        except Exception as e:
-            print(f"Error in periodic_update: {str(e)}")
-            asyncio.create_task(asyncio.sleep(60 * 60))
-            return
+if BrotliMiddleware is not None:
+    app.add_middleware(BrotliMiddleware, minimum_size=COMPRESSION_MIN_SIZE, gzip_fallback=True)
+else:
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
+
+JOB_WORKERS = 2
+RECOMMENDATIONS_N = 100
+STREAM_CHUNK_SIZE = 10
+GROUP_MAX_SIZE = 16
+
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    request_seconds.observe(
+        time.perf_counter() - started,
+        route=route.path if route else "unmatched",
+        status=str(response.status_code)
+    )
+    return response
+
+
+@app.middleware("http")
+async def trace_request(request: Request, call_next):
+    if not tracing_requested(request.headers):
+        return await call_next(request)
+    profiler = Profiler() if PROFILING_ENABLED and request.headers.get(PROFILE_HEADER) == "1" else None
+    with trace(request.url.path) as root:
+        if profiler:
+            with profiler:
+                response = await call_next(request)
+        else:
+            response = await call_next(request)
+    response.headers["Server-Timing"] = server_timing(root)
+    trace_path = dump_trace(root)
+    profile_path = profiler.dump() if profiler else None
+    if trace_path or profile_path:
+        print(f"Trace for {request.url.path}: {trace_path} {profile_path or ''}")
+    return response
 
 
 @app.on_event("startup")
 async def startup_event():
-    asyncio.create_task(periodic_update())
+    await create_catalog_version_table()
+    await create_library_cache_table()
+    await create_ranking_cursor_table()
+    if store_enabled():
+        snapshot_version = current_snapshot_version()
+        if snapshot_version:
+            await activate_snapshot(snapshot_version)
+        asyncio.create_task(watch_snapshots())
+    await start_workers(JOB_WORKERS)
+    await start_scheduler()
 
 
 class User_Register(BaseModel):
@@ -96,13 +145,33 @@ if __name__ == '__main__':
     )
 
 
+async def hydrate_recommendations(recommendations):
+    scores = dict(recommendations)
+    result = await timed_stage(
+        "hydration", get_short_games_info_from_db([game_id for game_id, _ in recommendations])
+    )
+    for game_info in result:
+        game_info["score"] = scores[game_info["GameID"]]
+    return result
+
+
+async def stream_recommendations(page, next_cursor):
+    for start in range(0, len(page), STREAM_CHUNK_SIZE):
+        for game_info in await hydrate_recommendations(page[start:start + STREAM_CHUNK_SIZE]):
+            yield orjson.dumps({"recommendation": game_info}, default=str) + b"\n"
+    yield orjson.dumps({"next_cursor": next_cursor}) + b"\n"
+
+
 @app.get('/recommend')
 async def get_recommendation(
     token: str,
     tags: Optional[List[str]] = Query(None),
     genres: Optional[List[str]] = Query(None),
     categories: Optional[List[str]] = Query(None),
-    friend_steam_id: Optional[str] = Query(None)
+    friend_steam_id: Optional[str] = Query(None),
+    limit: Optional[int] = Query(None, ge=1, le=RECOMMENDATIONS_N),
+    cursor: Optional[str] = Query(None),
+    stream: bool = False
 ):
     payload = verify_token(token, token_type="access")
     if not payload:
@@ -112,25 +181,69 @@ async def get_recommendation(
         raise HTTPException(status_code=404, detail="User not found")
     user_id = str(db_user["SteamID64"])
     login = str(db_user["login"])
-    print(f"genres: {genres}")
-    print(f"categories: {categories}")
-    recommendations = await hybrid_recommendations(
-        login,
-        user_id, 
-        n=100, 
-        tags=tags, 
-        genres=genres, 
-        categories=categories,
-        friend_id=friend_steam_id
-    )
-    result = []
-    for rec in recommendations:
-        game_id, score = rec
-        game_info = await get_short_game_info_from_db(game_id)
-        if game_info:
-            game_info["score"] = score
-            result.append(game_info)
-    return {"recommendations": result}
+    if cursor:
+        decoded = decode_cursor(cursor)
+        recommendations = await ranking_store.get(decoded[0], login) if decoded else None
+        cache_lookup("ranking_cursor", recommendations is not None)
+        if recommendations is None:
+            raise HTTPException(status_code=410, detail="Cursor expired, request the first page again")
+        ranking_token, offset = decoded
+    else:
+        print(f"genres: {genres}")
+        print(f"categories: {categories}")
+        recommendations = None
+        if not (tags or genres or categories or friend_steam_id):
+            recommendations = await timed_stage(
+                "precomputed_lookup", get_precomputed_recommendations(user_id, login, n=RECOMMENDATIONS_N)
+            )
+        if recommendations is None:
+            recommendations = await hybrid_recommendations(
+                login,
+                user_id, 
+                n=RECOMMENDATIONS_N, 
+                tags=tags, 
+                genres=genres, 
+                categories=categories,
+                friend_id=friend_steam_id
+            )
+        ranking_token, offset = None, 0
+    page_size = limit or len(recommendations)
+    page = recommendations[offset:offset + page_size]
+    next_cursor = None
+    if offset + page_size < len(recommendations):
+        if ranking_token is None:
+            ranking_token = await ranking_store.put(login, recommendations)
+        next_cursor = encode_cursor(ranking_token, offset + page_size)
+    if stream:
+        return StreamingResponse(
+            stream_recommendations(page, next_cursor),
+            media_type="application/x-ndjson",
+            headers={"Content-Encoding": "identity"}
+        )
+    return {"recommendations": await hydrate_recommendations(page), "next_cursor": next_cursor}
+
+
+@app.get('/group-recommend')
+async def get_group_recommendation(
+    token: str,
+    steam_ids: List[str] = Query(...),
+    strategy: str = "average",
+    limit: Optional[int] = Query(None, ge=1, le=RECOMMENDATIONS_N)
+):
+    payload = verify_token(token, token_type="access")
+    if not payload:
+        raise HTTPException(status_code=401, detail="Invalid access token")
+    if strategy not in GROUP_STRATEGIES:
+        raise HTTPException(status_code=400, detail=f"Unknown strategy, expected one of {', '.join(GROUP_STRATEGIES)}")
+    db_user = await get_user_by_login(payload["sub"])
+    if not db_user:
+        raise HTTPException(status_code=404, detail="User not found")
+    user_id = str(db_user["SteamID64"])
+    members = list(dict.fromkeys([user_id] + steam_ids))
+    if len(members) > GROUP_MAX_SIZE:
+        raise HTTPException(status_code=400, detail=f"A group can have at most {GROUP_MAX_SIZE} players")
+    recommendations = await group_recommendations(str(db_user["login"]), members, n=limit or RECOMMENDATIONS_N, strategy=strategy)
+    return {"recommendations": await hydrate_recommendations(recommendations)}
 
 
 @app.get('/get-wishlist')
@@ -223,11 +336,12 @@ async def remove_from_blacklist(token: str, game_id: str):
 async def register_user(user: User_Register):
     try:
         await create_user(user.login, user.password, user.steamid64)
-        await asyncio.gather(
-            collaborative_recommendations(force_update=True),
-            content_recommendations(force_update=True)
-        )
-        return {"message": "User created successfully"}
+        ingest_job_id = await enqueue_job("ingest_user", {"steamid64": user.steamid64})
+        refresh_job_id = await enqueue_coalesced_job("refresh_models", user.steamid64)
+        return {
+            "message": "User created successfully",
+            "jobs": {"ingest_user": ingest_job_id, "refresh_models": refresh_job_id}
+        }
     except HTTPException as err:
         print(f"Error in register_user: {err.detail}")
         raise err
@@ -284,22 +398,70 @@ async def get_friends(token: str):
     
 
 @app.get('/get-game-info')
-async def get_game_info(token: str, game_id: str):
+async def get_game_info(request: Request, token: str, game_id: str):
     payload = verify_token(token, token_type="access")
     if not payload:
         raise HTTPException(status_code=401, detail="Invalid access token")
-    db_user = await get_user_by_login(payload["sub"])
-    if not db_user:
-        raise HTTPException(status_code=404, detail="User not found")
-    return await get_game_info_from_db(game_id)
+    return await catalog_response(request, ("game_info", game_id), lambda: get_game_info_from_db(game_id))
+
+
+@app.get('/similar-games')
+async def get_similar_games(token: str, game_id: str, limit: Optional[int] = Query(None, ge=1, le=SIMILAR_GAMES_K)):
+    payload = verify_token(token, token_type="access")
+    if not payload:
+        raise HTTPException(status_code=401, detail="Invalid access token")
+    table = get_neighbor_table()
+    if table is None:
+        raise HTTPException(status_code=503, detail="Similar games are not built yet")
+    similar = table.similar(game_id, limit or SIMILAR_GAMES_K)
+    if similar is None:
+        raise HTTPException(status_code=404, detail="Game not found")
+    return {"similar_games": await hydrate_recommendations(similar)}
 
 
 @app.get('/get-genres-tags-features')
-async def get_genres_tags_features(token: str):
+async def get_genres_tags_features(request: Request, token: str):
+    payload = verify_token(token, token_type="access")
+    if not payload:
+        raise HTTPException(status_code=401, detail="Invalid access token")
+    return await catalog_response(request, "genres_tags_features", get_genres_tags_features_from_db)
+
+
+@app.get('/job-status')
+async def get_job_status(token: str, job_id: int):
     payload = verify_token(token, token_type="access")
     if not payload:
         raise HTTPException(status_code=401, detail="Invalid access token")
     db_user = await get_user_by_login(payload["sub"])
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
-    return await get_genres_tags_features_from_db()
+    job = await get_job(job_id)
+    steamid64 = str(db_user["SteamID64"])
+    if not job or (job["payload"].get("steamid64") != steamid64 and steamid64 not in job["payload"].get("steamid64s", [])):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {
+        "job_id": job["jobID"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"]
+    }
+
+
+@app.get('/scheduler-status')
+async def scheduler_status(token: str):
+    payload = verify_token(token, token_type="access")
+    if not payload:
+        raise HTTPException(status_code=401, detail="Invalid access token")
+    if not await get_user_by_login(payload["sub"]):
+        raise HTTPException(status_code=404, detail="User not found")
+    return {"schedules": await get_scheduler_status()}
+
+
+@app.get('/metrics')
+async def get_metrics():
+    model_info.replace(1, version=get_model_version() or "none")
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,91 @@
+import numpy as np
+import scipy.sparse as sp
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple
+
+
+CHUNK_NNZ = 200000
+
+
+def confidence_matrix(users: np.ndarray, items: np.ndarray, playtime: np.ndarray, shape: Tuple[int, int],
+                      alpha: float, epsilon: float) -> sp.csr_matrix:
+    confidence = 1.0 + alpha * np.log1p(np.asarray(playtime, dtype=np.float32) / epsilon)
+    matrix = sp.csr_matrix((confidence.astype(np.float32), (users, items)), shape=shape)
+    matrix.sum_duplicates()
+    return matrix
+
+
+def row_chunks(matrix: sp.csr_matrix):
+    bounds = [0]
+    for row in np.searchsorted(matrix.indptr, np.arange(CHUNK_NNZ, matrix.nnz, CHUNK_NNZ)):
+        if row > bounds[-1]:
+            bounds.append(int(row))
+    bounds.append(matrix.shape[0])
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def solve_chunk(confidence: sp.csr_matrix, factors: np.ndarray, gram: np.ndarray, x: np.ndarray, cg_steps: int):
+    rows = np.repeat(np.arange(confidence.shape[0]), np.diff(confidence.indptr))
+    extra = confidence.data - 1.0
+    owned = factors[confidence.indices]
+
+    def apply(v):
+        dots = np.einsum("ij,ij->i", owned, v[rows])
+        weighted = sp.csr_matrix((extra * dots, confidence.indices, confidence.indptr), shape=confidence.shape)
+        return v @ gram + weighted @ factors
+
+    residual = confidence @ factors - apply(x)
+    direction = residual.copy()
+    rs_old = np.einsum("ij,ij->i", residual, residual)
+    for _ in range(cg_steps):
+        if not np.any(rs_old > 1e-10):
+            break
+        product = apply(direction)
+        denom = np.einsum("ij,ij->i", direction, product)
+        step = np.divide(rs_old, denom, out=np.zeros_like(rs_old), where=denom > 0)
+        x += step[:, None] * direction
+        residual -= step[:, None] * product
+        rs_new = np.einsum("ij,ij->i", residual, residual)
+        ratio = np.divide(rs_new, rs_old, out=np.zeros_like(rs_new), where=rs_old > 0)
+        direction = residual + ratio[:, None] * direction
+        rs_old = rs_new
+    return x
+
+
+def solve_side(confidence: sp.csr_matrix, solved: np.ndarray, fixed: np.ndarray, regularization: float,
+               cg_steps: int, pool: ThreadPoolExecutor):
+    gram = fixed.T @ fixed + regularization * np.eye(fixed.shape[1], dtype=fixed.dtype)
+    chunks = row_chunks(confidence)
+    results = pool.map(
+        lambda bounds: solve_chunk(confidence[bounds[0]:bounds[1]], fixed, gram, solved[bounds[0]:bounds[1]].copy(), cg_steps),
+        chunks
+    )
+    for (start, end), chunk in zip(chunks, results):
+        solved[start:end] = chunk
+
+
+def fit_als(confidence: sp.csr_matrix, factors: int = 64, iterations: int = 15, regularization: float = 0.05,
+            cg_steps: int = 3, threads: int = None, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    user_factors = (rng.standard_normal((confidence.shape[0], factors)) * 0.01).astype(np.float32)
+    item_factors = (rng.standard_normal((confidence.shape[1], factors)) * 0.01).astype(np.float32)
+    item_confidence = confidence.T.tocsr()
+    with ThreadPoolExecutor(max_workers=threads or os.cpu_count()) as pool:
+        for _ in range(iterations):
+            solve_side(confidence, user_factors, item_factors, regularization, cg_steps, pool)
+            solve_side(item_confidence, item_factors, user_factors, regularization, cg_steps, pool)
+    return user_factors, item_factors
+
+
+def regularized_gram(item_factors: np.ndarray, regularization: float) -> np.ndarray:
+    item_factors = np.asarray(item_factors, dtype=np.float64)
+    return item_factors.T @ item_factors + regularization * np.eye(item_factors.shape[1])
+
+
+def fold_in(items: np.ndarray, confidence: np.ndarray, item_factors: np.ndarray, gram: np.ndarray) -> np.ndarray:
+    if len(items) == 0:
+        return np.zeros(item_factors.shape[1], dtype=np.float32)
+    owned = np.asarray(item_factors[items], dtype=np.float64)
+    system = gram + (owned.T * (confidence - 1.0)) @ owned
+    return np.linalg.solve(system, owned.T @ confidence).astype(np.float32)
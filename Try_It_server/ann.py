@@ -0,0 +1,119 @@
+import numpy as np
+import scipy.sparse as sp
+from typing import Optional
+from catalog import CatalogView
+
+
+ANN_ITERATIONS = 8
+ANN_TRAIN_SAMPLE = 64
+ANN_ASSIGN_BLOCK = 16384
+ANN_LISTS_PER_ROOT = 4
+
+
+def dense_rows(vectors, rows: np.ndarray) -> np.ndarray:
+    block = vectors[rows]
+    return block.toarray() if sp.issparse(block) else np.asarray(block)
+
+
+def assign_lists(vectors, centroids: np.ndarray, block_size: int = ANN_ASSIGN_BLOCK) -> np.ndarray:
+    half_norms = 0.5 * np.einsum("ij,ij->i", centroids, centroids)
+    lists = np.empty(vectors.shape[0], dtype=np.int32)
+    for start in range(0, vectors.shape[0], block_size):
+        end = min(start + block_size, vectors.shape[0])
+        similarity = np.asarray(vectors[start:end] @ centroids.T) - half_norms
+        lists[start:end] = similarity.argmax(axis=1)
+    return lists
+
+
+def kmeans(vectors, n_lists: int, iterations: int = ANN_ITERATIONS, sample: int = ANN_TRAIN_SAMPLE, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    n = vectors.shape[0]
+    train_rows = rng.choice(n, min(n, n_lists * sample), replace=False)
+    train = vectors[train_rows]
+    centroids = dense_rows(train, rng.choice(len(train_rows), n_lists, replace=False)).astype(np.float32)
+    for _ in range(iterations):
+        lists = assign_lists(train, centroids)
+        members = sp.csr_matrix(
+            (np.ones(len(lists), dtype=np.float32), (lists, np.arange(len(lists)))), shape=(n_lists, len(lists))
+        )
+        counts = np.asarray(members.sum(axis=1)).ravel()
+        sums = members @ train
+        sums = sums.toarray() if sp.issparse(sums) else sums
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+
+def inner_product_vectors(vectors: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    augmented = np.hstack((vectors, offsets[:, None])).astype(np.float32)
+    norms = np.einsum("ij,ij->i", augmented, augmented)
+    return np.hstack((augmented, np.sqrt(norms.max() - norms)[:, None]))
+
+
+def row_norms(vectors) -> np.ndarray:
+    if sp.issparse(vectors):
+        return np.sqrt(np.asarray(vectors.multiply(vectors).sum(axis=1)).ravel())
+    return np.linalg.norm(vectors, axis=1)
+
+
+class IVFIndex:
+    def __init__(self, centroids: np.ndarray, lists: np.ndarray, radius: float = 1.0):
+        self.centroids = centroids
+        self.radius = radius
+        self.half_norms = 0.5 * np.einsum("ij,ij->i", centroids, centroids)
+        order = np.argsort(lists, kind="stable")
+        self.items = order.astype(np.int32)
+        self.offsets = np.concatenate(([0], np.cumsum(np.bincount(lists, minlength=len(centroids)))))
+
+    @classmethod
+    def build(cls, vectors, n_lists: Optional[int] = None, iterations: int = ANN_ITERATIONS, seed: int = 0):
+        n_lists = min(n_lists or max(1, int(ANN_LISTS_PER_ROOT * np.sqrt(vectors.shape[0]))), vectors.shape[0])
+        centroids = kmeans(vectors, n_lists, iterations, seed=seed)
+        return cls(centroids, assign_lists(vectors, centroids), float(np.median(row_norms(vectors))))
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def search(self, query: np.ndarray, n_candidates: int) -> np.ndarray:
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query * (self.radius / norm)
+        order = np.argsort(self.half_norms - self.centroids @ query)
+        sizes = np.diff(self.offsets)[order]
+        probes = int(np.searchsorted(np.cumsum(sizes), n_candidates)) + 1
+        return np.concatenate([self.items[self.offsets[lst]:self.offsets[lst + 1]] for lst in order[:probes]])
+
+
+class ANNIndex:
+    def __init__(self, version, catalog, collab: Optional[IVFIndex], content: Optional[IVFIndex]):
+        self.version = version
+        self.catalog = catalog
+        self.collab = collab
+        self.content = content
+
+    @classmethod
+    def build(cls, version, catalog, item_vectors: Optional[np.ndarray], item_offsets: Optional[np.ndarray], content_matrix):
+        collab = None
+        if item_vectors is not None:
+            collab = IVFIndex.build(inner_product_vectors(item_vectors, item_offsets))
+        content = IVFIndex.build(content_matrix) if content_matrix is not None else None
+        return cls(version, catalog, collab, content)
+
+    def candidates(self, user_vector: Optional[np.ndarray], profile: Optional[sp.csr_matrix], n_candidates: int) -> np.ndarray:
+        found = []
+        if self.collab is not None and user_vector is not None:
+            found.append(self.collab.search(np.append(user_vector, [1.0, 0.0]).astype(np.float32), n_candidates))
+        if self.content is not None and profile is not None:
+            found.append(self.content.search(profile.toarray().ravel().astype(np.float32), n_candidates))
+        return np.unique(np.concatenate(found)) if found else np.zeros(0, dtype=np.int32)
+
+    def narrow(self, filtered_games, user_vector: Optional[np.ndarray], profile: Optional[sp.csr_matrix], n_candidates: int):
+        if filtered_games.base is not self.catalog or len(filtered_games) <= n_candidates:
+            return filtered_games
+        scale = len(self.catalog) / len(filtered_games)
+        rows = self.candidates(user_vector, profile, int(n_candidates * scale))
+        if len(rows) == 0:
+            return filtered_games
+        if filtered_games is not self.catalog:
+            rows = rows[filtered_games.members[rows]]
+        return CatalogView(self.catalog, rows.astype(np.int32))
@@ -0,0 +1,281 @@
+import asyncio
+import inspect
+import os
+import numpy as np
+import scipy.sparse as sp
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+import recommend
+from catalog import as_catalog
+from factors import ItemFactors
+from profiles import playtime_weights
+
+
+BATCH_BLOCK_SIZE = 256
+BATCH_WORKERS = int(os.environ.get("TRYIT_BATCH_WORKERS", os.cpu_count() or 1))
+SHARED_ALIGNMENT = 64
+batch_state = None
+
+
+def share_arrays(arrays: Dict[str, np.ndarray]) -> Tuple[SharedMemory, Dict]:
+    layout, size = {}, 0
+    for name, array in arrays.items():
+        layout[name] = (size, array.shape, array.dtype.str)
+        size += -(-array.nbytes // SHARED_ALIGNMENT) * SHARED_ALIGNMENT
+    shm = SharedMemory(create=True, size=max(size, 1))
+    for name, array in arrays.items():
+        offset, shape, dtype = layout[name]
+        np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)[...] = array
+    return shm, layout
+
+
+def attach_arrays(shm: SharedMemory, layout: Dict) -> Dict[str, np.ndarray]:
+    return {
+        name: np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+        for name, (offset, shape, dtype) in layout.items()
+    }
+
+
+def top_k_per_row(scores: np.ndarray, k: int) -> np.ndarray:
+    k = min(k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+
+def reciprocal_rank_rows(scores: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    order = np.argsort(-np.where(valid, scores, -np.inf), axis=1, kind="stable")
+    ranks = np.empty(scores.shape, dtype=np.float32)
+    np.put_along_axis(ranks, order, np.broadcast_to(np.arange(1, scores.shape[1] + 1, dtype=np.float32), order.shape), axis=1)
+    return 1.0 / (recommend.RANK_FUSION_K + ranks)
+
+
+def min_max_rows(scores: np.ndarray, valid: np.ndarray, weight: float) -> np.ndarray:
+    low = np.min(scores, axis=1, where=valid, initial=np.inf)
+    high = np.max(scores, axis=1, where=valid, initial=-np.inf)
+    scale = weight / np.where(high > low, high - low, 1.0)
+    normalized = scores * scale[:, None].astype(np.float32)
+    normalized -= (low * scale)[:, None].astype(np.float32)
+    return normalized
+
+
+def fuse_rows(legs: List[Tuple[np.ndarray, float]], valid: np.ndarray, n: int, method: str) -> Tuple[np.ndarray, np.ndarray]:
+    fused = np.zeros(valid.shape, dtype=np.float32)
+    candidates = np.zeros(valid.shape, dtype=bool)
+    for scores, weight in legs:
+        finite = np.isfinite(scores)
+        leg_valid = valid if finite.all() else valid & finite
+        if method == "rank":
+            normalized = reciprocal_rank_rows(scores, leg_valid) * weight
+        else:
+            normalized = min_max_rows(scores, leg_valid, weight)
+        if leg_valid is not valid:
+            normalized[~leg_valid] = 0.0
+        fused += normalized
+        candidates |= leg_valid
+    fused[~candidates] = -np.inf
+    top = top_k_per_row(fused, n)
+    top_scores = np.take_along_axis(fused, top, axis=1)
+    found = np.isfinite(top_scores)
+    return top, np.where(found, recommend.normalize_member_scores(top_scores, found), -np.inf)
+
+
+def scoring_state(arrays: Dict[str, np.ndarray], params: Dict, shm: Optional[SharedMemory] = None) -> Dict:
+    items = None
+    if "item_codes" in arrays:
+        items = ItemFactors.from_codes(
+            arrays["item_codes"], arrays.get("item_scales"), arrays["item_offsets"], arrays.get("item_rows"), params["clip"]
+        )
+    content = None
+    if "content_data" in arrays:
+        content = sp.csr_matrix(
+            (arrays["content_data"], arrays["content_indices"], arrays["content_indptr"]), shape=params["content_shape"]
+        )
+    return {"shm": shm, "arrays": arrays, "params": params, "items": items, "content": content}
+
+
+def init_worker(shm_name: str, layout: Dict, params: Dict):
+    global batch_state
+    shm = SharedMemory(name=shm_name)
+    batch_state = scoring_state(attach_arrays(shm, layout), params, shm)
+
+
+def content_block(state: Dict, start: int, end: int) -> np.ndarray:
+    arrays, content = state["arrays"], state["content"]
+    indptr = arrays["library_indptr"][start:end + 1]
+    lo, hi = indptr[0], indptr[-1]
+    library = sp.csr_matrix(
+        (arrays["library_weights"][lo:hi], arrays["library_rows"][lo:hi], indptr - lo),
+        shape=(end - start, content.shape[0])
+    )
+    profiles = (library @ content).toarray()
+    norms = np.linalg.norm(profiles, axis=1, keepdims=True)
+    profiles = np.divide(profiles, norms, out=np.zeros_like(profiles), where=norms > 0)
+    scores = np.asarray(content @ profiles.T).T
+    rows = arrays["content_rows"]
+    block = np.zeros((end - start, len(rows)), dtype=np.float32)
+    known = rows >= 0
+    block[:, known] = scores[:, rows[known]]
+    return block
+
+
+def score_block(start: int, end: int) -> Tuple[int, np.ndarray, np.ndarray]:
+    return score_block_with_state(batch_state, start, end)
+
+
+def score_block_with_state(state: Dict, start: int, end: int) -> Tuple[int, np.ndarray, np.ndarray]:
+    arrays, params = state["arrays"], state["params"]
+    valid = np.ones((end - start, params["n_games"]), dtype=bool)
+    indptr = arrays["excluded_indptr"][start:end + 1]
+    valid[np.repeat(np.arange(end - start), np.diff(indptr)), arrays["excluded_positions"][indptr[0]:indptr[-1]]] = False
+    legs = []
+    if state["items"] is not None:
+        collab = state["items"].scores(arrays["user_vectors"][start:end], arrays["user_offsets"][start:end])
+        legs.append((np.asarray(collab, dtype=np.float32), params["collab_weight"]))
+    if state["content"] is not None:
+        legs.append((content_block(state, start, end), params["content_weight"]))
+    top, scores = fuse_rows(legs, valid, params["n"], params["method"])
+    return start, top.astype(np.int32), scores.astype(np.float32)
+
+
+def ragged(rows: List[np.ndarray], dtype) -> Tuple[np.ndarray, np.ndarray]:
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(row) for row in rows])
+    values = np.concatenate(rows).astype(dtype) if rows else np.zeros(0, dtype=dtype)
+    return indptr, values
+
+
+def batch_inputs(model, content, filtered_games, users: List[str], libraries, excluded: Dict[str, set]) -> Tuple[Dict, Dict]:
+    base = filtered_games.base
+    position = np.full(len(base), -1, dtype=np.int64)
+    position[filtered_games.codes] = np.arange(len(filtered_games))
+    excluded_rows = [position[base.lookup(excluded[uid])] for uid in users]
+    arrays = {}
+    arrays["excluded_indptr"], arrays["excluded_positions"] = ragged([rows[rows >= 0] for rows in excluded_rows], np.int64)
+    params = {
+        "n_games": len(filtered_games),
+        "collab_weight": recommend.COLLAB_WEIGHT,
+        "content_weight": recommend.CONTENT_WEIGHT,
+        "method": recommend.FUSION_METHOD,
+        "clip": None
+    }
+    if model is not None:
+        items = recommend.catalog_item_factors(model, filtered_games)
+        user_inner = model.user_index(users)
+        vectors, offsets = model.user_terms(user_inner)
+        for row in np.flatnonzero(user_inner < 0):
+            interactions = [(users[row], game_id, playtime) for game_id, playtime in libraries[users[row]]]
+            vectors[row], offsets[row] = model.fold_in(interactions)
+        arrays.update(item_codes=items.codes, item_offsets=items.offsets, user_vectors=vectors, user_offsets=offsets)
+        if items.scales is not None:
+            arrays["item_scales"] = items.scales
+        if items.rows is not None:
+            arrays["item_rows"] = items.rows
+        params["clip"] = items.clip
+    if content is not None:
+        library_rows, library_weights = [], []
+        for uid in users:
+            rows = content.rows([game_id for game_id, _ in libraries[uid]])
+            known = rows >= 0
+            library_rows.append(rows[known])
+            library_weights.append(playtime_weights([playtime for _, playtime in libraries[uid]])[known])
+        arrays["library_indptr"], arrays["library_rows"] = ragged(library_rows, np.int32)
+        _, arrays["library_weights"] = ragged(library_weights, np.float32)
+        arrays.update(
+            content_data=content.matrix.data,
+            content_indices=content.matrix.indices,
+            content_indptr=content.matrix.indptr,
+            content_rows=filtered_games.codes if filtered_games.base is content.catalog else content.rows(filtered_games.game_ids)
+        )
+        params["content_shape"] = content.matrix.shape
+    return arrays, params
+
+
+async def stream_batch_recommendations(
+    steamids: Iterable,
+    n: int = 10,
+    tags: Optional[List[str]] = None,
+    genres: Optional[List[str]] = None,
+    categories: Optional[List[str]] = None,
+    excluded: Optional[Dict[str, Iterable[str]]] = None,
+    workers: int = BATCH_WORKERS,
+    block_size: int = BATCH_BLOCK_SIZE,
+    libraries: Optional[Dict[str, List[Tuple[str, float]]]] = None
+) -> AsyncIterator[Tuple[str, List[Tuple[str, float]]]]:
+    users = [str(steamid) for steamid in steamids]
+    filtered_games = await recommend.get_filtered_game_features(tags, genres, categories)
+    if not filtered_games:
+        for uid in users:
+            yield uid, []
+        return
+    filtered_games = as_catalog(filtered_games)
+    all_games, model, vectorizer = await asyncio.gather(
+        recommend.get_filtered_game_features(),
+        recommend.load_model(),
+        recommend.load_tfidf()
+    )
+    if libraries is None:
+        libraries = await recommend.data_source.get_user_libraries(users)
+    content = await recommend.get_content_catalog(vectorizer) if vectorizer is not None else None
+    libraries = {uid: list(libraries.get(uid) or []) for uid in users}
+    excluded_games = {
+        uid: {game_id for game_id, _ in libraries[uid]} | set((excluded or {}).get(uid, ())) for uid in users
+    }
+    scored = []
+    for uid in users:
+        if (model is None and content is None) or not any(game_id in all_games for game_id, _ in libraries[uid]):
+            yield uid, await recommend.fallback_recommendations(n, excluded_games[uid], tags, genres, categories)
+        else:
+            scored.append(uid)
+    if not scored:
+        return
+    arrays, params = await asyncio.to_thread(batch_inputs, model, content, filtered_games, scored, libraries, excluded_games)
+    params["n"] = min(n, len(filtered_games))
+    blocks = [(start, min(start + block_size, len(scored))) for start in range(0, len(scored), block_size)]
+    game_ids = filtered_games.game_ids
+    if workers <= 1:
+        state = scoring_state(arrays, params)
+        results = (asyncio.to_thread(score_block_with_state, state, start, end) for start, end in blocks)
+        shm, pool = None, None
+    else:
+        shm, layout = share_arrays(arrays)
+        pool = ProcessPoolExecutor(max_workers=min(workers, len(blocks)), initializer=init_worker, initargs=(shm.name, layout, params))
+        loop = asyncio.get_running_loop()
+        results = asyncio.as_completed([loop.run_in_executor(pool, score_block, start, end) for start, end in blocks])
+    try:
+        for result in results:
+            start, top, scores = await result
+            for row in range(len(top)):
+                found = np.isfinite(scores[row])
+                yield scored[start + row], [
+                    (game_ids[idx], float(score)) for idx, score in zip(top[row][found].tolist(), scores[row][found].tolist())
+                ]
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+
+
+async def batch_recommendations(
+    steamids: Iterable,
+    sink: Callable[[str, List[Tuple[str, float]]], object],
+    n: int = 10,
+    tags: Optional[List[str]] = None,
+    genres: Optional[List[str]] = None,
+    categories: Optional[List[str]] = None,
+    excluded: Optional[Dict[str, Iterable[str]]] = None,
+    workers: int = BATCH_WORKERS,
+    block_size: int = BATCH_BLOCK_SIZE
+) -> int:
+    count = 0
+    async for steamid, recommendations in stream_batch_recommendations(
+        steamids, n, tags, genres, categories, excluded, workers, block_size
+    ):
+        result = sink(steamid, recommendations)
+        if inspect.isawaitable(result):
+            await result
+        count += 1
+    return count
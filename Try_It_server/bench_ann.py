@@ -0,0 +1,123 @@
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+import numpy as np
+import recommend
+from bench_recommend import git_commit, percentiles, train
+from batch import top_k_per_row
+from synthetic import InMemoryDataSource, login_for
+
+
+def leg_recall(index, exact: np.ndarray, queries, n_candidates: int, k: int) -> float:
+    top = top_k_per_row(exact, k)
+    hits = [
+        len(np.intersect1d(index.search(query, n_candidates), row)) / k
+        for query, row in zip(queries, top)
+    ]
+    return round(float(np.mean(hits)), 4)
+
+
+async def measure_legs(users, candidate_counts, k):
+    model = await recommend.load_model()
+    content = await recommend.get_content_catalog(await recommend.load_tfidf())
+    index = await recommend.get_ann_index(model, content)
+    catalog = content.catalog
+    vectors, offsets = model.user_terms(model.user_index(users))
+    collab = recommend.catalog_item_factors(model, catalog).scores(vectors, offsets)
+    collab_queries = np.hstack((vectors, np.ones((len(users), 1)), np.zeros((len(users), 1)))).astype(np.float32)
+    libraries = await recommend.data_source.get_user_libraries(users)
+    profiles = [content.profile(libraries[uid]) for uid in users]
+    content_scores = content.group_scores(profiles, catalog)
+    norms = np.linalg.norm(np.vstack([profile.toarray() for profile in profiles]), axis=1, keepdims=True)
+    content_queries = np.vstack([profile.toarray() for profile in profiles]) / np.maximum(norms, 1e-12)
+    return {
+        str(n): {
+            "collaborative_recall": leg_recall(index.collab, collab, collab_queries, n, k),
+            "content_recall": leg_recall(index.content, content_scores, content_queries, n, k)
+        }
+        for n in candidate_counts
+    }
+
+
+async def measure_end_to_end(users, logins, candidate_counts, n):
+    report, expected = {}, {}
+    for candidates in [0] + candidate_counts:
+        recommend.ANN_CANDIDATES = candidates
+        samples, overlaps = [], []
+        for uid in users:
+            started = time.perf_counter()
+            result = await recommend.compute_hybrid_recommendations(logins[uid], uid, n)
+            samples.append((time.perf_counter() - started) * 1000)
+            games = {game_id for game_id, _ in result}
+            if candidates == 0:
+                expected[uid] = games
+            else:
+                overlaps.append(len(games & expected[uid]) / max(len(expected[uid]), 1))
+        name = "brute_force" if candidates == 0 else f"ann_{candidates}"
+        report[name] = {"latency_ms": percentiles(samples)}
+        if overlaps:
+            report[name]["recall_at_n"] = round(float(np.mean(overlaps)), 4)
+    return report
+
+
+async def load_users(args):
+    if args.db:
+        interactions = await recommend.data_source.get_user_game_interactions()
+        played = sorted({uid for uid, _, _ in interactions})
+        rng = np.random.default_rng(args.seed)
+        users = [played[idx] for idx in rng.choice(len(played), min(args.requests, len(played)), replace=False)]
+        return users, {uid: str(uid) for uid in users}, {"interactions": len(interactions), "users": len(played)}
+    source = InMemoryDataSource.generate(args.games, args.users, seed=args.seed)
+    recommend.set_data_source(source)
+    users = source.sample_users(args.requests, seed=args.seed)
+    return users, {uid: login_for(uid) for uid in users}, source.stats()
+
+
+async def run_benchmark(args):
+    users, logins, data = await load_users(args)
+    recommend.ANN_MIN_GAMES = 0
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        recommend.MODEL_PATH = os.path.join(tmp_dir, "model.pkl")
+        recommend.TFIDF_PATH = os.path.join(tmp_dir, "tfidf.pkl")
+        recommend.set_cached_model(None)
+        recommend.set_cached_tfidf(None)
+        training = await train()
+        recommend.ANN_CANDIDATES = max(args.candidates)
+        started = time.perf_counter()
+        await recommend.prepare_ann_index()
+        training["ann_index_s"] = round(time.perf_counter() - started, 2)
+        legs = await measure_legs(users, args.candidates, args.k)
+        for uid in users:
+            await recommend.compute_hybrid_recommendations(logins[uid], uid, args.n)
+        end_to_end = await measure_end_to_end(users, logins, args.candidates, args.n)
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {"db": args.db, "games": args.games, "users": args.users, "requests": len(users), "k": args.k, "n": args.n, "seed": args.seed},
+        "data": data,
+        "training": training,
+        "leg_recall_at_k": legs,
+        "hybrid": end_to_end
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Recall and latency of ANN candidate retrieval against brute-force scoring")
+    parser.add_argument("--db", action="store_true", help="use libraries from Postgres instead of synthetic data")
+    parser.add_argument("--games", type=int, default=100000)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--candidates", type=int, nargs="+", default=[1000, 2000, 5000])
+    parser.add_argument("--k", type=int, default=100)
+    parser.add_argument("--n", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the report as JSON")
+    args = parser.parse_args()
+    report = asyncio.run(run_benchmark(args))
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,87 @@
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+import numpy as np
+import recommend
+from batch import batch_recommendations
+from bench_recommend import git_commit, train
+from synthetic import InMemoryDataSource, login_for
+
+
+async def per_user_baseline(users, n):
+    results = {}
+    started = time.perf_counter()
+    for uid in users:
+        results[uid] = await recommend.compute_hybrid_recommendations(login_for(uid), uid, n)
+    return results, time.perf_counter() - started
+
+
+async def run_batch(users, n, workers, block_size):
+    results = {}
+    started = time.perf_counter()
+    await batch_recommendations(users, results.__setitem__, n, workers=workers, block_size=block_size)
+    return results, time.perf_counter() - started
+
+
+def agreement(batch_results, baseline_results, n):
+    overlaps = [
+        len({game_id for game_id, _ in batch_results[uid]} & {game_id for game_id, _ in expected}) / n
+        for uid, expected in baseline_results.items()
+    ]
+    return round(float(np.mean(overlaps)), 4)
+
+
+async def run_benchmark(args):
+    source = InMemoryDataSource.generate(args.games, args.users, seed=args.seed)
+    users = source.sample_users(args.batch_users, seed=args.seed, min_played=1)
+    recommend.set_data_source(source)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        recommend.MODEL_PATH = os.path.join(tmp_dir, "model.pkl")
+        recommend.TFIDF_PATH = os.path.join(tmp_dir, "tfidf.pkl")
+        recommend.set_cached_model(None)
+        recommend.set_cached_tfidf(None)
+        training = await train()
+        baseline, baseline_seconds = await per_user_baseline(users[:args.baseline_users], args.n)
+        batches = {}
+        for workers in args.workers:
+            results, seconds = await run_batch(users, args.n, workers, args.block_size)
+            batches[f"workers_{workers}"] = {
+                "users": len(results),
+                "seconds": round(seconds, 2),
+                "users_per_second": round(len(results) / seconds, 1),
+                "agreement_at_n": agreement(results, baseline, args.n)
+            }
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {"games": args.games, "users": args.users, "n": args.n, "block_size": args.block_size, "seed": args.seed},
+        "data": source.stats(),
+        "training": training,
+        "per_user": {
+            "users": len(baseline),
+            "users_per_second": round(len(baseline) / baseline_seconds, 1)
+        },
+        "batch": batches
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure batch scoring throughput against per-user hybrid requests")
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--batch-users", type=int, default=10000)
+    parser.add_argument("--baseline-users", type=int, default=300)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--block-size", type=int, default=256)
+    parser.add_argument("--n", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the report as JSON")
+    args = parser.parse_args()
+    report = asyncio.run(run_benchmark(args))
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
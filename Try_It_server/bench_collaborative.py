@@ -0,0 +1,76 @@
+import argparse
+import asyncio
+import json
+import time
+import recommend
+from typing import Dict, List, Set
+from evaluation import ranking_metrics, split_holdout
+
+
+def evaluate_engine(name: str, train, held_out, game_ids: List[str], k: int) -> Dict:
+    engine = recommend.COLLAB_ENGINES[name]
+    started = time.perf_counter()
+    model = engine.fit(train, game_ids)
+    train_seconds = time.perf_counter() - started
+    owned: Dict[str, Set[str]] = {}
+    for uid, game_id, _ in train:
+        if uid in held_out:
+            owned.setdefault(uid, set()).add(game_id)
+    item_inner = model.item_index(game_ids)
+    users = list(held_out.keys())
+    totals = {"precision": 0.0, "recall": 0.0, "ndcg": 0.0}
+    recommended_items = set()
+    started = time.perf_counter()
+    for start in range(0, len(users), 256):
+        block = users[start:start + 256]
+        scores = model.score(model.user_index(block), item_inner)
+        for row, uid in enumerate(block):
+            top = [game_id for game_id, _ in recommend.top_n_excluding(game_ids, scores[row], owned.get(uid, set()), k)]
+            recommended_items.update(top)
+            for metric, value in ranking_metrics(top, held_out[uid], k).items():
+                totals[metric] += value
+    score_seconds = time.perf_counter() - started
+    report = {metric: round(value / len(users), 4) for metric, value in totals.items()}
+    report.update({
+        "train_seconds": round(train_seconds, 2),
+        "score_ms_per_user": round(score_seconds / len(users) * 1000, 3),
+        "catalog_coverage": round(len(recommended_items) / len(game_ids), 4)
+    })
+    return report
+
+
+async def load_data(args):
+    if args.db:
+        from Try_It_bd import get_game_features, get_user_game_interactions
+        return await get_user_game_interactions(), list((await get_game_features()).keys())
+    from synthetic import InMemoryDataSource
+    source = InMemoryDataSource.generate(args.games, args.users, seed=args.seed)
+    return await source.get_user_game_interactions(), source.game_ids
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare collaborative engines on a per-user holdout")
+    parser.add_argument("--engines", nargs="+", default=list(recommend.COLLAB_ENGINES.keys()))
+    parser.add_argument("--db", action="store_true", help="use interactions from Postgres instead of synthetic data")
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--eval-users", type=int, default=1000)
+    parser.add_argument("--holdout", type=float, default=0.2)
+    parser.add_argument("--min-played", type=int, default=5)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the report as JSON")
+    args = parser.parse_args()
+    interactions, game_ids = asyncio.run(load_data(args))
+    train, held_out = split_holdout(interactions, args.eval_users, args.holdout, args.min_played, args.seed)
+    report = {
+        "interactions": len(interactions),
+        "train_interactions": len(train),
+        "eval_users": len(held_out),
+        "k": args.k,
+        "engines": {name: evaluate_engine(name, train, held_out, game_ids, args.k) for name in args.engines}
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,78 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+
+
+async def run_benchmark(args):
+    os.environ["STEAM_API_URL"] = f"http://127.0.0.1:{args.port}"
+    os.environ["STEAM_STORE_URL"] = f"http://127.0.0.1:{args.port}"
+    os.environ["STEAM_REQUEST_DELAY_MIN"] = str(args.request_delay)
+    os.environ["STEAM_REQUEST_DELAY_MAX"] = str(args.request_delay)
+    os.environ["TRYIT_INGEST_PAUSE"] = str(args.ingest_pause)
+    from steam_stub import SteamStubConfig, start_stub
+    import psycopg
+    from Try_It_bd import db_config, insert_games, update_all_data, update_games
+    from test_steamAPI import get_games
+
+    config = SteamStubConfig(args.latency, args.jitter, args.error_rate, args.rate_limit, synthetic=True, seed=0)
+    stub, runner = await start_stub(config, port=args.port, fixtures_dir=args.fixtures)
+    try:
+        with open(os.path.join(args.fixtures, "player_summaries.json"), "r", encoding="utf-8") as f:
+            summaries = json.load(f)
+        steamids = list(summaries)[:args.users]
+        conn = await psycopg.AsyncConnection.connect(**db_config)
+        async with conn:
+            async with conn.cursor() as cur:
+                for steamid in steamids:
+                    await cur.execute("""
+                                      INSERT INTO try_it."Steam_User" ("SteamID64", nickname) VALUES (%s, %s)
+                                      ON CONFLICT ("SteamID64") DO NOTHING
+                                      """, (steamid, summaries[steamid]["personaname"], ))
+                await conn.commit()
+        report = {}
+
+        games_total = 0
+        started = time.perf_counter()
+        for steamid in steamids:
+            games = await get_games(steamid)
+            games_total += len(games["response"].get("games", []))
+            await insert_games(games, steamid)
+        elapsed = time.perf_counter() - started
+        report["insert_games"] = {"games": games_total, "seconds": elapsed, "games_per_sec": games_total / elapsed}
+
+        started = time.perf_counter()
+        await update_games()
+        elapsed = time.perf_counter() - started
+        with open(os.path.join(args.fixtures, "app_list.json"), "r", encoding="utf-8") as f:
+            catalog_size = len(json.load(f)["applist"]["apps"])
+        report["update_games"] = {"games": catalog_size, "seconds": elapsed, "games_per_sec": catalog_size / elapsed}
+
+        started = time.perf_counter()
+        await update_all_data()
+        elapsed = time.perf_counter() - started
+        report["update_all_data"] = {"users": len(steamids), "seconds": elapsed, "users_per_sec": len(steamids) / elapsed}
+
+        report["stub"] = stub.stats
+        print(json.dumps(report, indent=2))
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Ingestion throughput against the local Steam stand-in")
+    parser.add_argument("--fixtures", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "steam"))
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=0.0)
+    parser.add_argument("--request-delay", type=float, default=0.0, help="client-side pause before each Steam call")
+    parser.add_argument("--ingest-pause", type=float, default=0.0, help="pause between ingested games/users")
+    parser.add_argument("--output", help="write the report as JSON")
+    asyncio.run(run_benchmark(parser.parse_args()))
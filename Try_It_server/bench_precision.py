@@ -0,0 +1,104 @@
+import argparse
+import asyncio
+import copy
+import json
+import time
+import numpy as np
+import recommend
+from factors import FACTOR_PRECISIONS, ItemFactors
+from batch import top_k_per_row
+from synthetic import InMemoryDataSource
+from bench_recommend import git_commit, percentiles
+
+
+def train_engines(name: str, interactions, game_ids):
+    if name == "svd":
+        model = recommend.SVDEngine.fit_surprise(interactions, game_ids)
+        return recommend.SVDEngine.from_surprise(model, np.float64), recommend.SVDEngine.from_surprise(model)
+    model = recommend.COLLAB_ENGINES[name].fit(interactions, game_ids)
+    baseline = copy.copy(model)
+    for array_name in model.array_names:
+        setattr(baseline, array_name, np.asarray(getattr(model, array_name), dtype=np.float64))
+    return baseline, model
+
+
+def block_top_k(model, items: ItemFactors, users, k: int, block_size: int):
+    for start in range(0, len(users), block_size):
+        scores = items.scores(*model.user_terms(model.user_index(users[start:start + block_size])))
+        yield scores, top_k_per_row(scores, k)
+
+
+def measure_precision(baseline, model, precision: str, game_ids, users, args):
+    engine = baseline if precision == "float64" else model
+    items = ItemFactors.from_model(engine, engine.item_index(game_ids), precision)
+    reference = ItemFactors.from_model(baseline, baseline.item_index(game_ids), "float64")
+    started = time.perf_counter()
+    for _ in block_top_k(engine, items, users, args.k, args.block_size):
+        pass
+    batch_seconds = time.perf_counter() - started
+    samples = []
+    for uid in users[:args.latency_requests]:
+        started = time.perf_counter()
+        scores = items.scores(*engine.user_terms(engine.user_index([uid])))[0]
+        np.argpartition(-scores, args.k - 1)[:args.k]
+        samples.append((time.perf_counter() - started) * 1000)
+    overlap, max_error = [], 0.0
+    pairs = zip(
+        block_top_k(engine, items, users, args.k, args.block_size),
+        block_top_k(baseline, reference, users, args.k, args.block_size)
+    )
+    for (scores, top), (expected_scores, expected_top) in pairs:
+        max_error = max(max_error, float(np.abs(scores - expected_scores).max()))
+        overlap.extend(len(np.intersect1d(row, expected_row)) / args.k for row, expected_row in zip(top, expected_top))
+    return {
+        "item_bytes": items.nbytes,
+        "bytes_vs_float64": round(reference.nbytes / items.nbytes, 2),
+        "batch_users_per_second": round(len(users) / batch_seconds, 1),
+        "single_user_ms": percentiles(samples),
+        "overlap_at_k": round(float(np.mean(overlap)), 4),
+        "min_overlap_at_k": round(float(np.min(overlap)), 4),
+        "max_abs_score_error": round(max_error, 6)
+    }
+
+
+def run_benchmark(args):
+    source = InMemoryDataSource.generate(args.games, args.users, seed=args.seed)
+    interactions = asyncio.run(source.get_user_game_interactions())
+    users = source.sample_users(args.eval_users, seed=args.seed)
+    report = {}
+    for name in args.engines:
+        started = time.perf_counter()
+        baseline, model = train_engines(name, interactions, source.game_ids)
+        report[name] = {"train_s": round(time.perf_counter() - started, 2)}
+        for precision in args.precisions:
+            report[name][precision] = measure_precision(baseline, model, precision, source.game_ids, users, args)
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "games": args.games, "users": args.users, "eval_users": len(users),
+            "k": args.k, "block_size": args.block_size, "seed": args.seed
+        },
+        "data": source.stats(),
+        "engines": report
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare reduced-precision factor storage against the float64 baseline")
+    parser.add_argument("--engines", nargs="+", default=list(recommend.COLLAB_ENGINES.keys()))
+    parser.add_argument("--precisions", nargs="+", default=list(FACTOR_PRECISIONS), choices=FACTOR_PRECISIONS)
+    parser.add_argument("--games", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--eval-users", type=int, default=1000)
+    parser.add_argument("--latency-requests", type=int, default=200)
+    parser.add_argument("--block-size", type=int, default=128)
+    parser.add_argument("--k", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the report as JSON")
+    args = parser.parse_args()
+    report = run_benchmark(args)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,164 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import recommend
+from synthetic import InMemoryDataSource, login_for
+
+
+def percentiles(samples_ms):
+    values = np.asarray(samples_ms)
+    return {
+        "count": len(values),
+        "mean": round(float(values.mean()), 2),
+        "p50": round(float(np.percentile(values, 50)), 2),
+        "p95": round(float(np.percentile(values, 95)), 2),
+        "p99": round(float(np.percentile(values, 99)), 2),
+        "max": round(float(values.max()), 2)
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def most_common_genre(game_features):
+    counts = {}
+    for features in game_features.values():
+        for feature in features:
+            if feature.startswith("Genre "):
+                counts[feature] = counts.get(feature, 0) + 1
+    return max(counts, key=counts.get)
+
+
+async def timed(coro):
+    started = time.perf_counter()
+    result = await coro
+    return (time.perf_counter() - started) * 1000, result
+
+
+async def train():
+    collab_ms, _ = await timed(recommend.collaborative_recommendations(force_update=True))
+    content_ms, _ = await timed(recommend.content_recommendations(force_update=True))
+    return {"collaborative_s": round(collab_ms / 1000, 2), "tfidf_s": round(content_ms / 1000, 2)}
+
+
+def variants(source, users, genre):
+    friends = users[1:] + users[:1]
+    return {
+        "collaborative": lambda uid, _: recommend.collaborative_recommendations(uid, 100),
+        "content": lambda uid, _: recommend.content_recommendations(
+            user_games=[game_id for game_id, _ in source.library(uid)], n=100
+        ),
+        "hybrid": lambda uid, _: recommend.compute_hybrid_recommendations(login_for(uid), uid, 100),
+        "hybrid_filtered": lambda uid, _: recommend.compute_hybrid_recommendations(
+            login_for(uid), uid, 100, genres=[genre]
+        ),
+        "hybrid_friend": lambda uid, idx: recommend.compute_hybrid_recommendations(
+            login_for(uid), uid, 100, friend_id=friends[idx]
+        )
+    }
+
+
+async def measure_latency(source, users, genre):
+    report = {}
+    for name, request in variants(source, users, genre).items():
+        samples, empty = [], 0
+        for idx, uid in enumerate(users):
+            elapsed_ms, result = await timed(request(uid, idx))
+            samples.append(elapsed_ms)
+            empty += not result
+        report[name] = percentiles(samples)
+        report[name]["empty"] = empty
+    return report
+
+
+async def measure_memory(source, users, genre):
+    report = {}
+    tracemalloc.start()
+    try:
+        await train()
+        report["training"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+        for name, request in variants(source, users[:1], genre).items():
+            tracemalloc.reset_peak()
+            await request(users[0], 0)
+            report[name] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+    finally:
+        tracemalloc.stop()
+    return report
+
+
+async def run_benchmark(args):
+    started = time.perf_counter()
+    source = InMemoryDataSource.generate(args.games, args.users, seed=args.seed)
+    generation_s = time.perf_counter() - started
+    users = source.sample_users(args.requests, seed=args.seed)
+    source.seed_user_lists(users, seed=args.seed)
+    genre = most_common_genre(source.game_features)
+    recommend.set_data_source(source)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        recommend.MODEL_PATH = os.path.join(tmp_dir, "model.pkl")
+        recommend.TFIDF_PATH = os.path.join(tmp_dir, "tfidf.pkl")
+        recommend.set_cached_model(None)
+        recommend.set_cached_tfidf(None)
+        training = await train()
+        latency = await measure_latency(source, users, genre)
+        memory = await measure_memory(source, users, genre) if args.memory else None
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {"games": args.games, "users": args.users, "requests": len(users), "seed": args.seed, "filter_genre": genre},
+        "data": dict(source.stats(), generation_s=round(generation_s, 2)),
+        "training": training,
+        "latency_ms": latency,
+        "peak_memory_mb": memory
+    }
+
+
+def compare(report, baseline):
+    changes = {}
+    for name, stats in report["latency_ms"].items():
+        before = baseline.get("latency_ms", {}).get(name)
+        if before:
+            changes[name] = {
+                key: round(stats[key] / before[key], 2) for key in ("p50", "p95", "p99") if before.get(key)
+            }
+    for key, value in report["training"].items():
+        before = baseline.get("training", {}).get(key)
+        if before:
+            changes[key] = round(value / before, 2)
+    return changes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark recommend.py against a synthetic catalog and user libraries")
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=50, help="sampled users per request variant")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="skip the tracemalloc pass")
+    parser.add_argument("--output-dir", default="bench_results", help="directory for the JSON report")
+    parser.add_argument("--compare", help="earlier JSON report to compute ratios against")
+    args = parser.parse_args()
+    logging.getLogger(recommend.__name__).setLevel(logging.WARNING)
+    report = asyncio.run(run_benchmark(args))
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            report["compared_to"] = {"file": args.compare, "ratios": compare(report, json.load(f))}
+    print(json.dumps(report, indent=2))
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, f"recommend-{args.games}x{args.users}-{report['commit'] or 'nogit'}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved {path}")
@@ -0,0 +1,84 @@
+import argparse
+import gzip
+import json
+import random
+import time
+import orjson
+from fastapi.encoders import jsonable_encoder
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def recommendations_payload(n: int = 100):
+    rng = random.Random(0)
+    return {
+        "recommendations": [
+            {
+                "GameID": str(rng.randint(10, 3000000)),
+                "game_title": f"Game title number {i} - Definitive Edition",
+                "image_url": f"https://shared.akamai.steamstatic.com/store_item_assets/steam/apps/{rng.randint(10, 3000000)}/header.jpg",
+                "rating": rng.randint(20, 99),
+                "score": rng.random()
+            }
+            for i in range(n)
+        ],
+        "next_cursor": None
+    }
+
+
+def genres_tags_features_payload(n_tags: int = 450, n_genres: int = 30, n_features: int = 60):
+    return [{
+        "tags": sorted(f"Tag {i}" for i in range(n_tags)),
+        "genres": sorted(f"Genre {i}" for i in range(n_genres)),
+        "features": sorted(f"Feature {i}" for i in range(n_features))
+    }]
+
+
+def time_encoder(encode, payload, repeat: int):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        body = encode(payload)
+    return (time.perf_counter() - started) / repeat * 1e6, body
+
+
+def stdlib_encode(payload):
+    return json.dumps(jsonable_encoder(payload), ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def orjson_encode(payload):
+    return orjson.dumps(payload, default=jsonable_encoder)
+
+
+def run_benchmark(repeat: int):
+    report = {}
+    payloads = {
+        "recommend_100": recommendations_payload(),
+        "genres_tags_features": genres_tags_features_payload()
+    }
+    for name, payload in payloads.items():
+        stdlib_us, stdlib_body = time_encoder(stdlib_encode, payload, repeat)
+        orjson_us, orjson_body = time_encoder(orjson_encode, payload, repeat)
+        report[name] = {
+            "encode_us": {"stdlib": round(stdlib_us, 1), "orjson": round(orjson_us, 1)},
+            "bytes": {
+                "stdlib": len(stdlib_body),
+                "orjson": len(orjson_body),
+                "gzip": len(gzip.compress(orjson_body, compresslevel=9)),
+                "brotli": len(brotli.compress(orjson_body, quality=4)) if brotli else None
+            }
+        }
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Encode time and wire size for representative response payloads")
+    parser.add_argument("--repeat", type=int, default=1000)
+    parser.add_argument("--output", help="write the report as JSON")
+    args = parser.parse_args()
+    report = run_benchmark(args.repeat)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
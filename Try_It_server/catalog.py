@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+from collections.abc import Mapping
+from itertools import chain
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+RATING_PREFIX = "rating:"
+
+
+def parse_rating(term: str) -> float:
+    try:
+        return float(term[len(RATING_PREFIX):])
+    except ValueError:
+        return np.nan
+
+
+class Catalog(Mapping):
+    __slots__ = ("game_ids", "index", "vocabulary", "lower_vocabulary", "offsets", "features", "ratings", "codes")
+
+    def __init__(self, game_ids: List[str], vocabulary: List[str], offsets: np.ndarray, features: np.ndarray):
+        self.game_ids = game_ids
+        self.index = {game_id: row for row, game_id in enumerate(game_ids)}
+        self.vocabulary = vocabulary
+        self.lower_vocabulary = [term.lower() for term in vocabulary]
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.features = np.asarray(features, dtype=np.int32)
+        self.codes = np.arange(len(game_ids), dtype=np.int32)
+        rating_terms = np.array([term.startswith(RATING_PREFIX) for term in vocabulary], dtype=bool)
+        rating_values = np.array([parse_rating(term) if rating else np.nan for term, rating in zip(vocabulary, rating_terms)], dtype=np.float32)
+        rating_mask = rating_terms[self.features]
+        self.ratings = np.full(len(game_ids), np.nan, dtype=np.float32)
+        self.ratings[np.repeat(self.codes, np.diff(self.offsets))[rating_mask]] = rating_values[self.features[rating_mask]]
+
+    @classmethod
+    def from_columns(cls, game_ids: List[str], row_game_ids: Iterable[str], row_terms: Iterable[str]):
+        rows = pd.Index(game_ids).get_indexer(pd.Index(list(row_game_ids), dtype=object))
+        terms, vocabulary = pd.factorize(pd.Series(list(row_terms), dtype=object))
+        known = rows >= 0
+        rows, terms = rows[known], terms[known]
+        order = np.argsort(rows, kind="stable")
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=len(game_ids)))))
+        return cls(list(game_ids), list(vocabulary), offsets, terms[order])
+
+    @classmethod
+    def from_rows(cls, ratings: List[Tuple[str, object]], feature_rows: List[Tuple[str, str]]):
+        game_ids = [game_id for game_id, _ in ratings]
+        return cls.from_columns(
+            game_ids,
+            chain(game_ids, (game_id for game_id, _ in feature_rows)),
+            chain((f"{RATING_PREFIX}{rating}" for _, rating in ratings), (term for _, term in feature_rows))
+        )
+
+    @classmethod
+    def from_features(cls, game_features: Dict[str, List[str]]):
+        return cls.from_columns(
+            list(game_features.keys()),
+            chain.from_iterable([game_id] * len(features) for game_id, features in game_features.items()),
+            chain.from_iterable(game_features.values())
+        )
+
+    @property
+    def base(self) -> "Catalog":
+        return self
+
+    def terms(self, row: int) -> List[str]:
+        return [self.vocabulary[code] for code in self.features[self.offsets[row]:self.offsets[row + 1]]]
+
+    def lower_terms(self, row: int) -> set:
+        return {self.lower_vocabulary[code] for code in self.features[self.offsets[row]:self.offsets[row + 1]]}
+
+    def lookup(self, game_ids: Iterable[str]) -> np.ndarray:
+        return np.array([self.index[gid] for gid in game_ids if gid in self.index], dtype=np.int32)
+
+    def matching_rows(
+        self,
+        tags: Optional[List[str]] = None,
+        genres: Optional[List[str]] = None,
+        categories: Optional[List[str]] = None
+    ) -> np.ndarray:
+        mask = np.ones(len(self.game_ids), dtype=bool)
+        for group in (tags, genres, categories):
+            if not group:
+                continue
+            wanted = {value.lower() for value in group}
+            term_hits = np.array([term in wanted for term in self.lower_vocabulary], dtype=bool)
+            hits = np.concatenate(([0], np.cumsum(term_hits[self.features])))
+            mask &= hits[self.offsets[1:]] > hits[self.offsets[:-1]]
+        return self.codes[mask]
+
+    def filter(
+        self,
+        tags: Optional[List[str]] = None,
+        genres: Optional[List[str]] = None,
+        categories: Optional[List[str]] = None
+    ) -> "CatalogView":
+        return CatalogView(self, self.matching_rows(tags, genres, categories))
+
+    def __getitem__(self, game_id: str) -> List[str]:
+        return self.terms(self.index[game_id])
+
+    def __contains__(self, game_id) -> bool:
+        return game_id in self.index
+
+    def __iter__(self):
+        return iter(self.game_ids)
+
+    def __len__(self) -> int:
+        return len(self.game_ids)
+
+
+class CatalogView(Mapping):
+    __slots__ = ("base", "codes", "members", "game_ids")
+
+    def __init__(self, base: Catalog, codes: np.ndarray):
+        self.base = base
+        self.codes = codes
+        self.members = np.zeros(len(base), dtype=bool)
+        self.members[codes] = True
+        self.game_ids = [base.game_ids[code] for code in codes.tolist()]
+
+    def __getitem__(self, game_id: str) -> List[str]:
+        row = self.base.index[game_id]
+        if not self.members[row]:
+            raise KeyError(game_id)
+        return self.base.terms(row)
+
+    def __contains__(self, game_id) -> bool:
+        row = self.base.index.get(game_id)
+        return row is not None and bool(self.members[row])
+
+    def __iter__(self):
+        return iter(self.game_ids)
+
+    def __len__(self) -> int:
+        return len(self.game_ids)
+
+
+def as_catalog(game_features) -> Catalog:
+    if isinstance(game_features, (Catalog, CatalogView)):
+        return game_features
+    return Catalog.from_features(game_features or {})
@@ -0,0 +1,514 @@
+import argparse
+import asyncio
+import json
+import os
+import pickle
+import time
+import tracemalloc
+import numpy as np
+import psycopg
+import scipy.sparse as sp
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, date, timedelta, timezone
+from typing import Dict, List, Optional, Set, Tuple
+import recommend
+from Try_It_bd import db_connect, get_game_features
+from catalog import Catalog, as_catalog
+from factors import ItemFactors
+from popularity import FallbackRankings
+from bench_recommend import git_commit
+
+
+EVAL_K = 20
+EVAL_BLOCK_SIZE = 256
+EVAL_WORKERS = int(os.environ.get("TRYIT_EVAL_WORKERS", os.cpu_count() or 1))
+EVAL_ENGINES = list(recommend.COLLAB_ENGINES.keys()) + ["content", "hybrid", "popularity"]
+WISHLIST_CUTOFF_QUANTILE = 0.8
+QUALITY_METRICS = ("precision", "recall", "ndcg", "coverage", "novelty", "hidden_rate")
+worker_state = None
+
+
+class Snapshot:
+    def __init__(
+        self,
+        catalog: Catalog,
+        library: List[Tuple[str, str, float]],
+        wishlist: List[Tuple[str, str, Optional[datetime]]],
+        hidden: List[Tuple[str, str, Optional[datetime]]],
+        taken_at: Optional[str] = None
+    ):
+        self.catalog = catalog
+        self.library = library
+        self.wishlist = wishlist
+        self.hidden = hidden
+        self.taken_at = taken_at or time.strftime("%Y-%m-%dT%H:%M:%S")
+
+    def save(self, path: str):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path: str) -> "Snapshot":
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    def stats(self) -> Dict:
+        return {
+            "taken_at": self.taken_at,
+            "games": len(self.catalog),
+            "users": len({uid for uid, _, _ in self.library}),
+            "library_rows": len(self.library),
+            "played_rows": sum(1 for _, _, playtime in self.library if playtime > 0),
+            "wishlist_rows": len(self.wishlist),
+            "hidden_rows": len(self.hidden)
+        }
+
+
+class Split:
+    def __init__(
+        self,
+        train: List[Tuple[str, str, float]],
+        libraries: Dict[str, List[Tuple[str, float]]],
+        excluded: Dict[str, Set[str]],
+        targets: Dict[str, Set[str]],
+        negatives: Dict[str, Set[str]],
+        details: Dict
+    ):
+        self.train = train
+        self.libraries = libraries
+        self.excluded = excluded
+        self.targets = targets
+        self.negatives = negatives
+        self.details = details
+        self.users = list(targets.keys())
+
+
+def as_datetime(value) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+    if isinstance(value, date):
+        return datetime.combine(value, datetime.min.time())
+    return value
+
+
+async def snapshot_tables() -> Optional[Snapshot]:
+    catalog = as_catalog(await get_game_features())
+    try:
+        conn = await db_connect()
+        async with conn:
+            await conn.set_isolation_level(psycopg.IsolationLevel.REPEATABLE_READ)
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                                  SELECT "SteamID64", "GameID", "time_in_game" FROM try_it."library"
+                                  """)
+                library = [
+                    (row["SteamID64"], row["GameID"], row["time_in_game"] or 0) for row in await cur.fetchall()
+                ]
+                lists = {}
+                for table in ("wishlist", "hidden"):
+                    await cur.execute(f"""
+                                      SELECT u."SteamID64", t."GameID", t."date_added"
+                                      FROM try_it."{table}" t
+                                      JOIN try_it."user" u ON u.login = t.login
+                                      """)
+                    lists[table] = [
+                        (row["SteamID64"], row["GameID"], as_datetime(row["date_added"])) for row in await cur.fetchall()
+                    ]
+                return Snapshot(catalog, library, lists["wishlist"], lists["hidden"])
+    except psycopg.Error as err:
+        print("DB error in snapshot_tables:", err)
+        return None
+
+
+def synthetic_snapshot(n_games: int, n_users: int, list_users: int, seed: int = 0, days: int = 365) -> Snapshot:
+    from synthetic import InMemoryDataSource
+    source = InMemoryDataSource.generate(n_games, n_users, seed=seed)
+    rng = np.random.default_rng(seed)
+    moved: Set[Tuple[str, str]] = set()
+    wishlist, hidden = [], []
+    start = datetime(2025, 1, 1)
+    for uid in source.sample_users(list_users, seed=seed, min_played=5):
+        played = [game_id for game_id, minutes in source.library(uid) if minutes > 0]
+        picks = rng.choice(played, max(1, len(played) // 5), replace=False).tolist()
+        moved.update((uid, game_id) for game_id in picks)
+        wishlist.extend((uid, game_id, start + timedelta(days=int(rng.integers(days)))) for game_id in picks)
+        blocked = rng.choice(len(source.game_ids), len(picks), replace=False)
+        hidden.extend((uid, source.game_ids[idx], start + timedelta(days=int(rng.integers(days)))) for idx in blocked)
+    library = [
+        (source.user_ids[owner], source.game_ids[game], int(minutes))
+        for owner, game, minutes in zip(source.owners.tolist(), source.games.tolist(), source.playtime.tolist())
+        if (source.user_ids[owner], source.game_ids[game]) not in moved
+    ]
+    return Snapshot(as_catalog(source.game_features), library, wishlist, hidden)
+
+
+def split_holdout(interactions: List[Tuple[str, str, float]], n_users: int, holdout: float, min_played: int, seed: int):
+    rng = np.random.default_rng(seed)
+    by_user: Dict[str, List[int]] = {}
+    for idx, (uid, _, playtime) in enumerate(interactions):
+        if playtime > 0:
+            by_user.setdefault(uid, []).append(idx)
+    eligible = [uid for uid, rows in by_user.items() if len(rows) >= min_played]
+    chosen = rng.choice(len(eligible), min(n_users, len(eligible)), replace=False)
+    held_rows: Set[int] = set()
+    held_out: Dict[str, Set[str]] = {}
+    for pick in chosen:
+        uid = eligible[pick]
+        rows = by_user[uid]
+        hidden = rng.choice(rows, max(1, int(len(rows) * holdout)), replace=False)
+        held_rows.update(hidden.tolist())
+        held_out[uid] = {interactions[row][1] for row in hidden}
+    train = [row for idx, row in enumerate(interactions) if idx not in held_rows]
+    return train, held_out
+
+
+def user_libraries(library: List[Tuple[str, str, float]], users, dropped: Optional[Dict[str, Set[str]]] = None):
+    libraries: Dict[str, List[Tuple[str, float]]] = {uid: [] for uid in users}
+    dropped = dropped or {}
+    for uid, game_id, playtime in library:
+        if uid in libraries and game_id not in dropped.get(uid, ()):
+            libraries[uid].append((game_id, playtime))
+    return libraries
+
+
+def library_split(snapshot: Snapshot, n_users: int, holdout: float, min_played: int, seed: int) -> Split:
+    played = [row for row in snapshot.library if row[2] > 0]
+    train, held_out = split_holdout(played, n_users, holdout, min_played, seed)
+    libraries = user_libraries(snapshot.library, held_out, held_out)
+    listed: Dict[str, Set[str]] = {}
+    for uid, game_id, _ in snapshot.wishlist + snapshot.hidden:
+        if uid in held_out:
+            listed.setdefault(uid, set()).add(game_id)
+    excluded = {uid: {game_id for game_id, _ in libraries[uid]} | listed.get(uid, set()) for uid in held_out}
+    targets = {uid: games - excluded[uid] for uid, games in held_out.items() if games - excluded[uid]}
+    details = {"split": "library", "holdout": holdout, "min_played": min_played, "train_interactions": len(train)}
+    return Split(train, libraries, excluded, targets, {}, details)
+
+
+def wishlist_split(
+    snapshot: Snapshot,
+    n_users: int,
+    min_played: int,
+    seed: int,
+    cutoff: Optional[datetime] = None
+) -> Split:
+    dates = sorted(added for _, _, added in snapshot.wishlist if added is not None)
+    if not dates:
+        raise ValueError("The snapshot has no dated wishlist entries to split on")
+    cutoff = cutoff or dates[min(int(len(dates) * WISHLIST_CUTOFF_QUANTILE), len(dates) - 1)]
+    train = [row for row in snapshot.library if row[2] > 0]
+    played: Dict[str, int] = {}
+    for uid, _, _ in train:
+        played[uid] = played.get(uid, 0) + 1
+    owned: Dict[str, Set[str]] = {}
+    for uid, game_id, _ in snapshot.library:
+        owned.setdefault(uid, set()).add(game_id)
+    before: Dict[str, Set[str]] = {}
+    after: Dict[str, Dict[str, Set[str]]] = {"wishlist": {}, "hidden": {}}
+    for table, rows in (("wishlist", snapshot.wishlist), ("hidden", snapshot.hidden)):
+        for uid, game_id, added in rows:
+            if added is not None and added >= cutoff:
+                after[table].setdefault(uid, set()).add(game_id)
+            else:
+                before.setdefault(uid, set()).add(game_id)
+    eligible = sorted(
+        uid for uid, games in after["wishlist"].items()
+        if played.get(uid, 0) >= min_played and games - owned.get(uid, set()) - before.get(uid, set())
+    )
+    rng = np.random.default_rng(seed)
+    chosen = [eligible[idx] for idx in rng.choice(len(eligible), min(n_users, len(eligible)), replace=False)]
+    excluded = {uid: owned.get(uid, set()) | before.get(uid, set()) for uid in chosen}
+    targets = {uid: after["wishlist"][uid] - excluded[uid] for uid in chosen}
+    negatives = {uid: after["hidden"].get(uid, set()) - targets[uid] for uid in chosen}
+    details = {
+        "split": "wishlist",
+        "cutoff": cutoff.isoformat(),
+        "min_played": min_played,
+        "train_interactions": len(train)
+    }
+    return Split(train, user_libraries(snapshot.library, chosen), excluded, targets, negatives, details)
+
+
+def ranking_metrics(recommended: List[str], relevant: Set[str], k: int) -> Dict[str, float]:
+    hits = np.array([game_id in relevant for game_id in recommended[:k]], dtype=np.float64)
+    discounts = 1.0 / np.log2(np.arange(2, k + 2))
+    ideal = discounts[:min(len(relevant), k)].sum()
+    return {
+        "precision": hits.sum() / k,
+        "recall": hits.sum() / len(relevant),
+        "ndcg": float((hits * discounts[:len(hits)]).sum() / ideal) if ideal else 0.0
+    }
+
+
+class CollaborativeScorer:
+    def __init__(self, name: str, train: List[Tuple[str, str, float]], catalog: Catalog):
+        self.model = recommend.COLLAB_ENGINES[name].fit(train, catalog.game_ids)
+        if self.model is None:
+            raise ValueError(f"No training interactions for the {name} engine")
+        self.items = ItemFactors.from_model(self.model, self.model.item_index(catalog.game_ids), recommend.FACTOR_PRECISION)
+
+    def score(self, users: List[str], libraries: Dict[str, List[Tuple[str, float]]], valid: np.ndarray) -> np.ndarray:
+        return recommend.group_collaborative_scores(self.model, self.items, users, libraries)
+
+
+class ContentScorer:
+    def __init__(self, catalog: Catalog):
+        vectorizer = recommend.new_tfidf_vectorizer()
+        vectorizer.fit([catalog.terms(row) for row in catalog.codes])
+        self.content = recommend.build_content_catalog(vectorizer, catalog, 0)
+        self.empty = sp.csr_matrix((1, self.content.matrix.shape[1]), dtype=np.float32)
+
+    def score(self, users: List[str], libraries: Dict[str, List[Tuple[str, float]]], valid: np.ndarray) -> np.ndarray:
+        profiles = [self.content.profile(libraries[uid]) for uid in users]
+        profiles = [self.empty if profile is None else profile for profile in profiles]
+        return self.content.group_scores(profiles, self.content.catalog)
+
+
+class HybridScorer:
+    def __init__(self, train: List[Tuple[str, str, float]], catalog: Catalog):
+        self.collab = CollaborativeScorer(recommend.COLLAB_ENGINE, train, catalog)
+        self.content = ContentScorer(catalog)
+        self.normalize = recommend.reciprocal_rank_scores if recommend.FUSION_METHOD == "rank" else recommend.min_max_scores
+
+    def score(self, users: List[str], libraries: Dict[str, List[Tuple[str, float]]], valid: np.ndarray) -> np.ndarray:
+        fused = np.zeros(valid.shape, dtype=np.float32)
+        for scorer, weight in ((self.collab, recommend.COLLAB_WEIGHT), (self.content, recommend.CONTENT_WEIGHT)):
+            scores = scorer.score(users, libraries, valid)
+            for row in range(len(users)):
+                if valid[row].any():
+                    fused[row] += np.where(valid[row], self.normalize(scores[row], valid[row]) * weight, 0.0)
+        return fused
+
+
+class PopularityScorer:
+    def __init__(self, train: List[Tuple[str, str, float]], catalog: Catalog):
+        rankings = FallbackRankings(0, catalog, train)
+        self.scores = np.zeros(len(catalog), dtype=np.float32)
+        self.scores[rankings.rows] = rankings.scores
+
+    def score(self, users: List[str], libraries: Dict[str, List[Tuple[str, float]]], valid: np.ndarray) -> np.ndarray:
+        return np.broadcast_to(self.scores, valid.shape)
+
+
+def build_scorer(name: str, train: List[Tuple[str, str, float]], catalog: Catalog):
+    if name in recommend.COLLAB_ENGINES:
+        return CollaborativeScorer(name, train, catalog)
+    if name == "content":
+        return ContentScorer(catalog)
+    if name == "hybrid":
+        return HybridScorer(train, catalog)
+    if name == "popularity":
+        return PopularityScorer(train, catalog)
+    raise ValueError(f"Unknown engine: {name}")
+
+
+def self_information(train: List[Tuple[str, str, float]], catalog: Catalog) -> np.ndarray:
+    rows = np.fromiter((catalog.index.get(gid, -1) for _, gid, _ in train), dtype=np.int64, count=len(train))
+    players = np.bincount(rows[rows >= 0], minlength=len(catalog))
+    n_users = len({uid for uid, _, _ in train})
+    return -np.log2((players + 1.0) / (n_users + 1.0))
+
+
+def init_worker(state: Dict):
+    global worker_state
+    worker_state = state
+
+
+def evaluate_block(users: List[str]) -> Tuple[Dict[str, float], np.ndarray, int]:
+    state = worker_state
+    catalog, split, k = state["catalog"], state["split"], state["k"]
+    if state["memory"]:
+        tracemalloc.start()
+    excluded = np.zeros((len(users), len(catalog)), dtype=bool)
+    for row, uid in enumerate(users):
+        excluded[row, catalog.lookup(split.excluded[uid])] = True
+    scores = np.where(excluded, -np.inf, state["scorer"].score(users, split.libraries, ~excluded))
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind="stable")
+    top = np.take_along_axis(top, order, axis=1)
+    finite = np.isfinite(np.take_along_axis(top_scores, order, axis=1))
+    totals = dict.fromkeys(("precision", "recall", "ndcg", "novelty", "hidden_rate", "hidden_users"), 0.0)
+    for row, uid in enumerate(users):
+        rows = top[row][finite[row]]
+        recommended = [catalog.game_ids[idx] for idx in rows.tolist()]
+        for metric, value in ranking_metrics(recommended, split.targets[uid], k).items():
+            totals[metric] += value
+        if len(rows):
+            totals["novelty"] += float(state["self_information"][rows].mean())
+        negatives = split.negatives.get(uid)
+        if negatives:
+            totals["hidden_rate"] += sum(game_id in negatives for game_id in recommended) / k
+            totals["hidden_users"] += 1
+    peak = 0
+    if state["memory"]:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return totals, np.unique(top[finite]), peak
+
+
+def score_users(state: Dict, users: List[str], workers: int, block_size: int):
+    blocks = [users[start:start + block_size] for start in range(0, len(users), block_size)]
+    if workers <= 1:
+        init_worker(state)
+        return list(map(evaluate_block, blocks))
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(state,)) as pool:
+        return list(pool.map(evaluate_block, blocks))
+
+
+def evaluate_engine(
+    name: str,
+    catalog: Catalog,
+    split: Split,
+    k: int = EVAL_K,
+    workers: int = EVAL_WORKERS,
+    block_size: int = EVAL_BLOCK_SIZE,
+    memory: bool = True
+) -> Dict:
+    if memory:
+        tracemalloc.start()
+    try:
+        started = time.perf_counter()
+        scorer = build_scorer(name, split.train, catalog)
+        train_seconds = time.perf_counter() - started
+        train_peak = tracemalloc.get_traced_memory()[1] if memory else 0
+    finally:
+        if memory:
+            tracemalloc.stop()
+    state = {
+        "catalog": catalog,
+        "split": split,
+        "scorer": scorer,
+        "k": min(k, len(catalog) - 1),
+        "memory": memory,
+        "self_information": self_information(split.train, catalog)
+    }
+    started = time.perf_counter()
+    results = score_users(state, split.users, workers, block_size)
+    score_seconds = time.perf_counter() - started
+    totals = dict.fromkeys(("precision", "recall", "ndcg", "novelty", "hidden_rate", "hidden_users"), 0.0)
+    recommended = np.zeros(len(catalog), dtype=bool)
+    score_peak = 0
+    for block_totals, rows, peak in results:
+        for metric, value in block_totals.items():
+            totals[metric] += value
+        recommended[rows] = True
+        score_peak = max(score_peak, peak)
+    n_users = max(len(split.users), 1)
+    report = {metric: round(totals[metric] / n_users, 4) for metric in ("precision", "recall", "ndcg", "novelty")}
+    if totals["hidden_users"]:
+        report["hidden_rate"] = round(totals["hidden_rate"] / totals["hidden_users"], 4)
+    report.update({
+        "coverage": round(float(recommended.mean()), 4),
+        "train_seconds": round(train_seconds, 2),
+        "score_seconds": round(score_seconds, 2),
+        "users_per_second": round(len(split.users) / score_seconds, 1) if score_seconds else None,
+        "train_peak_mb": round(train_peak / 2 ** 20, 1) if memory else None,
+        "score_peak_mb_per_block": round(score_peak / 2 ** 20, 1) if memory else None
+    })
+    return report
+
+
+def compare(report: Dict, baseline: Dict) -> Dict:
+    changes = {}
+    for name, metrics in report["engines"].items():
+        before = baseline.get("engines", {}).get(name)
+        if not before:
+            continue
+        changes[name] = {
+            metric: round(metrics[metric] - before[metric], 4)
+            for metric in QUALITY_METRICS if metric in metrics and metric in before
+        }
+        for metric in ("train_seconds", "users_per_second", "train_peak_mb"):
+            if metrics.get(metric) and before.get(metric):
+                changes[name][metric] = round(metrics[metric] / before[metric], 2)
+    return changes
+
+
+def format_table(engines: Dict[str, Dict]) -> str:
+    columns = [
+        column for column in QUALITY_METRICS + ("train_seconds", "users_per_second", "train_peak_mb")
+        if any(metrics.get(column) is not None for metrics in engines.values())
+    ]
+    lines = ["engine".ljust(12) + "".join(column.rjust(18) for column in columns)]
+    for name, metrics in engines.items():
+        lines.append(name.ljust(12) + "".join(str(metrics.get(column, "-")).rjust(18) for column in columns))
+    return "\n".join(lines)
+
+
+async def load_snapshot(args) -> Snapshot:
+    if args.snapshot:
+        return Snapshot.load(args.snapshot)
+    if args.db:
+        snapshot = await snapshot_tables()
+        if snapshot is None:
+            raise SystemExit("Could not snapshot the library, wishlist and hidden tables")
+        return snapshot
+    return synthetic_snapshot(args.games, args.users, args.eval_users, seed=args.seed)
+
+
+def run_evaluation(args) -> Dict:
+    started = time.perf_counter()
+    snapshot = asyncio.run(load_snapshot(args))
+    if args.save_snapshot:
+        snapshot.save(args.save_snapshot)
+    snapshot_seconds = time.perf_counter() - started
+    if args.split == "wishlist":
+        cutoff = datetime.fromisoformat(args.cutoff) if args.cutoff else None
+        split = wishlist_split(snapshot, args.eval_users, args.min_played, args.seed, cutoff)
+    else:
+        split = library_split(snapshot, args.eval_users, args.holdout, args.min_played, args.seed)
+    engines = {}
+    for name in args.engines:
+        engines[name] = evaluate_engine(
+            name, snapshot.catalog, split, args.k, args.workers, args.block_size, args.memory
+        )
+        recommend.logger.info(f"Evaluated {name}: {engines[name]}")
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "k": args.k,
+            "seed": args.seed,
+            "workers": args.workers,
+            "block_size": args.block_size,
+            "source": "snapshot" if args.snapshot else "db" if args.db else "synthetic"
+        },
+        "data": dict(snapshot.stats(), load_seconds=round(snapshot_seconds, 2)),
+        "split": dict(split.details, eval_users=len(split.users)),
+        "engines": engines
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Offline evaluation of recommendation engines on a holdout of the library tables")
+    parser.add_argument("--engines", nargs="+", default=EVAL_ENGINES, choices=EVAL_ENGINES)
+    parser.add_argument("--db", action="store_true", help="snapshot library, wishlist and hidden from Postgres")
+    parser.add_argument("--snapshot", help="evaluate a snapshot saved with --save-snapshot")
+    parser.add_argument("--save-snapshot", help="write the loaded snapshot for repeatable runs")
+    parser.add_argument("--split", choices=("library", "wishlist"), default="library")
+    parser.add_argument("--cutoff", help="ISO date for the wishlist split (default: 80th percentile of date_added)")
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--eval-users", type=int, default=2000)
+    parser.add_argument("--holdout", type=float, default=0.2)
+    parser.add_argument("--min-played", type=int, default=5)
+    parser.add_argument("--k", type=int, default=EVAL_K)
+    parser.add_argument("--workers", type=int, default=EVAL_WORKERS)
+    parser.add_argument("--block-size", type=int, default=EVAL_BLOCK_SIZE)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="skip tracemalloc peak memory")
+    parser.add_argument("--compare", help="earlier evaluation report to diff against")
+    parser.add_argument("--output", help="write the report as JSON")
+    args = parser.parse_args()
+    report = run_evaluation(args)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            report["changes"] = compare(report, json.load(f))
+    print(format_table(report["engines"]))
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,90 @@
+import copy
+import numpy as np
+from typing import Optional, Tuple
+
+
+FACTOR_PRECISIONS = ("float64", "float32", "float16", "int8")
+FACTOR_BLOCK_SIZE = 4096
+
+
+def quantize_rows(vectors: np.ndarray, precision: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    if precision not in FACTOR_PRECISIONS:
+        raise ValueError(f"Unknown factor precision: {precision}")
+    if precision != "int8":
+        return np.ascontiguousarray(vectors, dtype=precision), None
+    scales = np.abs(vectors).max(axis=1).astype(np.float32) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales
+
+
+class ItemFactors:
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        offsets: np.ndarray,
+        precision: str = "float32",
+        clip: Optional[Tuple[float, float]] = None,
+        block_size: int = FACTOR_BLOCK_SIZE
+    ):
+        self.precision = precision
+        self.dtype = np.float64 if precision == "float64" else np.float32
+        self.codes, self.scales = quantize_rows(vectors, precision)
+        self.offsets = np.asarray(offsets, dtype=self.dtype)
+        self.clip = clip
+        self.block_size = block_size
+        self.rows = None
+
+    @classmethod
+    def from_model(cls, model, item_inner: np.ndarray, precision: str = "float32", block_size: int = FACTOR_BLOCK_SIZE):
+        vectors, offsets = model.item_terms(item_inner)
+        return cls(vectors, offsets, precision, model.clip, block_size)
+
+    @classmethod
+    def from_codes(
+        cls,
+        codes: np.ndarray,
+        scales: Optional[np.ndarray],
+        offsets: np.ndarray,
+        rows: Optional[np.ndarray] = None,
+        clip: Optional[Tuple[float, float]] = None,
+        block_size: int = FACTOR_BLOCK_SIZE
+    ):
+        items = cls.__new__(cls)
+        items.precision = "int8" if scales is not None else codes.dtype.name
+        items.dtype = offsets.dtype
+        items.codes, items.scales, items.offsets = codes, scales, offsets
+        items.clip = clip
+        items.block_size = block_size
+        items.rows = rows
+        return items
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.offsets.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def __len__(self) -> int:
+        return len(self.codes) if self.rows is None else len(self.rows)
+
+    def view(self, rows: Optional[np.ndarray]) -> "ItemFactors":
+        items = copy.copy(self)
+        items.rows = rows
+        return items
+
+    def scores(self, user_vectors: np.ndarray, user_offsets: np.ndarray) -> np.ndarray:
+        user_vectors = np.asarray(user_vectors, dtype=self.dtype)
+        out = np.empty((len(user_vectors), len(self)), dtype=self.dtype)
+        for start in range(0, len(self), self.block_size):
+            end = min(start + self.block_size, len(self))
+            index = slice(start, end) if self.rows is None else self.rows[start:end]
+            block = self.codes[index]
+            if block.dtype != self.dtype:
+                block = block.astype(self.dtype)
+            out[:, start:end] = user_vectors @ block.T
+            if self.scales is not None:
+                out[:, start:end] *= self.scales[index]
+            out[:, start:end] += self.offsets[index]
+        out += np.asarray(user_offsets, dtype=self.dtype)[:, None]
+        if self.clip is not None:
+            np.clip(out, *self.clip, out=out)
+        return out
@@ -0,0 +1,99 @@
+from collections import OrderedDict
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+import hashlib
+import orjson
+import time
+from typing import Any, Awaitable, Callable, Hashable, Optional
+from Try_It_bd import get_catalog_version_from_db
+from single_flight import single_flight
+from metrics import cache_lookup
+
+
+CATALOG_VERSION_TTL = 60
+CATALOG_CACHE_MAX_AGE = 3600
+RESPONSE_CACHE_MAX_ENTRIES = 5000
+
+
+class CachedResponse:
+    __slots__ = ("version", "body", "etag")
+
+    def __init__(self, version: int, body: bytes, etag: str):
+        self.version = version
+        self.body = body
+        self.etag = etag
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def get(self, key: Hashable, version: int) -> Optional[CachedResponse]:
+        entry = self.entries.get(key)
+        if entry is None or entry.version != version:
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key: Hashable, entry: CachedResponse):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+
+response_cache = ResponseCache()
+catalog_version = None
+catalog_version_checked_at = 0.0
+
+
+async def refresh_catalog_version():
+    global catalog_version, catalog_version_checked_at
+    version = await get_catalog_version_from_db()
+    if version is not None:
+        catalog_version = version
+    catalog_version_checked_at = time.monotonic()
+    return catalog_version
+
+
+async def get_catalog_version() -> Optional[int]:
+    if catalog_version is not None and time.monotonic() - catalog_version_checked_at < CATALOG_VERSION_TTL:
+        return catalog_version
+    return await single_flight.do("catalog_version", refresh_catalog_version)
+
+
+def serialize_json(data: Any) -> bytes:
+    return orjson.dumps(data, default=jsonable_encoder)
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or etag in [tag.strip() for tag in header.split(",")]
+
+
+async def catalog_response(
+    request: Request,
+    key: Hashable,
+    loader: Callable[[], Awaitable[Any]],
+    max_age: int = CATALOG_CACHE_MAX_AGE
+) -> Response:
+    version = await get_catalog_version()
+    entry = response_cache.get(key, version) if version is not None else None
+    cache_lookup("catalog_response", entry is not None)
+    if entry is None:
+        data = await loader()
+        body = serialize_json(data)
+        etag = f'"{version}-{hashlib.sha1(body).hexdigest()}"'
+        entry = CachedResponse(version, body, etag)
+        if data is not None and version is not None:
+            response_cache.put(key, entry)
+    headers = {"ETag": entry.etag, "Cache-Control": f"private, max-age={max_age}"}
+    if etag_matches(request, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
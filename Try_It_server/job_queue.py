@@ -0,0 +1,258 @@
+import psycopg
+from psycopg.types.json import Jsonb
+import asyncio
+import traceback
+from Try_It_bd import db_connect, update_user_data, update_all_users, update_games
+from recommend import train_models, invalidate_game_features, warm_serving_state
+from precompute import precompute_recommendations
+from model_store import publish_snapshot
+from similar_games import build_similar_games
+
+
+POLL_INTERVAL = 1.0
+RETRY_DELAY_SECONDS = 30
+STALE_JOB_MINUTES = 60
+JOB_HANDLERS = {}
+JOB_WAITS_FOR = {"refresh_models": "ingest_user"}
+worker_tasks = []
+
+
+def job_handler(kind: str):
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+async def create_job_table():
+    try:
+        conn = await db_connect()
+        async with conn:
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                                  CREATE TABLE IF NOT EXISTS try_it."job" (
+                                      "jobID" BIGSERIAL PRIMARY KEY,
+                                      "kind" TEXT NOT NULL,
+                                      "payload" JSONB NOT NULL DEFAULT '{}',
+                                      "status" TEXT NOT NULL DEFAULT 'queued',
+                                      "depends_on" BIGINT REFERENCES try_it."job" ("jobID"),
+                                      "attempts" INTEGER NOT NULL DEFAULT 0,
+                                      "max_attempts" INTEGER NOT NULL DEFAULT 3,
+                                      "error" TEXT,
+                                      "run_after" TIMESTAMP NOT NULL DEFAULT now(),
+                                      "created_at" TIMESTAMP NOT NULL DEFAULT now(),
+                                      "started_at" TIMESTAMP,
+                                      "finished_at" TIMESTAMP
+                                  )
+                                  """)
+                await cur.execute("""
+                                  CREATE INDEX IF NOT EXISTS job_queued_idx ON try_it."job" ("jobID")
+                                  WHERE "status" = 'queued'
+                                  """)
+                await cur.execute("""
+                                  UPDATE try_it."job" SET "status" = 'queued', "run_after" = now()
+                                  WHERE "status" = 'running' AND "started_at" < now() - make_interval(mins => %s)
+                                  """, (STALE_JOB_MINUTES, ))
+                await conn.commit()
+    except psycopg.Error as err:
+        print("DB error in create_job_table:", err)
+
+
+async def insert_job(cur, kind: str, payload: dict, depends_on: int = None, max_attempts: int = 3):
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    await cur.execute("""
+                      INSERT INTO try_it."job" ("kind", "payload", "depends_on", "max_attempts")
+                      VALUES (%s, %s, %s, %s)
+                      RETURNING "jobID"
+                      """, (kind, Jsonb(payload), depends_on, max_attempts, ))
+    row = await cur.fetchone()
+    return row["jobID"]
+
+
+async def enqueue_job(kind: str, payload: dict, depends_on: int = None, max_attempts: int = 3):
+    conn = await db_connect()
+    async with conn:
+        async with conn.cursor() as cur:
+            job_id = await insert_job(cur, kind, payload, depends_on, max_attempts)
+            await conn.commit()
+            return job_id
+
+
+async def enqueue_coalesced_job(kind: str, steamid64: str, max_attempts: int = 3):
+    conn = await db_connect()
+    async with conn:
+        async with conn.cursor() as cur:
+            await cur.execute("""
+                              SELECT "jobID" FROM try_it."job" WHERE "kind" = %s AND "status" = 'queued'
+                              ORDER BY "jobID" DESC
+                              FOR UPDATE SKIP LOCKED
+                              LIMIT 1
+                              """, (kind, ))
+            pending = await cur.fetchone()
+            if pending is None:
+                job_id = await insert_job(cur, kind, {"steamid64s": [steamid64]}, max_attempts=max_attempts)
+            else:
+                job_id = pending["jobID"]
+                await cur.execute("""
+                                  UPDATE try_it."job" SET "payload" = jsonb_set(
+                                      "payload", '{steamid64s}', COALESCE("payload" -> 'steamid64s', '[]') || to_jsonb(%s::TEXT)
+                                  )
+                                  WHERE "jobID" = %s
+                                  """, (steamid64, job_id, ))
+            await conn.commit()
+            return job_id
+
+
+async def get_job(job_id: int):
+    try:
+        conn = await db_connect()
+        async with conn:
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                                  SELECT "jobID", "kind", "payload", "status", "depends_on", "attempts",
+                                         "error", "created_at", "started_at", "finished_at"
+                                  FROM try_it."job" WHERE "jobID" = %s
+                                  """, (job_id, ))
+                return await cur.fetchone()
+    except psycopg.Error as err:
+        print("DB error in get_job:", err)
+        return None
+
+
+async def claim_job():
+    conn = await db_connect()
+    async with conn:
+        async with conn.cursor() as cur:
+            await cur.execute("""
+                              UPDATE try_it."job" SET "status" = 'running', "attempts" = "attempts" + 1, "started_at" = now()
+                              WHERE "jobID" = (
+                                  SELECT j."jobID" FROM try_it."job" j
+                                  LEFT JOIN try_it."job" d ON d."jobID" = j."depends_on"
+                                  WHERE j."status" = 'queued' AND j."run_after" <= now()
+                                    AND (j."depends_on" IS NULL OR d."status" = 'done')
+                                    AND NOT EXISTS (
+                                        SELECT 1 FROM try_it."job" w
+                                        JOIN unnest(%s::TEXT[], %s::TEXT[]) AS gate ("kind", "waits_for") ON gate."waits_for" = w."kind"
+                                        WHERE gate."kind" = j."kind" AND w."status" IN ('queued', 'running')
+                                    )
+                                  ORDER BY j."jobID"
+                                  FOR UPDATE OF j SKIP LOCKED
+                                  LIMIT 1
+                              )
+                              RETURNING "jobID", "kind", "payload", "attempts", "max_attempts"
+                              """, (list(JOB_WAITS_FOR), list(JOB_WAITS_FOR.values()), ))
+            job = await cur.fetchone()
+            await conn.commit()
+            return job
+
+
+async def finish_job(job_id: int, error: str = None, retry: bool = False):
+    conn = await db_connect()
+    async with conn:
+        async with conn.cursor() as cur:
+            if error is None:
+                await cur.execute("""
+                                  UPDATE try_it."job" SET "status" = 'done', "error" = NULL, "finished_at" = now()
+                                  WHERE "jobID" = %s
+                                  """, (job_id, ))
+            elif retry:
+                await cur.execute("""
+                                  UPDATE try_it."job" SET "status" = 'queued', "error" = %s,
+                                  "run_after" = now() + make_interval(secs => %s * "attempts")
+                                  WHERE "jobID" = %s
+                                  """, (error, RETRY_DELAY_SECONDS, job_id, ))
+            else:
+                await cur.execute("""
+                                  WITH RECURSIVE failed AS (
+                                      SELECT %s::BIGINT AS "jobID"
+                                      UNION
+                                      SELECT j."jobID" FROM try_it."job" j JOIN failed f ON j."depends_on" = f."jobID"
+                                  )
+                                  UPDATE try_it."job" SET "status" = 'failed', "finished_at" = now(),
+                                  "error" = CASE WHEN "jobID" = %s THEN %s ELSE 'dependency failed' END
+                                  WHERE "jobID" IN (SELECT "jobID" FROM failed)
+                                  """, (job_id, job_id, error, ))
+            await conn.commit()
+
+
+async def run_job(job):
+    handler = JOB_HANDLERS.get(job["kind"])
+    try:
+        if handler is None:
+            raise ValueError(f"Unknown job kind: {job['kind']}")
+        await handler(**job["payload"])
+        await finish_job(job["jobID"])
+        print(f"Job {job['jobID']} ({job['kind']}) done")
+    except Exception as e:
+        print(f"Job {job['jobID']} ({job['kind']}) failed: {str(e)}")
+        traceback.print_exc()
+        await finish_job(job["jobID"], error=str(e), retry=job["attempts"] < job["max_attempts"])
+
+
+async def worker(worker_id: int):
+    while True:
+        try:
+            job = await claim_job()
+            if job is None:
+                await asyncio.sleep(POLL_INTERVAL)
+                continue
+            await run_job(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error in job worker {worker_id}: {str(e)}")
+            await asyncio.sleep(POLL_INTERVAL)
+
+
+async def start_workers(count: int = 2):
+    await create_job_table()
+    for worker_id in range(count):
+        worker_tasks.append(asyncio.create_task(worker(worker_id)))
+
+
+async def stop_workers():
+    for task in worker_tasks:
+        task.cancel()
+    await asyncio.gather(*worker_tasks, return_exceptions=True)
+    worker_tasks.clear()
+
+
+@job_handler("ingest_user")
+async def ingest_user_job(steamid64: str):
+    await update_user_data(steamid64, raise_errors=True)
+
+
+@job_handler("refresh_models")
+async def refresh_models_job(steamid64: str = None, steamid64s: list = None):
+    await train_models()
+    await publish_snapshot()
+    await precompute_recommendations()
+
+
+@job_handler("refresh_users")
+async def refresh_users_job(schedule: str = None):
+    await update_all_users()
+
+
+@job_handler("sync_catalog")
+async def sync_catalog_job(schedule: str = None):
+    await update_games()
+
+
+@job_handler("build_models")
+async def build_models_job(schedule: str = None):
+    invalidate_game_features()
+    await train_models()
+    await publish_snapshot()
+    await warm_serving_state()
+
+
+@job_handler("similar_games")
+async def similar_games_job(schedule: str = None):
+    await build_similar_games()
+
+
+@job_handler("precompute")
+async def precompute_job(schedule: str = None):
+    await precompute_recommendations()
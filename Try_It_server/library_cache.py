@@ -0,0 +1,122 @@
+import asyncio
+import os
+import time
+import traceback
+from collections import OrderedDict
+from typing import Awaitable, Callable, Iterable, List, Optional, Set, Tuple
+from metrics import cache_requests_total
+from single_flight import single_flight
+
+
+LIBRARY_CACHE_TTL = float(os.environ.get("TRYIT_LIBRARY_CACHE_TTL", 6 * 3600))
+LIBRARY_CACHE_MAX_STALE = float(os.environ.get("TRYIT_LIBRARY_CACHE_MAX_STALE", 7 * 24 * 3600))
+LIBRARY_CACHE_SIZE = int(os.environ.get("TRYIT_LIBRARY_CACHE_SIZE", 10000))
+LIBRARY_CACHE_DB = os.environ.get("TRYIT_LIBRARY_CACHE_DB", "1") == "1"
+
+Library = List[Tuple[str, int]]
+
+
+class CachedLibrary:
+    __slots__ = ("fetched_at", "games")
+
+    def __init__(self, fetched_at: float, games: Library):
+        self.fetched_at = fetched_at
+        self.games = games
+
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+
+class LibraryCache:
+    def __init__(
+        self,
+        fetch: Callable[[str], Awaitable[Library]],
+        load: Optional[Callable[[str], Awaitable[Optional[CachedLibrary]]]] = None,
+        store: Optional[Callable[[str, CachedLibrary], Awaitable[None]]] = None,
+        ttl: float = LIBRARY_CACHE_TTL,
+        max_stale: float = LIBRARY_CACHE_MAX_STALE,
+        max_size: int = LIBRARY_CACHE_SIZE
+    ):
+        self.fetch = fetch
+        self.load = load
+        self.store = store
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.max_size = max_size
+        self.entries: "OrderedDict[str, CachedLibrary]" = OrderedDict()
+        self.tasks: Set[asyncio.Task] = set()
+
+    def remember(self, steamid: str, entry: CachedLibrary):
+        self.entries[steamid] = entry
+        self.entries.move_to_end(steamid)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    async def lookup(self, steamid: str) -> Optional[CachedLibrary]:
+        entry = self.entries.get(steamid)
+        if entry is None and self.load is not None:
+            entry = await self.load(steamid)
+            if entry is not None:
+                self.remember(steamid, entry)
+        return entry
+
+    async def get(self, steamid) -> Library:
+        steamid = str(steamid)
+        entry = await self.lookup(steamid)
+        if entry is not None and entry.age() <= self.max_stale:
+            self.entries.move_to_end(steamid)
+            if entry.age() > self.ttl:
+                cache_requests_total.inc(cache="friend_library", result="stale")
+                self.revalidate(steamid)
+            else:
+                cache_requests_total.inc(cache="friend_library", result="hit")
+            return entry.games
+        cache_requests_total.inc(cache="friend_library", result="miss")
+        return await self.refresh(steamid)
+
+    async def refresh(self, steamid: str) -> Library:
+        return await single_flight.do(("friend_library", steamid), self.fetch_and_store, steamid)
+
+    async def fetch_and_store(self, steamid: str) -> Library:
+        entry = CachedLibrary(time.time(), await self.fetch(steamid))
+        self.remember(steamid, entry)
+        if self.store is not None:
+            await self.store(steamid, entry)
+        return entry.games
+
+    def revalidate(self, steamid: str):
+        if single_flight.in_flight(("friend_library", steamid)):
+            return
+        self.spawn(self.refresh_quietly(steamid))
+
+    async def refresh_quietly(self, steamid: str):
+        try:
+            await self.refresh(steamid)
+        except Exception as err:
+            print(f"[ERROR] Failed to refresh library for {steamid}: {err}")
+
+    def prefetch(self, steamids: Iterable):
+        steamids = [str(steamid) for steamid in steamids]
+        if steamids:
+            self.spawn(self.prefetch_all(steamids))
+
+    async def prefetch_all(self, steamids: List[str]):
+        for steamid in steamids:
+            try:
+                entry = await self.lookup(steamid)
+                if entry is None or entry.age() > self.ttl:
+                    await self.refresh(steamid)
+            except Exception as err:
+                print(f"[ERROR] Failed to prefetch library for {steamid}: {err}")
+                traceback.print_exc()
+
+    def spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def invalidate(self, steamid):
+        self.entries.pop(str(steamid), None)
+
+    def clear(self):
+        self.entries.clear()
@@ -0,0 +1,404 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import aiohttp
+import bcrypt
+import numpy as np
+from synthetic import InMemoryDataSource, login_for, split_features
+
+
+LOAD_TEST_PASSWORD = "load-test-password"
+DEFAULT_MIX = "recommend=40,get-wishlist=20,add-to-blacklist=10,get-game-info=25,login=5"
+SATURATION_GAIN = 1.1
+MAX_ERROR_RATE = 0.01
+
+
+class FakeDatabase:
+    def __init__(self, source: InMemoryDataSource, latency: float = 0.0):
+        self.source = source
+        self.latency = latency
+        self.password_hash = bcrypt.hashpw(LOAD_TEST_PASSWORD.encode("utf-8"), bcrypt.gensalt())
+        self.logins = {login_for(uid): uid for uid in source.user_ids}
+        self.catalog = {game_id: split_features(features) for game_id, features in source.game_features.items()}
+
+    async def roundtrip(self):
+        await asyncio.sleep(self.latency)
+
+    def short_info(self, game_id: str):
+        return {
+            "GameID": game_id,
+            "game_title": f"Synthetic game {game_id}",
+            "image_url": f"https://shared.akamai.steamstatic.com/store_item_assets/steam/apps/{game_id}/header.jpg",
+            "rating": self.catalog[game_id]["rating"]
+        }
+
+    async def get_user_by_login(self, login: str):
+        await self.roundtrip()
+        steamid64 = self.logins.get(login)
+        if steamid64 is None:
+            return None
+        return {"login": login, "password": self.password_hash, "SteamID64": steamid64}
+
+    async def get_wishlist_from_db(self, login: str):
+        await self.roundtrip()
+        return list(self.source.wishlists.get(login, []))
+
+    async def get_blacklist_from_db(self, login: str):
+        await self.roundtrip()
+        return list(self.source.blacklists.get(login, []))
+
+    async def add_to_wishlist_in_db(self, login: str, game_id: str):
+        await self.roundtrip()
+        wishlist = self.source.wishlists.setdefault(login, [])
+        if game_id not in wishlist:
+            wishlist.append(game_id)
+
+    async def add_to_blacklist_in_db(self, login: str, game_id: str):
+        await self.roundtrip()
+        blacklist = self.source.blacklists.setdefault(login, [])
+        if game_id not in blacklist:
+            blacklist.append(game_id)
+
+    async def get_short_game_info_from_db(self, game_id: str):
+        await self.roundtrip()
+        return self.short_info(game_id) if game_id in self.catalog else None
+
+    async def get_short_games_info_from_db(self, game_ids):
+        await self.roundtrip()
+        return [self.short_info(game_id) for game_id in game_ids if game_id in self.catalog]
+
+    async def get_game_info_from_db(self, game_id: str):
+        await self.roundtrip()
+        if game_id not in self.catalog:
+            return None
+        game = self.catalog[game_id]
+        return dict(
+            self.short_info(game_id),
+            description="Synthetic catalog entry",
+            tags=game["tags"],
+            genres=game["genres"],
+            features=game["features"]
+        )
+
+    async def get_genres_tags_features_from_db(self):
+        await self.roundtrip()
+        return [{
+            key: sorted({value for game in self.catalog.values() for value in game[key]})
+            for key in ("tags", "genres", "features")
+        }]
+
+    async def get_catalog_version_from_db(self):
+        await self.roundtrip()
+        return 1
+
+    async def get_precomputed_recommendations(self, steamid64: str, login: str, n: int = 100):
+        return None
+
+    async def noop(self, *args, **kwargs):
+        return None
+
+    def install(self):
+        import http_cache
+        import recommend
+        import Try_It_server
+        for name in (
+            "get_user_by_login",
+            "get_wishlist_from_db",
+            "get_blacklist_from_db",
+            "add_to_wishlist_in_db",
+            "add_to_blacklist_in_db",
+            "get_short_game_info_from_db",
+            "get_short_games_info_from_db",
+            "get_game_info_from_db",
+            "get_genres_tags_features_from_db",
+            "get_precomputed_recommendations"
+        ):
+            setattr(Try_It_server, name, getattr(self, name))
+        Try_It_server.create_catalog_version_table = self.noop
+        Try_It_server.create_library_cache_table = self.noop
+        Try_It_server.create_ranking_cursor_table = self.noop
+        Try_It_server.ranking_store.persist = False
+        Try_It_server.start_workers = self.noop
+        Try_It_server.start_scheduler = self.noop
+        http_cache.get_catalog_version_from_db = self.get_catalog_version_from_db
+        recommend.set_data_source(self.source)
+
+
+async def train_models(model_dir: str):
+    import recommend
+    recommend.MODEL_PATH = os.path.join(model_dir, "model.pkl")
+    recommend.TFIDF_PATH = os.path.join(model_dir, "tfidf.pkl")
+    recommend.set_cached_model(None)
+    recommend.set_cached_tfidf(None)
+    await recommend.collaborative_recommendations(force_update=True)
+    await recommend.content_recommendations(force_update=True)
+
+
+def serve_fake(args):
+    import uvicorn
+    source = InMemoryDataSource.generate(args.games, args.users, seed=args.seed)
+    FakeDatabase(source, args.db_latency / 1000).install()
+    import Try_It_server
+    with tempfile.TemporaryDirectory() as model_dir:
+        if not args.cold:
+            asyncio.run(train_models(model_dir))
+        uvicorn.run(Try_It_server.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+async def seed_postgres(args):
+    from Try_It_bd import db_connect
+    source = InMemoryDataSource.generate(args.games, args.users, seed=args.seed)
+    catalog = {game_id: split_features(features) for game_id, features in source.game_features.items()}
+    password_hash = bcrypt.hashpw(LOAD_TEST_PASSWORD.encode("utf-8"), bcrypt.gensalt())
+    conn = await db_connect()
+    async with conn:
+        async with conn.cursor() as cur:
+            await cur.executemany("""
+                                  INSERT INTO try_it.game ("GameID", game_title, description, image_url, rating)
+                                  VALUES (%s, %s, %s, %s, %s)
+                                  ON CONFLICT ("GameID") DO NOTHING
+                                  """, [
+                                      (game_id, f"Synthetic game {game_id}", "Synthetic catalog entry",
+                                       f"https://shared.akamai.steamstatic.com/store_item_assets/steam/apps/{game_id}/header.jpg",
+                                       game["rating"])
+                                      for game_id, game in catalog.items()
+                                  ])
+            for key, table, link_table, id_column in (
+                ("tags", "tag", "tags", "tagID"),
+                ("genres", "genre", "genres", "genreID"),
+                ("features", "feature", "features", "featureID")
+            ):
+                values = sorted({value for game in catalog.values() for value in game[key]})
+                await cur.executemany(f"""
+                                      INSERT INTO try_it.{table} ({table}) VALUES (%s)
+                                      ON CONFLICT ({table}) DO NOTHING
+                                      """, [(value, ) for value in values])
+                await cur.execute(f'SELECT "{id_column}", {table} FROM try_it.{table}')
+                ids = {row[table]: row[id_column] for row in await cur.fetchall()}
+                await cur.executemany(f"""
+                                      INSERT INTO try_it.{link_table} ("gameID", "{id_column}") VALUES (%s, %s)
+                                      ON CONFLICT DO NOTHING
+                                      """, [
+                                          (game_id, ids[value])
+                                          for game_id, game in catalog.items() for value in game[key]
+                                      ])
+            await cur.executemany("""
+                                  INSERT INTO try_it."Steam_User" ("SteamID64", nickname) VALUES (%s, %s)
+                                  ON CONFLICT ("SteamID64") DO NOTHING
+                                  """, [(uid, login_for(uid)) for uid in source.user_ids])
+            await cur.executemany("""
+                                  INSERT INTO try_it."user" (login, password, "SteamID64") VALUES (%s, %s, %s)
+                                  ON CONFLICT DO NOTHING
+                                  """, [(login_for(uid), password_hash, uid) for uid in source.user_ids])
+            await cur.executemany("""
+                                  INSERT INTO try_it."library" ("SteamID64", "GameID", "time_in_game")
+                                  VALUES (%s, %s, %s) ON CONFLICT DO NOTHING
+                                  """, [
+                                      (source.user_ids[owner], source.game_ids[game], int(minutes))
+                                      for owner, game, minutes in zip(source.owners, source.games, source.playtime)
+                                  ])
+            await conn.commit()
+    print(json.dumps(source.stats(), indent=2))
+
+
+def parse_mix(mix: str):
+    weights = {}
+    for part in mix.split(","):
+        name, weight = part.split("=")
+        weights[name.strip()] = float(weight)
+    return weights
+
+
+class LoadDriver:
+    def __init__(self, url: str, source: InMemoryDataSource, mix, seed: int = 0):
+        from auth import create_access_token
+        self.url = url.rstrip("/")
+        self.rng = random.Random(seed)
+        self.game_ids = source.game_ids
+        self.logins = [login_for(uid) for uid in source.sample_users(min(len(source.user_ids), 1000), seed=seed)]
+        self.tokens = {login: create_access_token({"sub": login}) for login in self.logins}
+        self.endpoints = list(mix.keys())
+        self.weights = list(mix.values())
+
+    def request_for(self, endpoint: str):
+        login = self.rng.choice(self.logins)
+        token = self.tokens[login]
+        if endpoint == "recommend":
+            return "GET", "/recommend", {"token": token, "limit": 20}, None
+        if endpoint == "get-wishlist":
+            return "GET", "/get-wishlist", {"token": token}, None
+        if endpoint == "add-to-blacklist":
+            return "POST", "/add-to-blacklist", {"token": token, "game_id": self.rng.choice(self.game_ids)}, None
+        if endpoint == "get-game-info":
+            return "GET", "/get-game-info", {"token": token, "game_id": self.rng.choice(self.game_ids)}, None
+        if endpoint == "login":
+            return "POST", "/login", None, {"login": login, "password": LOAD_TEST_PASSWORD}
+        raise ValueError(f"Unknown endpoint in mix: {endpoint}")
+
+    async def user_loop(self, session, deadline: float, samples, errors):
+        while time.perf_counter() < deadline:
+            endpoint = self.rng.choices(self.endpoints, self.weights)[0]
+            method, path, params, body = self.request_for(endpoint)
+            started = time.perf_counter()
+            try:
+                async with session.request(method, self.url + path, params=params, json=body) as response:
+                    await response.read()
+                    failed = response.status >= 400
+            except aiohttp.ClientError:
+                failed = True
+            samples[endpoint].append((time.perf_counter() - started) * 1000)
+            errors[endpoint] += failed
+
+    async def run_stage(self, concurrency: int, duration: float):
+        samples = {endpoint: [] for endpoint in self.endpoints}
+        errors = {endpoint: 0 for endpoint in self.endpoints}
+        timeout = aiohttp.ClientTimeout(total=max(duration, 30))
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0), timeout=timeout) as session:
+            started = time.perf_counter()
+            deadline = started + duration
+            await asyncio.gather(*(self.user_loop(session, deadline, samples, errors) for _ in range(concurrency)))
+            elapsed = time.perf_counter() - started
+        total = sum(len(values) for values in samples.values())
+        total_errors = sum(errors.values())
+        return {
+            "concurrency": concurrency,
+            "seconds": round(elapsed, 2),
+            "requests": total,
+            "throughput_rps": round(total / elapsed, 1),
+            "error_rate": round(total_errors / total, 4) if total else 0.0,
+            "endpoints": {
+                endpoint: endpoint_stats(values, errors[endpoint], elapsed)
+                for endpoint, values in samples.items() if values
+            }
+        }
+
+
+def endpoint_stats(samples_ms, errors: int, elapsed: float):
+    values = np.asarray(samples_ms)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "throughput_rps": round(len(values) / elapsed, 1),
+        "p50_ms": round(float(np.percentile(values, 50)), 1),
+        "p95_ms": round(float(np.percentile(values, 95)), 1),
+        "p99_ms": round(float(np.percentile(values, 99)), 1)
+    }
+
+
+def find_saturation(stages):
+    best = stages[0]
+    for previous, stage in zip(stages, stages[1:]):
+        if stage["error_rate"] > MAX_ERROR_RATE or stage["throughput_rps"] < previous["throughput_rps"] * SATURATION_GAIN:
+            return {
+                "concurrency": previous["concurrency"],
+                "throughput_rps": previous["throughput_rps"],
+                "reason": "errors" if stage["error_rate"] > MAX_ERROR_RATE else "throughput plateau"
+            }
+        best = stage
+    return {"concurrency": None, "throughput_rps": best["throughput_rps"], "reason": "not reached"}
+
+
+async def wait_until_ready(url: str, timeout: float):
+    deadline = time.perf_counter() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.perf_counter() < deadline:
+            try:
+                async with session.get(url.rstrip("/") + "/metrics") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.5)
+    raise TimeoutError(f"Server at {url} did not become ready in {timeout:.0f}s")
+
+
+async def run_load(args):
+    source = InMemoryDataSource.generate(args.games, args.users, seed=args.seed)
+    driver = LoadDriver(args.url, source, parse_mix(args.mix), seed=args.seed)
+    await wait_until_ready(args.url, args.ready_timeout)
+    stages = []
+    for concurrency in args.concurrency:
+        stage = await driver.run_stage(concurrency, args.duration)
+        print(f"concurrency={concurrency} rps={stage['throughput_rps']} errors={stage['error_rate']}", file=sys.stderr)
+        stages.append(stage)
+    return {
+        "url": args.url,
+        "config": {"games": args.games, "users": args.users, "seed": args.seed, "mix": args.mix, "duration_s": args.duration},
+        "stages": stages,
+        "saturation": find_saturation(stages)
+    }
+
+
+def run_command(args):
+    server = None
+    if args.fake:
+        server = subprocess.Popen(
+            [
+                sys.executable, os.path.abspath(__file__), "serve",
+                "--games", str(args.games), "--users", str(args.users), "--seed", str(args.seed),
+                "--port", str(args.port), "--db-latency", str(args.db_latency)
+            ] + (["--cold"] if args.cold else []),
+            stdout=None if args.server_log else subprocess.DEVNULL,
+            stderr=None if args.server_log else subprocess.DEVNULL
+        )
+        args.url = f"http://127.0.0.1:{args.port}"
+    try:
+        report = asyncio.run(run_load(args))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+def add_data_arguments(parser):
+    parser.add_argument("--games", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def add_fake_arguments(parser):
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--db-latency", type=float, default=1.0, help="simulated database round trip in ms")
+    parser.add_argument("--cold", action="store_true", help="start without trained models")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load test for the Try It API with synthetic users and catalog")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="run the app in-process on top of the fake database layer")
+    add_data_arguments(serve_parser)
+    add_fake_arguments(serve_parser)
+
+    seed_parser = commands.add_parser("seed", help="load the synthetic catalog and users into Postgres")
+    add_data_arguments(seed_parser)
+
+    run_parser = commands.add_parser("run", help="drive the endpoint mix at increasing concurrency")
+    add_data_arguments(run_parser)
+    add_fake_arguments(run_parser)
+    run_parser.add_argument("--url", default="http://127.0.0.1:8000", help="server to test when --fake is not set")
+    run_parser.add_argument("--fake", action="store_true", help="start a fake-database server for the run")
+    run_parser.add_argument("--server-log", action="store_true", help="show the spawned server's output")
+    run_parser.add_argument("--mix", default=DEFAULT_MIX)
+    run_parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    run_parser.add_argument("--duration", type=float, default=15.0, help="seconds per concurrency stage")
+    run_parser.add_argument("--ready-timeout", type=float, default=600.0)
+    run_parser.add_argument("--output", help="write the report as JSON")
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        serve_fake(args)
+    elif args.command == "seed":
+        asyncio.run(seed_postgres(args))
+    else:
+        run_command(args)
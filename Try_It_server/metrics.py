@@ -0,0 +1,140 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+import threading
+import time
+from typing import Dict, Iterable, Tuple
+from tracing import span
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels: Tuple[Tuple[str, str], ...], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label_value(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self.values: Dict[Tuple[Tuple[str, str], ...], float] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def render(self) -> Iterable[str]:
+        for key, value in list(self.values.items()):
+            yield f"{self.name}{format_labels(key)} {value}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = value
+
+    def replace(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values = {key: value}
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.values: Dict[Tuple[Tuple[str, str], ...], list] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> Iterable[str]:
+        for key, (counts, total, count) in list(self.values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket{format_labels(key, (('le', repr(bound)),))} {cumulative}"
+            yield f"{self.name}_bucket{format_labels(key, (('le', '+Inf'),))} {count}"
+            yield f"{self.name}_sum{format_labels(key)} {total}"
+            yield f"{self.name}_count{format_labels(key)} {count}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+stage_seconds = registry.register(Histogram(
+    "tryit_recommend_stage_seconds", "Time spent in each stage of the recommendation pipeline"
+))
+request_seconds = registry.register(Histogram(
+    "tryit_http_request_seconds", "HTTP request latency by route"
+))
+db_connect_seconds = registry.register(Histogram(
+    "tryit_db_connect_seconds", "Time spent waiting for a database connection"
+))
+db_connections_total = registry.register(Counter(
+    "tryit_db_connections_total", "Database connections opened, by outcome"
+))
+cache_requests_total = registry.register(Counter(
+    "tryit_cache_requests_total", "Cache lookups by cache and result"
+))
+model_info = registry.register(Gauge(
+    "tryit_model_info", "Model version currently used for serving"
+))
+
+
+def cache_lookup(cache: str, hit: bool):
+    cache_requests_total.inc(cache=cache, result="hit" if hit else "miss")
+
+
+async def timed_stage(stage: str, awaitable):
+    with stage_seconds.time(stage=stage), span(stage):
+        return await awaitable
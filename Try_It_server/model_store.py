@@ -0,0 +1,125 @@
+import numpy as np
+import asyncio
+import copy
+import json
+import os
+import pickle
+import shutil
+import time
+from typing import Dict, List, Optional
+import recommend
+from recommend import logger
+from catalog import Catalog, as_catalog
+
+
+MODEL_STORE_DIR = os.environ.get("TRYIT_MODEL_STORE")
+CURRENT_FILE = "CURRENT"
+WATCH_INTERVAL = 5.0
+KEEP_SNAPSHOTS = 3
+LEGACY_SVD_ARRAYS = ("pu", "qi", "bu", "bi")
+
+
+def store_enabled() -> bool:
+    return bool(MODEL_STORE_DIR)
+
+
+def current_snapshot_version(store_dir: str = None) -> Optional[str]:
+    try:
+        with open(os.path.join(store_dir or MODEL_STORE_DIR, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def write_snapshot(store_dir: str, model, vectorizer, game_features: Dict[str, List[str]]) -> str:
+    version = time.strftime("%Y%m%d%H%M%S") + f"-{os.getpid()}"
+    tmp_dir = os.path.join(store_dir, f".{version}.tmp")
+    os.makedirs(tmp_dir)
+    catalog = as_catalog(game_features)
+    with open(os.path.join(tmp_dir, "catalog.json"), "w", encoding="utf-8") as f:
+        json.dump({"game_ids": catalog.game_ids, "vocab": catalog.vocabulary}, f)
+    np.save(os.path.join(tmp_dir, "catalog_indptr.npy"), catalog.offsets)
+    np.save(os.path.join(tmp_dir, "catalog_indices.npy"), catalog.features)
+    light_model = copy.copy(model)
+    for name in model.array_names:
+        np.save(os.path.join(tmp_dir, f"cf_{name}.npy"), np.ascontiguousarray(getattr(model, name)))
+        setattr(light_model, name, None)
+    with open(os.path.join(tmp_dir, "model.pkl"), "wb") as f:
+        pickle.dump(light_model, f)
+    with open(os.path.join(tmp_dir, "tfidf.pkl"), "wb") as f:
+        pickle.dump(vectorizer, f)
+    os.replace(tmp_dir, os.path.join(store_dir, version))
+    pointer_tmp = os.path.join(store_dir, f".{CURRENT_FILE}.tmp")
+    with open(pointer_tmp, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(pointer_tmp, os.path.join(store_dir, CURRENT_FILE))
+    prune_snapshots(store_dir, version)
+    return version
+
+
+def prune_snapshots(store_dir: str, current: str):
+    versions = sorted(
+        name for name in os.listdir(store_dir)
+        if not name.startswith(".") and os.path.isdir(os.path.join(store_dir, name))
+    )
+    for name in versions[:-KEEP_SNAPSHOTS]:
+        if name != current:
+            shutil.rmtree(os.path.join(store_dir, name), ignore_errors=True)
+
+
+def read_snapshot(store_dir: str, version: str):
+    path = os.path.join(store_dir, version)
+    with open(os.path.join(path, "model.pkl"), "rb") as f:
+        model = pickle.load(f)
+    if hasattr(model, "array_names"):
+        for name in model.array_names:
+            setattr(model, name, np.load(os.path.join(path, f"cf_{name}.npy"), mmap_mode="r"))
+    else:
+        for name in LEGACY_SVD_ARRAYS:
+            setattr(model, name, np.load(os.path.join(path, f"svd_{name}.npy"), mmap_mode="r"))
+        model = recommend.as_collaborative_engine(model)
+    with open(os.path.join(path, "tfidf.pkl"), "rb") as f:
+        vectorizer = pickle.load(f)
+    with open(os.path.join(path, "catalog.json"), "r", encoding="utf-8") as f:
+        catalog = json.load(f)
+    indptr = np.load(os.path.join(path, "catalog_indptr.npy"), mmap_mode="r")
+    indices = np.load(os.path.join(path, "catalog_indices.npy"), mmap_mode="r")
+    return model, vectorizer, Catalog(catalog["game_ids"], catalog["vocab"], indptr, indices)
+
+
+async def publish_snapshot() -> Optional[str]:
+    if not store_enabled():
+        return None
+    model = await recommend.load_model()
+    vectorizer = await recommend.load_tfidf()
+    game_features = await recommend.data_source.get_game_features()
+    if model is None or vectorizer is None or not game_features:
+        return None
+    os.makedirs(MODEL_STORE_DIR, exist_ok=True)
+    version = await asyncio.to_thread(write_snapshot, MODEL_STORE_DIR, model, vectorizer, game_features)
+    logger.info(f"Published model snapshot {version}")
+    await activate_snapshot(version)
+    return version
+
+
+async def activate_snapshot(version: str):
+    model, vectorizer, game_features = await asyncio.to_thread(read_snapshot, MODEL_STORE_DIR, version)
+    recommend.activate_serving_state(model, vectorizer, game_features, version)
+    logger.info(f"Serving model snapshot {version}")
+    try:
+        await recommend.warm_serving_state()
+    except Exception as e:
+        logger.error(f"Error while warming caches for snapshot {version}: {str(e)}")
+
+
+async def watch_snapshots():
+    while True:
+        try:
+            version = current_snapshot_version()
+            if version and version != recommend.serving_version:
+                await activate_snapshot(version)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error while switching model snapshot: {str(e)}")
+        await asyncio.sleep(WATCH_INTERVAL)
@@ -0,0 +1,125 @@
+from collections import OrderedDict
+import os
+import psycopg
+import secrets
+import time
+from typing import List, Optional, Tuple
+from Try_It_bd import db_connect
+
+
+RANKING_TTL_SECONDS = 15 * 60
+RANKING_MAX_ENTRIES = 10000
+RANKING_CURSOR_DB = os.environ.get("TRYIT_RANKING_CURSOR_DB", "1") == "1"
+
+
+async def create_ranking_cursor_table():
+    if not RANKING_CURSOR_DB:
+        return
+    try:
+        conn = await db_connect()
+        async with conn:
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                                  CREATE TABLE IF NOT EXISTS try_it."ranking_cursor" (
+                                      "token" TEXT PRIMARY KEY,
+                                      "login" TEXT NOT NULL,
+                                      "game_ids" TEXT[] NOT NULL,
+                                      "scores" REAL[] NOT NULL,
+                                      "expires_at" TIMESTAMP NOT NULL
+                                  )
+                                  """)
+                await cur.execute("""
+                                  CREATE INDEX IF NOT EXISTS ranking_cursor_expires_idx ON try_it."ranking_cursor" ("expires_at")
+                                  """)
+                await conn.commit()
+    except psycopg.Error as err:
+        print("DB error in create_ranking_cursor_table:", err)
+
+
+async def store_ranking(token: str, owner: str, ranking: List[Tuple[str, float]], ttl: float):
+    try:
+        conn = await db_connect()
+        async with conn:
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                                  DELETE FROM try_it."ranking_cursor" WHERE "expires_at" < now()
+                                  """)
+                await cur.execute("""
+                                  INSERT INTO try_it."ranking_cursor" ("token", "login", "game_ids", "scores", "expires_at")
+                                  VALUES (%s, %s, %s, %s, now() + make_interval(secs => %s))
+                                  """, (token, owner, [game_id for game_id, _ in ranking],
+                                        [float(score) for _, score in ranking], ttl, ))
+                await conn.commit()
+    except psycopg.Error as err:
+        print("DB error in store_ranking:", err)
+
+
+async def load_ranking(token: str):
+    try:
+        conn = await db_connect()
+        async with conn:
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                                  SELECT "login", "game_ids", "scores",
+                                      EXTRACT(EPOCH FROM "expires_at" - now())::FLOAT AS "remaining"
+                                  FROM try_it."ranking_cursor"
+                                  WHERE "token" = %s AND "expires_at" > now()
+                                  """, (token, ))
+                return await cur.fetchone()
+    except psycopg.Error as err:
+        print("DB error in load_ranking:", err)
+        return None
+
+
+class RankingStore:
+    def __init__(self, ttl: float = RANKING_TTL_SECONDS, max_entries: int = RANKING_MAX_ENTRIES, persist: bool = RANKING_CURSOR_DB):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.persist = persist
+        self.entries = OrderedDict()
+
+    def evict(self):
+        now = time.monotonic()
+        while self.entries:
+            token, (expires_at, _, _) = next(iter(self.entries.items()))
+            if expires_at > now and len(self.entries) <= self.max_entries:
+                break
+            del self.entries[token]
+
+    async def put(self, owner: str, ranking: List[Tuple[str, float]]) -> str:
+        token = secrets.token_urlsafe(12)
+        self.entries[token] = (time.monotonic() + self.ttl, owner, ranking)
+        self.evict()
+        if self.persist:
+            await store_ranking(token, owner, ranking, self.ttl)
+        return token
+
+    async def get(self, token: str, owner: str) -> Optional[List[Tuple[str, float]]]:
+        self.evict()
+        entry = self.entries.get(token)
+        if entry is not None and entry[0] <= time.monotonic():
+            del self.entries[token]
+            entry = None
+        if entry is None and self.persist:
+            row = await load_ranking(token)
+            if row is not None:
+                entry = (time.monotonic() + row["remaining"], row["login"], list(zip(row["game_ids"], row["scores"])))
+                self.entries[token] = entry
+                self.evict()
+        if entry is None or entry[1] != owner:
+            return None
+        return entry[2]
+
+
+def encode_cursor(token: str, offset: int) -> str:
+    return f"{token}.{offset}"
+
+
+def decode_cursor(cursor: str) -> Optional[Tuple[str, int]]:
+    token, _, offset = cursor.rpartition(".")
+    if not token or not offset.isdigit():
+        return None
+    return token, int(offset)
+
+
+ranking_store = RankingStore()
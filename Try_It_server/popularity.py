@@ -0,0 +1,72 @@
+import heapq
+import numpy as np
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from catalog import Catalog, RATING_PREFIX
+from profiles import playtime_weights
+
+
+FALLBACK_K = 500
+UNRATED = 50.0
+
+
+class FallbackRankings:
+    def __init__(self, version, catalog: Catalog, interactions: List[Tuple[str, str, float]], k: int = FALLBACK_K):
+        self.version = version
+        self.catalog = catalog
+        index = catalog.index
+        rows = np.fromiter((index.get(gid, -1) for _, gid, _ in interactions), dtype=np.int64, count=len(interactions))
+        playtime = np.fromiter((pt for _, _, pt in interactions), dtype=np.float32, count=len(interactions))
+        known = rows >= 0
+        players = np.bincount(rows[known], weights=playtime_weights(playtime[known]), minlength=len(catalog))
+        ratings = np.nan_to_num(catalog.ratings, nan=UNRATED)
+        scores = np.log1p(players) * ratings / 100.0
+        order = np.lexsort((-ratings, -scores))
+        top_score = scores[order[0]] if len(order) and scores[order[0]] > 0 else 1.0
+        self.rows = order
+        self.game_ids = [catalog.game_ids[row] for row in order]
+        self.scores = (scores[order] / top_score).tolist()
+        self.by_feature: Dict[str, List[int]] = {}
+        for rank, row in enumerate(order):
+            for feature in catalog.lower_terms(row):
+                if feature.startswith(RATING_PREFIX):
+                    continue
+                ranking = self.by_feature.setdefault(feature, [])
+                if len(ranking) < k:
+                    ranking.append(rank)
+        self.k = k
+
+    def candidates(self, group: List[str]) -> Iterable[int]:
+        previous = None
+        for rank in heapq.merge(*(self.by_feature.get(feature, []) for feature in group)):
+            if rank != previous:
+                yield rank
+            previous = rank
+
+    def top(
+        self,
+        n: int,
+        tags: Optional[List[str]] = None,
+        genres: Optional[List[str]] = None,
+        categories: Optional[List[str]] = None,
+        excluded: Optional[Set[str]] = None
+    ) -> List[Tuple[str, float]]:
+        excluded = excluded or set()
+        groups = [[value.lower() for value in group] for group in (tags, genres, categories) if group]
+        if groups:
+            groups.sort(key=lambda group: sum(len(self.by_feature.get(feature, [])) for feature in group))
+            ranks = self.candidates(groups[0])
+        else:
+            ranks = range(min(self.k, len(self.game_ids)))
+        result = []
+        for rank in ranks:
+            gid = self.game_ids[rank]
+            if gid in excluded:
+                continue
+            if len(groups) > 1:
+                features = self.catalog.lower_terms(self.rows[rank])
+                if not all(any(value in features for value in group) for group in groups[1:]):
+                    continue
+            result.append((gid, self.scores[rank]))
+            if len(result) == n:
+                break
+        return result
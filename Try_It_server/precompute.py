@@ -0,0 +1,113 @@
+import psycopg
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+from Try_It_bd import db_connect, get_registered_user_libraries
+from metrics import cache_lookup
+from batch import BATCH_BLOCK_SIZE, stream_batch_recommendations
+from recommend import (
+    get_cached_model,
+    get_cached_tfidf,
+    get_model_version,
+    logger,
+)
+
+
+PRECOMPUTE_N = 100
+PRECOMPUTE_WORKERS = int(os.environ.get("TRYIT_PRECOMPUTE_WORKERS", 1))
+
+
+async def create_precomputed_table():
+    try:
+        conn = await db_connect()
+        async with conn:
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                                  CREATE TABLE IF NOT EXISTS try_it."precomputed_recommendation" (
+                                      "SteamID64" TEXT PRIMARY KEY,
+                                      "model_version" TEXT NOT NULL,
+                                      "game_ids" TEXT[] NOT NULL,
+                                      "scores" REAL[] NOT NULL,
+                                      "computed_at" TIMESTAMP NOT NULL DEFAULT now()
+                                  )
+                                  """)
+                await conn.commit()
+    except psycopg.Error as err:
+        print("DB error in create_precomputed_table:", err)
+
+
+async def precompute_rows(
+    steamids: List[str],
+    libraries: Dict[str, List[Tuple[str, float]]],
+    n: int = PRECOMPUTE_N,
+    block_size: int = BATCH_BLOCK_SIZE
+) -> List[Tuple[str, List[str], List[float]]]:
+    rows = []
+    async for steamid, recommendations in stream_batch_recommendations(
+        steamids, 2 * n, libraries=libraries, workers=PRECOMPUTE_WORKERS, block_size=block_size
+    ):
+        rows.append((steamid, [game_id for game_id, _ in recommendations], [float(score) for _, score in recommendations]))
+    return rows
+
+
+async def precompute_recommendations(n: int = PRECOMPUTE_N, block_size: int = BATCH_BLOCK_SIZE):
+    model_version = get_model_version()
+    if get_cached_model() is None or get_cached_tfidf() is None or model_version is None:
+        logger.info("Skipping precompute, models are not built yet")
+        return
+    libraries = {str(steamid): games for steamid, games in (await get_registered_user_libraries()).items()}
+    if not libraries:
+        return
+    started = time.perf_counter()
+    rows = await precompute_rows(list(libraries), libraries, n, block_size)
+    logger.info(f"Precomputed recommendations for {len(rows)} users in {time.perf_counter() - started:.1f}s")
+    await create_precomputed_table()
+    conn = await db_connect()
+    async with conn:
+        async with conn.cursor() as cur:
+            await cur.executemany("""
+                                  INSERT INTO try_it."precomputed_recommendation"
+                                  ("SteamID64", "model_version", "game_ids", "scores", "computed_at")
+                                  VALUES (%s, %s, %s, %s, now())
+                                  ON CONFLICT ("SteamID64") DO UPDATE SET
+                                  "model_version" = EXCLUDED."model_version",
+                                  "game_ids" = EXCLUDED."game_ids",
+                                  "scores" = EXCLUDED."scores",
+                                  "computed_at" = EXCLUDED."computed_at"
+                                  """, [(uid, model_version, game_ids, scores) for uid, game_ids, scores in rows])
+            await conn.commit()
+
+
+async def get_precomputed_recommendations(steamid64: str, login: str, n: int = PRECOMPUTE_N) -> Optional[List[Tuple[str, float]]]:
+    model_version = get_model_version()
+    if model_version is None:
+        return None
+    try:
+        conn = await db_connect()
+        async with conn:
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                                  SELECT p."game_ids", p."scores",
+                                      ARRAY(SELECT "GameID" FROM try_it."wishlist" WHERE "login" = %s) AS wishlist,
+                                      ARRAY(SELECT "GameID" FROM try_it."hidden" WHERE "login" = %s) AS blacklist
+                                  FROM try_it."precomputed_recommendation" p
+                                  WHERE p."SteamID64" = %s AND p."model_version" = %s
+                                  """, (login, login, str(steamid64), model_version, ))
+                row = await cur.fetchone()
+    except psycopg.Error as err:
+        print("DB error in get_precomputed_recommendations:", err)
+        return None
+    cache_lookup("precomputed", row is not None)
+    if row is None:
+        return None
+    excluded_games = set(row["wishlist"]) | set(row["blacklist"])
+    result = [
+        (game_id, score) for game_id, score in zip(row["game_ids"], row["scores"])
+        if game_id not in excluded_games
+    ][:n]
+    if result:
+        min_final = result[-1][1]
+        max_final = result[0][1]
+        final_range = max_final - min_final if max_final != min_final else 1.0
+        result = [(game_id, (score - min_final) / final_range) for game_id, score in result]
+    return result
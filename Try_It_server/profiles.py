@@ -0,0 +1,93 @@
+import numpy as np
+import scipy.sparse as sp
+import os
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+
+PROFILE_CACHE_SIZE = int(os.environ.get("TRYIT_PROFILE_CACHE_SIZE", 10000))
+PLAYTIME_SCALE = 60.0
+
+
+def playtime_weights(playtime: np.ndarray) -> np.ndarray:
+    return 1.0 + np.log1p(np.maximum(np.asarray(playtime, dtype=np.float32), 0.0) / PLAYTIME_SCALE)
+
+
+class ContentCatalog:
+    def __init__(self, version: int, catalog, matrix: sp.csr_matrix):
+        self.version = version
+        self.catalog = catalog
+        self.index = catalog.index
+        self.matrix = matrix
+
+    def rows(self, game_ids: List[str]) -> np.ndarray:
+        return np.fromiter((self.index.get(gid, -1) for gid in game_ids), dtype=np.int64, count=len(game_ids))
+
+    def profile(self, games: List[Tuple[str, float]]) -> Optional[sp.csr_matrix]:
+        rows = self.rows([game_id for game_id, _ in games])
+        known = rows >= 0
+        if not known.any():
+            return None
+        weights = playtime_weights([playtime for _, playtime in games])[known]
+        return sp.csr_matrix(weights[None, :]) @ self.matrix[rows[known]]
+
+    def scores(self, profile: sp.csr_matrix, games) -> np.ndarray:
+        return self.group_scores([profile], games)[0]
+
+    def group_scores(self, profiles: List[sp.csr_matrix], games) -> np.ndarray:
+        vectors = sp.vstack(profiles).toarray()
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+        rows = games.codes if games.base is self.catalog else self.rows(games.game_ids)
+        scores = np.zeros((len(profiles), len(rows)), dtype=np.float32)
+        known = rows >= 0
+        scores[:, known] = (self.matrix @ vectors.T)[rows[known]].T
+        return scores
+
+
+class UserProfile:
+    __slots__ = ("version", "vector", "games", "pending")
+
+    def __init__(self, version: int, vector: Optional[sp.csr_matrix], games: set):
+        self.version = version
+        self.vector = vector
+        self.games = games
+        self.pending = []
+
+
+class ProfileStore:
+    def __init__(self, max_size: int = PROFILE_CACHE_SIZE):
+        self.max_size = max_size
+        self.profiles: "OrderedDict[str, UserProfile]" = OrderedDict()
+
+    def get(self, steamid: str, library: List[Tuple[str, float]], catalog: ContentCatalog) -> Optional[sp.csr_matrix]:
+        steamid = str(steamid)
+        profile = self.profiles.get(steamid)
+        if profile is None or profile.version != catalog.version or len(profile.games) + len(profile.pending) < len(library):
+            profile = UserProfile(catalog.version, catalog.profile(library), {game_id for game_id, _ in library})
+            self.profiles[steamid] = profile
+            if len(self.profiles) > self.max_size:
+                self.profiles.popitem(last=False)
+        else:
+            self.profiles.move_to_end(steamid)
+            self.apply_pending(profile, catalog)
+        return profile.vector
+
+    def apply_pending(self, profile: UserProfile, catalog: ContentCatalog):
+        added = [(game_id, playtime) for game_id, playtime in profile.pending if game_id not in profile.games]
+        profile.pending = []
+        profile.games.update(game_id for game_id, _ in added)
+        delta = catalog.profile(added) if added else None
+        if delta is not None:
+            profile.vector = delta if profile.vector is None else profile.vector + delta
+
+    def add_games(self, steamid: str, games: List[Tuple[str, float]]):
+        profile = self.profiles.get(str(steamid))
+        if profile is not None:
+            profile.pending.extend(games)
+
+    def clear(self):
+        self.profiles.clear()
+
+
+profile_store = ProfileStore()
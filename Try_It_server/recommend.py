@@ -3,6 +3,7 @@ from Try_It_bd import (
     get_user_game_interactions, 
     get_game_features, 
     get_user_games_ids,
+    get_user_libraries,
     get_wishlist_from_db,
     get_blacklist_from_db,
 )
@@ -12,9 +13,19 @@ import asyncio
 import pandas as pd
 from surprise import SVD, Dataset, Reader
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 import logging
+import time
+import os
 from functools import lru_cache
+from als import confidence_matrix, fit_als, fold_in, regularized_gram
+from profiles import ContentCatalog, profile_store
+from factors import ItemFactors
+from ann import ANNIndex
+from popularity import FallbackRankings
+from catalog import Catalog, as_catalog
+from single_flight import single_flight
+from metrics import stage_seconds, timed_stage, cache_lookup
+from tracing import span, open_spans
 from typing import List, Dict, Tuple, Optional, Set
 
 
@@ -23,6 +34,20 @@ logger = logging.getLogger(__name__)
 MODEL_PATH = "model.pkl"
 TFIDF_PATH = "tfidf.pkl"
 UPDATE_INTERVAL = 24 * 60 * 60
+COLLAB_ENGINE = os.environ.get("TRYIT_COLLAB_ENGINE", "svd")
+SVD_REGULARIZATION = 0.02
+ALS_FACTORS = int(os.environ.get("TRYIT_ALS_FACTORS", 64))
+ALS_ITERATIONS = int(os.environ.get("TRYIT_ALS_ITERATIONS", 15))
+ALS_REGULARIZATION = float(os.environ.get("TRYIT_ALS_REGULARIZATION", 0.05))
+ALS_ALPHA = float(os.environ.get("TRYIT_ALS_ALPHA", 2.0))
+ALS_EPSILON = 60.0
+FUSION_METHOD = os.environ.get("TRYIT_FUSION_METHOD", "weighted")
+COLLAB_WEIGHT = float(os.environ.get("TRYIT_COLLAB_WEIGHT", 0.5))
+CONTENT_WEIGHT = float(os.environ.get("TRYIT_CONTENT_WEIGHT", 0.5))
+RANK_FUSION_K = 60
+FACTOR_PRECISION = os.environ.get("TRYIT_FACTOR_PRECISION", "float32")
+ANN_CANDIDATES = int(os.environ.get("TRYIT_ANN_CANDIDATES", 0))
+ANN_MIN_GAMES = int(os.environ.get("TRYIT_ANN_MIN_GAMES", 50000))
 MULTIPLAYER_CATEGORIES = [
     "Co-op",
     "LAN Co-op",
@@ -32,10 +57,26 @@ MULTIPLAYER_CATEGORIES = [
     "Online Co-op",
     "Online PvP"
 ]
+PARTY_CATEGORIES = [
+    "LAN Co-op",
+    "LAN PvP",
+    "MMO",
+    "Multi-player",
+    "Online Co-op",
+    "Online PvP"
+]
+GROUP_STRATEGIES = ("average", "least_misery", "max_coverage")
+GROUP_APPROVAL_K = 100
 cached_model = None
 cached_tfidf = None
 cached_game_features = None
 cached_filtered_games = None
+serving_version = None
+cached_content_catalog = None
+content_version = 0
+cached_fallback_rankings = None
+cached_item_factors = None
+cached_ann_index = None
 
 
 def identity_tokenizer(x):
@@ -54,14 +95,213 @@ def filter_games_by_criteria(
 ) -> Dict[str, List[str]]:
     if not (tags or genres or categories):
         return game_features
-    filtered_games = {}
-    for gid, features in game_features.items():
-        features_lower = [f.lower() for f in features]
-        if (not tags or any(tag.lower() in features_lower for tag in tags)) and \
-           (not genres or any(genre.lower() in features_lower for genre in genres)) and \
-           (not categories or any(category.lower() in features_lower for category in categories)):
-            filtered_games[gid] = features
-    return filtered_games
+    return as_catalog(game_features).filter(tags, genres, categories)
+
+
+def index_lookup(mapping: Dict, keys: List) -> np.ndarray:
+    return np.fromiter((mapping.get(key, -1) for key in keys), dtype=np.int64, count=len(keys))
+
+
+def gather_rows(array: np.ndarray, inner: np.ndarray) -> np.ndarray:
+    result = np.zeros((len(inner), ) + array.shape[1:], dtype=np.result_type(array.dtype, np.float32))
+    known = inner >= 0
+    result[known] = array[inner[known]]
+    return result
+
+
+def played_interactions(interactions: List[Tuple[str, str, float]], game_ids: List[str]) -> pd.DataFrame:
+    df = pd.DataFrame(interactions, columns=['user_id', 'game_id', 'playtime'])
+    return df[df['game_id'].isin(set(game_ids)) & (df['playtime'] > 0)]
+
+
+class SVDEngine:
+    name = "svd"
+    array_names = ("pu", "qi", "bu", "bi")
+    clip = (0.0, 1.0)
+
+    def __init__(self):
+        self.user_ids = {}
+        self.item_ids = {}
+        self.global_mean = 0.0
+        self.pu = self.qi = self.bu = self.bi = None
+
+    @classmethod
+    def from_surprise(cls, model, dtype=np.float32):
+        engine = cls()
+        engine.user_ids = dict(model.trainset._raw2inner_id_users)
+        engine.item_ids = dict(model.trainset._raw2inner_id_items)
+        engine.global_mean = model.trainset.global_mean
+        for name in cls.array_names:
+            setattr(engine, name, np.asarray(getattr(model, name), dtype=dtype))
+        return engine
+
+    @classmethod
+    def fit(cls, interactions: List[Tuple[str, str, float]], game_ids: List[str]):
+        model = cls.fit_surprise(interactions, game_ids)
+        return cls.from_surprise(model) if model is not None else None
+
+    @staticmethod
+    def fit_surprise(interactions: List[Tuple[str, str, float]], game_ids: List[str]):
+        df = pd.DataFrame(interactions, columns=['user_id', 'game_id', 'playtime'])
+        df['normalized_playtime'] = df.groupby('user_id')['playtime'].transform(
+            lambda x: (x - x.min()) / (x.max() - x.min()) if x.max() != x.min() else 0.5
+        )
+        df = df[df['game_id'].isin(set(game_ids))]
+        if df.empty:
+            return None
+        reader = Reader(rating_scale=(0, 1))
+        data = Dataset.load_from_df(df[['user_id', 'game_id', 'normalized_playtime']], reader)
+        model = SVD(n_factors=100, n_epochs=20, lr_all=0.005, reg_all=SVD_REGULARIZATION)
+        model.fit(data.build_full_trainset())
+        return model
+
+    def user_index(self, user_ids: List) -> np.ndarray:
+        return index_lookup(self.user_ids, user_ids)
+
+    def item_index(self, game_ids: List[str]) -> np.ndarray:
+        return index_lookup(self.item_ids, game_ids)
+
+    def score(self, user_inner: np.ndarray, item_inner: np.ndarray) -> np.ndarray:
+        scores = (
+            self.global_mean
+            + gather_rows(self.bu, user_inner)[:, None]
+            + gather_rows(self.bi, item_inner)[None, :]
+            + gather_rows(self.pu, user_inner) @ gather_rows(self.qi, item_inner).T
+        )
+        return np.clip(scores, 0, 1, out=scores)
+
+    def user_terms(self, user_inner: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        return gather_rows(self.pu, user_inner), self.global_mean + gather_rows(self.bu, user_inner)
+
+    def item_terms(self, item_inner: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        return gather_rows(self.qi, item_inner), gather_rows(self.bi, item_inner)
+
+    def fold_in(self, interactions: List[Tuple[int, str, float]]) -> Tuple[np.ndarray, np.ndarray]:
+        played = [(gid, playtime) for _, gid, playtime in interactions if playtime > 0]
+        playtime = np.array([minutes for _, minutes in played], dtype=np.float64)
+        known = np.array([gid in self.item_ids for gid, _ in played], dtype=bool)
+        if not known.any():
+            vectors, offsets = self.user_terms(np.array([-1]))
+            return vectors[0], offsets[0]
+        spread = playtime.max() - playtime.min()
+        ratings = (playtime - playtime.min()) / spread if spread > 0 else np.full(len(playtime), 0.5)
+        items = np.array([self.item_ids[gid] for gid, _ in played if gid in self.item_ids], dtype=np.int64)
+        design = np.hstack((np.asarray(self.qi[items], dtype=np.float64), np.ones((len(items), 1))))
+        targets = ratings[known] - self.global_mean - np.asarray(self.bi[items], dtype=np.float64)
+        system = design.T @ design + SVD_REGULARIZATION * len(items) * np.eye(design.shape[1])
+        solution = np.linalg.solve(system, design.T @ targets)
+        return solution[:-1].astype(self.pu.dtype), self.pu.dtype.type(self.global_mean + solution[-1])
+
+    def item_vectors(self, item_inner: np.ndarray) -> np.ndarray:
+        return gather_rows(self.qi, item_inner)
+
+
+class ImplicitALSEngine:
+    name = "als"
+    array_names = ("user_factors", "item_factors")
+    clip = None
+
+    def __init__(self):
+        self.user_ids = {}
+        self.item_ids = {}
+        self.user_factors = self.item_factors = None
+        self.gram = None
+
+    @classmethod
+    def fit(cls, interactions: List[Tuple[str, str, float]], game_ids: List[str]):
+        df = played_interactions(interactions, game_ids)
+        if df.empty:
+            return None
+        user_codes, user_ids = pd.factorize(df['user_id'])
+        item_codes, item_ids = pd.factorize(df['game_id'])
+        confidence = confidence_matrix(
+            user_codes, item_codes, df['playtime'].to_numpy(), (len(user_ids), len(item_ids)), ALS_ALPHA, ALS_EPSILON
+        )
+        engine = cls()
+        engine.user_ids = {uid: idx for idx, uid in enumerate(user_ids)}
+        engine.item_ids = {gid: idx for idx, gid in enumerate(item_ids)}
+        engine.user_factors, engine.item_factors = fit_als(
+            confidence, ALS_FACTORS, ALS_ITERATIONS, ALS_REGULARIZATION
+        )
+        engine.gram = regularized_gram(engine.item_factors, ALS_REGULARIZATION)
+        return engine
+
+    def user_index(self, user_ids: List) -> np.ndarray:
+        return index_lookup(self.user_ids, user_ids)
+
+    def item_index(self, game_ids: List[str]) -> np.ndarray:
+        return index_lookup(self.item_ids, game_ids)
+
+    def score(self, user_inner: np.ndarray, item_inner: np.ndarray) -> np.ndarray:
+        return gather_rows(self.user_factors, user_inner) @ gather_rows(self.item_factors, item_inner).T
+
+    def user_terms(self, user_inner: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        vectors = gather_rows(self.user_factors, user_inner)
+        return vectors, np.zeros(len(vectors), dtype=vectors.dtype)
+
+    def item_terms(self, item_inner: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        vectors = gather_rows(self.item_factors, item_inner)
+        return vectors, np.zeros(len(vectors), dtype=vectors.dtype)
+
+    def fold_in(self, interactions: List[Tuple[int, str, float]]) -> Tuple[np.ndarray, np.ndarray]:
+        owned = [(self.item_ids[gid], playtime) for _, gid, playtime in interactions if gid in self.item_ids and playtime > 0]
+        items = np.array([idx for idx, _ in owned], dtype=np.int64)
+        playtime = np.array([minutes for _, minutes in owned], dtype=np.float64)
+        user_vector = fold_in(items, 1.0 + ALS_ALPHA * np.log1p(playtime / ALS_EPSILON), self.item_factors, self.gram)
+        return user_vector, np.float32(0.0)
+
+    def item_vectors(self, item_inner: np.ndarray) -> np.ndarray:
+        return gather_rows(self.item_factors, item_inner)
+
+
+COLLAB_ENGINES = {engine.name: engine for engine in (SVDEngine, ImplicitALSEngine)}
+
+
+def as_collaborative_engine(model):
+    if model is None or hasattr(model, "array_names"):
+        return model
+    return SVDEngine.from_surprise(model)
+
+
+def top_n_excluding(game_ids: List[str], scores: np.ndarray, excluded: Set[str], n: int) -> List[Tuple[str, float]]:
+    k = min(len(scores), n + len(excluded))
+    if k == 0:
+        return []
+    top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+    top = top[np.argsort(-scores[top], kind="stable")]
+    return [(game_ids[idx], float(scores[idx])) for idx in top if game_ids[idx] not in excluded][:n]
+
+
+class DatabaseSource:
+    get_user_game_interactions = staticmethod(get_user_game_interactions)
+    get_user_libraries = staticmethod(get_user_libraries)
+    get_game_features = staticmethod(get_game_features)
+    get_user_games_ids = staticmethod(get_user_games_ids)
+    get_wishlist_from_db = staticmethod(get_wishlist_from_db)
+    get_blacklist_from_db = staticmethod(get_blacklist_from_db)
+
+
+data_source = DatabaseSource()
+
+
+def invalidate_content_catalog():
+    global cached_content_catalog, content_version
+    cached_content_catalog = None
+    content_version += 1
+    profile_store.clear()
+
+
+def invalidate_game_features():
+    global cached_game_features, cached_filtered_games
+    cached_game_features = None
+    cached_filtered_games = None
+    invalidate_content_catalog()
+
+
+def set_data_source(source):
+    global data_source
+    data_source = source
+    invalidate_game_features()
 
 
 async def get_filtered_game_features(
@@ -71,16 +311,18 @@ async def get_filtered_game_features(
 ) -> Dict[str, List[str]]:
     global cached_game_features, cached_filtered_games
     if not (tags or genres or categories):
+        cache_lookup("game_features", cached_game_features is not None)
         if cached_game_features is None:
-            cached_game_features = await get_game_features()
+            cached_game_features = as_catalog(await single_flight.do("game_features", data_source.get_game_features))
         return cached_game_features
     cache_key = (tuple(sorted(tags or [])), tuple(sorted(genres or [])), tuple(sorted(categories or [])))
     if cached_filtered_games is None:
         cached_filtered_games = {}
+    cache_lookup("filtered_games", cache_key in cached_filtered_games)
     if cache_key in cached_filtered_games:
         return cached_filtered_games[cache_key]
     if cached_game_features is None:
-        cached_game_features = await get_game_features()
+        cached_game_features = as_catalog(await single_flight.do("game_features", data_source.get_game_features))
     filtered_games = filter_games_by_criteria(cached_game_features, tags, genres, categories)
     cached_filtered_games[cache_key] = filtered_games
     return filtered_games
@@ -92,7 +334,7 @@ def get_cached_model():
     if cached_model is None:
         try:
             with open(MODEL_PATH, "rb") as f:
-                cached_model = pickle.load(f)
+                cached_model = as_collaborative_engine(pickle.load(f))
         except FileNotFoundError:
             return None
     return cached_model
@@ -110,6 +352,192 @@ def get_cached_tfidf():
     return cached_tfidf
 
 
+async def load_model():
+    if cached_model is not None:
+        return cached_model
+    return await single_flight.do("load_model", asyncio.to_thread, get_cached_model)
+
+
+async def load_tfidf():
+    if cached_tfidf is not None:
+        return cached_tfidf
+    return await single_flight.do("load_tfidf", asyncio.to_thread, get_cached_tfidf)
+
+
+def get_model_version() -> Optional[str]:
+    if serving_version is not None:
+        return serving_version
+    try:
+        return f"{os.path.getmtime(MODEL_PATH):.6f}:{os.path.getmtime(TFIDF_PATH):.6f}"
+    except OSError:
+        return None
+
+
+def set_cached_model(model):
+    global cached_model
+    cached_model = model
+    get_cached_model.cache_clear()
+
+
+def set_cached_tfidf(vectorizer):
+    global cached_tfidf
+    cached_tfidf = vectorizer
+    get_cached_tfidf.cache_clear()
+    invalidate_content_catalog()
+
+
+def activate_serving_state(model, vectorizer, game_features: Dict[str, List[str]], version: str):
+    global cached_game_features, cached_filtered_games, serving_version
+    set_cached_model(model)
+    set_cached_tfidf(vectorizer)
+    cached_game_features = as_catalog(game_features)
+    cached_filtered_games = None
+    serving_version = version
+    invalidate_content_catalog()
+
+
+async def train_collaborative_model(interactions: List[Tuple[str, str, float]], game_ids: List[str]):
+    engine = COLLAB_ENGINES[COLLAB_ENGINE]
+    logger.info(f"Training new collaborative model ({engine.name})")
+    new_model = await asyncio.to_thread(engine.fit, interactions, game_ids)
+    if new_model is None:
+        return None
+    with open(MODEL_PATH, "wb") as f:
+        pickle.dump(new_model, f)
+    set_cached_model(new_model)
+    return new_model
+
+
+def new_tfidf_vectorizer() -> TfidfVectorizer:
+    return TfidfVectorizer(
+        analyzer='word',
+        tokenizer=identity_tokenizer,
+        preprocessor=identity_preprocessor,
+        token_pattern=None
+    )
+
+
+async def train_tfidf(all_features: List[List[str]]):
+    logger.info("Creating new TF-IDF vectorizer")
+    new_vectorizer = new_tfidf_vectorizer()
+    await asyncio.to_thread(new_vectorizer.fit, all_features)
+    with open(TFIDF_PATH, "wb") as f:
+        pickle.dump(new_vectorizer, f)
+    set_cached_tfidf(new_vectorizer)
+    return new_vectorizer
+
+
+async def get_collaborative_model(game_ids: List[str], force_update: bool = False):
+    model = await load_model()
+    if force_update or model is None or model.name != COLLAB_ENGINE:
+        all_interactions = await data_source.get_user_game_interactions()
+        if not all_interactions:
+            return None
+        return await single_flight.do("train_collaborative_model", train_collaborative_model, all_interactions, game_ids)
+    logger.info("Using cached collaborative model")
+    return model
+
+
+async def get_content_vectorizer(filtered_games: Dict[str, List[str]], force_update: bool = False):
+    vectorizer = await load_tfidf()
+    if force_update or vectorizer is None:
+        all_features = [filtered_games[gid] for gid in filtered_games]
+        return await single_flight.do("train_tfidf", train_tfidf, all_features)
+    logger.info("Using cached TF-IDF vectorizer")
+    return vectorizer
+
+
+async def train_models():
+    filtered_games = await get_filtered_game_features()
+    if not filtered_games:
+        invalidate_game_features()
+        raise RuntimeError("Game catalog is empty, cannot train models")
+    model, vectorizer = await asyncio.gather(
+        get_collaborative_model(filtered_games.game_ids, force_update=True),
+        get_content_vectorizer(filtered_games, force_update=True)
+    )
+    if model is None:
+        logger.info("No user interactions yet, collaborative model not trained")
+    return model, vectorizer
+
+
+def catalog_item_factors(model, filtered_games) -> ItemFactors:
+    global cached_item_factors
+    base = filtered_games.base
+    if cached_item_factors is None or cached_item_factors[0] is not model or cached_item_factors[1] is not base:
+        items = ItemFactors.from_model(model, model.item_index(base.game_ids), FACTOR_PRECISION)
+        cached_item_factors = (model, base, items)
+    items = cached_item_factors[2]
+    return items if filtered_games is base else items.view(filtered_games.codes)
+
+
+def collaborative_user_terms(model, user_id, interactions: List[Tuple[int, str, float]]) -> Tuple[np.ndarray, np.ndarray]:
+    user_inner = model.user_index([user_id])
+    if user_inner[0] >= 0:
+        return model.user_terms(user_inner)
+    vector, offset = model.fold_in(interactions)
+    return vector[None, :], np.atleast_1d(offset)
+
+
+def collaborative_scores(model, items: ItemFactors, user_id, interactions: List[Tuple[int, str, float]]) -> np.ndarray:
+    return np.asarray(items.scores(*collaborative_user_terms(model, user_id, interactions))[0], dtype=np.float32)
+
+
+def build_content_catalog(vectorizer, game_features: Catalog, version: int) -> ContentCatalog:
+    matrix = vectorizer.transform([game_features.terms(row) for row in game_features.codes]).astype(np.float32).tocsr()
+    return ContentCatalog(version, game_features, matrix)
+
+
+async def get_content_catalog(vectorizer) -> ContentCatalog:
+    global cached_content_catalog
+    if cached_content_catalog is not None and cached_content_catalog.version == content_version:
+        return cached_content_catalog
+    version = content_version
+    game_features = await get_filtered_game_features()
+    catalog = await single_flight.do(
+        ("content_catalog", version), asyncio.to_thread, build_content_catalog, vectorizer, game_features, version
+    )
+    if version == content_version:
+        cached_content_catalog = catalog
+    return catalog
+
+
+def build_ann_index(version, model, content: ContentCatalog) -> ANNIndex:
+    vectors = offsets = None
+    if model is not None:
+        vectors, offsets = model.item_terms(model.item_index(content.catalog.game_ids))
+    return ANNIndex.build(version, content.catalog, vectors, offsets, content.matrix)
+
+
+async def get_ann_index(model, content: ContentCatalog) -> Optional[ANNIndex]:
+    global cached_ann_index
+    if not ANN_CANDIDATES or len(content.catalog) < ANN_MIN_GAMES:
+        return None
+    version = (get_model_version(), content.version)
+    if cached_ann_index is None or cached_ann_index.version != version:
+        started = time.perf_counter()
+        cached_ann_index = await single_flight.do(
+            ("ann_index", version), asyncio.to_thread, build_ann_index, version, model, content
+        )
+        logger.info(f"Built ANN index for {len(content.catalog)} games in {time.perf_counter() - started:.1f}s")
+    return cached_ann_index
+
+
+async def prepare_ann_index() -> Optional[ANNIndex]:
+    vectorizer = await load_tfidf()
+    if vectorizer is None:
+        return None
+    return await get_ann_index(await load_model(), await get_content_catalog(vectorizer))
+
+
+async def warm_serving_state():
+    vectorizer = await load_tfidf()
+    if vectorizer is not None:
+        await get_content_catalog(vectorizer)
+    await get_fallback_rankings()
+    await prepare_ann_index()
+
+
 async def collaborative_recommendations(
     user_id: Optional[int] = None,
     n: Optional[int] = 10,
@@ -119,44 +547,25 @@ async def collaborative_recommendations(
     interactions: Optional[List[Tuple[int, str, float]]] = None,
     filtered_games: Optional[Dict[str, List[str]]] = None,
     force_update: bool = False,
+    user_library: Optional[List[Tuple[str, float]]] = None,
 ) -> List[Tuple[str, float]]:
     try:
         if filtered_games is None:
             filtered_games = await get_filtered_game_features(tags, genres, categories)
             if not filtered_games:
                 return []
-        if interactions is None:
-            interactions = await get_user_game_interactions()
-            if not interactions:
-                return []
-        if user_id is None:
-            user_id = -1
-        df = pd.DataFrame(interactions, columns=['user_id', 'game_id', 'playtime'])
-        df['normalized_playtime'] = df.groupby('user_id')['playtime'].transform(
-            lambda x: (x - x.min()) / (x.max() - x.min()) if x.max() != x.min() else 0.5
-        )
-        df = df[df['game_id'].isin(filtered_games.keys())]
-        if df.empty:
+        filtered_games = as_catalog(filtered_games)
+        game_ids = filtered_games.game_ids
+        model = await get_collaborative_model(game_ids, force_update)
+        if force_update or model is None:
             return []
-        reader = Reader(rating_scale=(0, 1))
-        data = Dataset.load_from_df(df[['user_id', 'game_id', 'normalized_playtime']], reader)
-        trainset = data.build_full_trainset()
-        model = get_cached_model()
-        if (force_update or model is None):
-            logger.info("Training new collaborative model")
-            new_model = SVD(n_factors=100, n_epochs=20, lr_all=0.005, reg_all=0.02)
-            new_model.fit(trainset)
-            with open(MODEL_PATH, "wb") as f:
-                pickle.dump(new_model, f)
-            model = new_model
-        else:
-            logger.info("Using cached collaborative model")
-        if not force_update:
-            user_items = set(item for item, _ in trainset.ur[trainset.to_inner_uid(user_id)])
-            testset = [(user_id, game_id, 0) for game_id in filtered_games.keys() 
-                    if game_id not in user_items]
-            predictions = model.test(testset)
-            return sorted(predictions, key=lambda x: x.est, reverse=True)[:n]
+        if interactions is None:
+            if user_library is None:
+                user_library = await data_source.get_user_games_ids(user_id) if user_id is not None else []
+            interactions = [(user_id, game_id, playtime) for game_id, playtime in user_library]
+        scores = collaborative_scores(model, catalog_item_factors(model, filtered_games), user_id, interactions)
+        owned = {game_id for _, game_id, _ in interactions}
+        return top_n_excluding(game_ids, scores, owned, n)
     except Exception as e:
         logger.error(f"Error in collaborative recommendations: {str(e)}")
         return []
@@ -176,38 +585,17 @@ async def content_recommendations(
             filtered_games = await get_filtered_game_features(tags, genres, categories)
             if not filtered_games:
                 return []
-        
-        vectorizer = get_cached_tfidf()
-        if (force_update or vectorizer is None):
-            logger.info("Creating new TF-IDF vectorizer")
-            new_vectorizer = TfidfVectorizer(
-                analyzer='word',
-                tokenizer=identity_tokenizer,
-                preprocessor=identity_preprocessor,
-                token_pattern=None
-            )
-            all_features = [filtered_games[gid] for gid in filtered_games]
-            new_vectorizer.fit(all_features)
-            with open(TFIDF_PATH, "wb") as f:
-                pickle.dump(new_vectorizer, f)
-            vectorizer = new_vectorizer
-        else:
-            logger.info("Using cached TF-IDF vectorizer")
-        if not force_update:
-            user_games_filtered = [gid for gid in user_games if gid in filtered_games]
-            if not user_games_filtered:
-                return []
-            all_features = [filtered_games[gid] for gid in filtered_games]
-            tfidf_matrix = vectorizer.transform(all_features).toarray()
-            user_games_indices = [list(filtered_games.keys()).index(gid) for gid in user_games_filtered]
-            user_profile = np.mean(tfidf_matrix[user_games_indices], axis=0)
-            cosine_similarities = cosine_similarity(user_profile.reshape(1, -1), tfidf_matrix).flatten()
-            recommendations = [
-                (game_id, float(score))
-                for idx, (game_id, score) in enumerate(zip(filtered_games.keys(), cosine_similarities))
-                if game_id not in user_games
-            ]
-            return sorted(recommendations, key=lambda x: x[1], reverse=True)[:n]    
+        vectorizer = await get_content_vectorizer(filtered_games, force_update)
+        if force_update:
+            return []
+        catalog = await get_content_catalog(vectorizer)
+        library = [entry if isinstance(entry, tuple) else (entry, 0.0) for entry in user_games or []]
+        profile = catalog.profile(library)
+        if profile is None:
+            return []
+        filtered_games = as_catalog(filtered_games)
+        owned = {game_id for game_id, _ in library}
+        return top_n_excluding(filtered_games.game_ids, catalog.scores(profile, filtered_games), owned, n)
     except Exception as e:
         logger.error(f"Error in content recommendations: {str(e)}")
         return []
@@ -221,105 +609,184 @@ async def hybrid_recommendations(
     genres: Optional[List[str]] = None, 
     categories: Optional[List[str]] = None,
     friend_id: Optional[int] = None
+) -> List[Tuple[str, float]]:
+    request_key = (
+        "hybrid_recommendations", login, user_id, n,
+        tuple(sorted(tags or [])), tuple(sorted(genres or [])), tuple(sorted(categories or [])), friend_id
+    )
+    with span("hybrid_recommendations", n=n, tags=tags, genres=genres, categories=categories, friend_id=friend_id):
+        return await single_flight.do(
+            request_key, compute_hybrid_recommendations, login, user_id, n, tags, genres, categories, friend_id
+        )
+
+
+async def compute_hybrid_recommendations(
+    login: str,
+    user_id: int, 
+    n: int = 10, 
+    tags: Optional[List[str]] = None, 
+    genres: Optional[List[str]] = None, 
+    categories: Optional[List[str]] = None,
+    friend_id: Optional[int] = None
 ) -> List[Tuple[str, float]]:
     try:
         if friend_id is not None:
-            filtered_games = await get_multiplayer_games()
+            filtered_games = await timed_stage("catalog_filter", get_multiplayer_games())
             if not filtered_games:
                 return []
             user_games, friend_games = await asyncio.gather(
-                get_user_games_ids(user_id),
-                get_user_games_ids(friend_id)
+                timed_stage("db_user_games", data_source.get_user_games_ids(user_id)),
+                timed_stage("db_friend_games", data_source.get_user_games_ids(friend_id))
             )
             friend_interactions = None
+            friend_library = friend_games
             if friend_games and isinstance(friend_games[0], tuple):
                 friend_interactions = [(-1, game_id, playtime) for game_id, playtime in friend_games]
                 friend_games = [game_id for game_id, _ in friend_games]
-            print(f"friend:{friend_interactions}")
-            virtual_interactions = await create_virtual_user_interactions(user_id, friend_id, friend_interactions)
-            print(f"virtual:{virtual_interactions}")
-            blacklist = await get_blacklist_from_db(login)
-            user_game_ids = [game_id for game_id, _ in user_games] if user_games and isinstance(user_games[0], tuple) else user_games
-            excluded_games = set(user_game_ids) | set(friend_games)
-            if blacklist:
-                excluded_games |= set(blacklist)
-            collab_recs, content_recs = await asyncio.gather(
-                asyncio.wait_for(collaborative_recommendations(interactions=virtual_interactions, filtered_games=filtered_games, n=n), timeout=10.0),
-                asyncio.wait_for(content_recommendations(user_games=user_game_ids + friend_games, filtered_games=filtered_games, n=n), timeout=10.0)
+            interactions = await timed_stage(
+                "virtual_user", create_virtual_user_interactions(user_id, friend_id, friend_interactions)
             )
+            blacklist = await timed_stage("db_blacklist", data_source.get_blacklist_from_db(login))
+            user_game_ids = [game_id for game_id, _ in user_games] if user_games and isinstance(user_games[0], tuple) else user_games
+            excluded_games = set(user_game_ids) | set(friend_games) | set(blacklist or [])
+            library_ids = user_game_ids + friend_games
+            fallback_filters = (None, None, MULTIPLAYER_CATEGORIES)
+            scored_user = None
         else:
-            filtered_games = await get_filtered_game_features(tags, genres, categories)
+            filtered_games = await timed_stage("catalog_filter", get_filtered_game_features(tags, genres, categories))
             if not filtered_games:
                 return []
             user_games, wishlist, blacklist = await asyncio.gather(
-                get_user_games_ids(user_id),
-                get_wishlist_from_db(login),
-                get_blacklist_from_db(login)
+                timed_stage("db_user_games", data_source.get_user_games_ids(user_id)),
+                timed_stage("db_wishlist", data_source.get_wishlist_from_db(login)),
+                timed_stage("db_blacklist", data_source.get_blacklist_from_db(login))
             )
             user_game_ids = [game_id for game_id, _ in user_games] if user_games and isinstance(user_games[0], tuple) else user_games
-            excluded_games = set(user_game_ids)
-            if wishlist:
-                excluded_games |= set(wishlist)
-            if blacklist:
-                excluded_games |= set(blacklist)
-            collab_recs, content_recs = await asyncio.gather(
-                asyncio.wait_for(collaborative_recommendations(user_id, n, tags, genres, categories), timeout=10.0),
-                asyncio.wait_for(content_recommendations(user_games=user_game_ids, n=n, tags=tags, genres=genres, categories=categories), timeout=10.0)
-            )
-        if not collab_recs and not content_recs:
-            return []
-        COLLAB_WEIGHT = 0.5
-        CONTENT_WEIGHT = 0.5
-        final_scores = {}
-        if collab_recs:
-            collab_scores = [rec.est for rec in collab_recs]
-            min_collab = min(collab_scores)
-            max_collab = max(collab_scores)
-            collab_range = max_collab - min_collab if max_collab != min_collab else 1.0
-            for rec in collab_recs:
-                normalized_score = ((rec.est - min_collab) / collab_range) * COLLAB_WEIGHT
-                if rec.iid in excluded_games:
-                    continue
-                final_scores[rec.iid] = normalized_score
-        if content_recs:
-            content_scores = [score for _, score in content_recs]
-            min_content = min(content_scores)
-            max_content = max(content_scores)
-            content_range = max_content - min_content if max_content != min_content else 1.0
-            for game_id, score in content_recs:
-                if game_id in excluded_games:
-                    continue
-                normalized_score = ((score - min_content) / content_range) * CONTENT_WEIGHT
-                if game_id in final_scores:
-                    final_scores[game_id] += normalized_score
-                else:
-                    final_scores[game_id] = normalized_score
-        result = sorted(final_scores.items(), key=lambda x: x[1], reverse=True)[:n]
-        if result:
-            final_scores = [score for _, score in result]
-            min_final = min(final_scores)
-            max_final = max(final_scores)
-            final_range = max_final - min_final if max_final != min_final else 1.0
-            result = [
-                (game_id, ((score - min_final) / final_range))
-                for game_id, score in result
-            ]
-        return result
+            excluded_games = set(user_game_ids) | set(wishlist or []) | set(blacklist or [])
+            interactions = [(user_id, game_id, playtime) for game_id, playtime in user_games]
+            library_ids = user_game_ids
+            fallback_filters = (tags, genres, categories)
+            friend_library = None
+            scored_user = user_id
+        all_games = await get_filtered_game_features()
+        if not any(game_id in all_games for game_id in library_ids):
+            return await fallback_recommendations(n, excluded_games, *fallback_filters)
+        game_ids = filtered_games.game_ids
+        model, vectorizer = await asyncio.gather(
+            timed_stage("collaborative_model", asyncio.wait_for(get_collaborative_model(game_ids), timeout=10.0)),
+            timed_stage("content_model", asyncio.wait_for(get_content_vectorizer(filtered_games), timeout=10.0))
+        )
+        catalog = await timed_stage("content_catalog", get_content_catalog(vectorizer))
+        user_terms = None
+        if model is not None:
+            with stage_seconds.time(stage="collaborative"), span("collaborative"):
+                user_terms = collaborative_user_terms(model, scored_user, interactions)
+        with stage_seconds.time(stage="content"), span("content"):
+            profile = profile_store.get(user_id, user_games, catalog)
+            if friend_library:
+                friend_profile = catalog.profile(friend_library)
+                if friend_profile is not None:
+                    profile = friend_profile if profile is None else profile + friend_profile
+        index = await timed_stage("ann_index", get_ann_index(model, catalog))
+        if index is not None:
+            with stage_seconds.time(stage="ann"), span("ann"):
+                user_vector = user_terms[0][0] if user_terms is not None else None
+                filtered_games = index.narrow(filtered_games, user_vector, profile, ANN_CANDIDATES)
+                game_ids = filtered_games.game_ids
+        collab = None
+        if user_terms is not None:
+            with stage_seconds.time(stage="collaborative"), span("collaborative"):
+                collab = np.asarray(catalog_item_factors(model, filtered_games).scores(*user_terms)[0], dtype=np.float32)
+        with stage_seconds.time(stage="content"), span("content"):
+            content = catalog.scores(profile, filtered_games) if profile is not None else None
+        if collab is None and content is None:
+            return await fallback_recommendations(n, excluded_games, *fallback_filters)
+        with stage_seconds.time(stage="fusion"):
+            return fuse_scores(game_ids, collab, content, exclusion_mask(filtered_games, excluded_games), n, FUSION_METHOD)
     except asyncio.TimeoutError:
-        logger.error("Recommendation generation timed out")
+        logger.error(f"Recommendation generation timed out, pending: {open_spans()}")
         return []
     except Exception as e:
         logger.error(f"Error in hybrid recommendations: {str(e)}")
         return []
 
 
+async def build_fallback_rankings(version) -> FallbackRankings:
+    game_features, interactions = await asyncio.gather(
+        get_filtered_game_features(),
+        data_source.get_user_game_interactions()
+    )
+    return await asyncio.to_thread(FallbackRankings, version, game_features, interactions or [])
+
+
+async def get_fallback_rankings() -> FallbackRankings:
+    global cached_fallback_rankings
+    version = (get_model_version(), content_version)
+    if cached_fallback_rankings is None or cached_fallback_rankings.version != version:
+        cached_fallback_rankings = await single_flight.do(("fallback_rankings", version), build_fallback_rankings, version)
+    return cached_fallback_rankings
+
+
+async def fallback_recommendations(
+    n: int,
+    excluded_games: Set[str],
+    tags: Optional[List[str]] = None,
+    genres: Optional[List[str]] = None,
+    categories: Optional[List[str]] = None
+) -> List[Tuple[str, float]]:
+    rankings = await timed_stage("fallback", get_fallback_rankings())
+    return rankings.top(n, tags, genres, categories, excluded_games)
+
+
+def exclusion_mask(filtered_games, excluded_games: Set[str]) -> np.ndarray:
+    mask = np.zeros(len(filtered_games.base), dtype=bool)
+    mask[filtered_games.base.lookup(excluded_games)] = True
+    return mask[filtered_games.codes]
+
+
+def min_max_scores(scores: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    low, high = scores[valid].min(), scores[valid].max()
+    return (scores - low) / (high - low if high > low else 1.0)
+
+
+def reciprocal_rank_scores(scores: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    order = np.argsort(-np.where(valid, scores, -np.inf), kind="stable")
+    ranks = np.empty(len(scores), dtype=np.float32)
+    ranks[order] = np.arange(1, len(scores) + 1, dtype=np.float32)
+    return 1.0 / (RANK_FUSION_K + ranks)
+
+
+def fuse_scores(
+    game_ids: List[str],
+    collab: Optional[np.ndarray],
+    content: Optional[np.ndarray],
+    excluded: np.ndarray,
+    n: int,
+    method: str = FUSION_METHOD
+) -> List[Tuple[str, float]]:
+    normalize = reciprocal_rank_scores if method == "rank" else min_max_scores
+    fused = np.zeros(len(game_ids), dtype=np.float32)
+    candidates = np.zeros(len(game_ids), dtype=bool)
+    for scores, weight in ((collab, COLLAB_WEIGHT), (content, CONTENT_WEIGHT)):
+        if scores is None:
+            continue
+        valid = ~excluded & np.isfinite(scores)
+        if not valid.any():
+            continue
+        fused += np.where(valid, normalize(scores, valid) * weight, 0.0).astype(np.float32)
+        candidates |= valid
+    k = min(n, int(candidates.sum()))
+    if k == 0:
+        return []
+    fused[~candidates] = -np.inf
+    top = np.argpartition(-fused, k - 1)[:k]
+    top = top[np.argsort(-fused[top], kind="stable")]
+    top_scores = min_max_scores(fused[top], np.ones(k, dtype=bool))
+    return [(game_ids[idx], float(score)) for idx, score in zip(top, top_scores)]
+
+
 async def get_multiplayer_games() -> Dict[str, List[str]]:
-    game_features = await get_game_features()
-    multiplayer_games = {}
-    for game_id, features in game_features.items():
-        if any(category in features for category in MULTIPLAYER_CATEGORIES):
-            multiplayer_games[game_id] = features
-    return multiplayer_games
+    return await get_filtered_game_features(categories=MULTIPLAYER_CATEGORIES)
 
 
 async def create_virtual_user_interactions(
@@ -327,7 +794,7 @@ async def create_virtual_user_interactions(
     friend_id: int,
     friend_interactions: Optional[List[Tuple[int, str, float]]] = None
 ) -> List[Tuple[int, str, float]]:
-    all_interactions = await get_user_game_interactions()
+    all_interactions = await data_source.get_user_game_interactions()
     user_interactions = [(uid, gid, pt) for uid, gid, pt in all_interactions if uid == user_id]
     if friend_interactions is None:
         friend_interactions = [(uid, gid, pt) for uid, gid, pt in all_interactions if uid == friend_id]
@@ -345,3 +812,112 @@ async def create_virtual_user_interactions(
         else:
             virtual_interactions.append((virtual_user_id, game_id, friend_games[game_id] / 2))
     return virtual_interactions
+
+
+def normalize_member_scores(scores: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    low = np.where(valid, scores, np.inf).min(axis=1, keepdims=True)
+    high = np.where(valid, scores, -np.inf).max(axis=1, keepdims=True)
+    spread = np.where(high > low, high - low, 1.0)
+    return np.where(valid, (scores - low) / spread, 0.0).astype(np.float32)
+
+
+def aggregate_group_scores(scores: np.ndarray, valid: np.ndarray, strategy: str) -> np.ndarray:
+    normalized = normalize_member_scores(scores, valid)
+    if strategy == "least_misery":
+        return normalized.min(axis=0)
+    mean = normalized.mean(axis=0)
+    if strategy == "max_coverage":
+        k = min(GROUP_APPROVAL_K, int(valid[0].sum()))
+        threshold = -np.partition(-normalized, k - 1, axis=1)[:, k - 1:k]
+        coverage = (normalized >= threshold).mean(axis=0)
+        return coverage + mean / (len(scores) + 1)
+    return mean
+
+
+def group_collaborative_scores(
+    model,
+    items: ItemFactors,
+    members: List[str],
+    libraries: Dict[str, List[Tuple[str, float]]]
+) -> np.ndarray:
+    user_inner = model.user_index(members)
+    vectors, offsets = model.user_terms(user_inner)
+    for row in np.flatnonzero(user_inner < 0):
+        interactions = [(members[row], game_id, playtime) for game_id, playtime in libraries[members[row]]]
+        vectors[row], offsets[row] = model.fold_in(interactions)
+    return np.asarray(items.scores(vectors, offsets), dtype=np.float32)
+
+
+def collaborative_members(model, members: List[str], libraries: Dict[str, List[Tuple[str, float]]]) -> np.ndarray:
+    known = model.user_index(members) >= 0
+    return np.array([
+        known[row] or any(game_id in model.item_ids and playtime > 0 for game_id, playtime in libraries[steamid])
+        for row, steamid in enumerate(members)
+    ], dtype=bool)
+
+
+async def group_recommendations(
+    login: str,
+    steamids: List[str],
+    n: int = 10,
+    strategy: str = "average"
+) -> List[Tuple[str, float]]:
+    request_key = ("group_recommendations", login, tuple(sorted(steamids)), n, strategy)
+    with span("group_recommendations", n=n, size=len(steamids), strategy=strategy):
+        return await single_flight.do(request_key, compute_group_recommendations, login, steamids, n, strategy)
+
+
+async def compute_group_recommendations(
+    login: str,
+    steamids: List[str],
+    n: int = 10,
+    strategy: str = "average"
+) -> List[Tuple[str, float]]:
+    try:
+        filtered_games = await timed_stage("catalog_filter", get_filtered_game_features(categories=PARTY_CATEGORIES))
+        if not filtered_games:
+            return []
+        libraries, blacklist = await asyncio.gather(
+            timed_stage("db_group_libraries", data_source.get_user_libraries(steamids)),
+            timed_stage("db_blacklist", data_source.get_blacklist_from_db(login))
+        )
+        excluded_games = set(blacklist or [])
+        for library in libraries.values():
+            excluded_games.update(game_id for game_id, _ in library)
+        all_games = await get_filtered_game_features()
+        members = [
+            steamid for steamid in steamids
+            if any(game_id in all_games for game_id, _ in libraries.get(steamid, []))
+        ]
+        if not members:
+            return await fallback_recommendations(n, excluded_games, categories=PARTY_CATEGORIES)
+        game_ids = filtered_games.game_ids
+        model, vectorizer = await asyncio.gather(
+            timed_stage("collaborative_model", asyncio.wait_for(get_collaborative_model(game_ids), timeout=10.0)),
+            timed_stage("content_model", asyncio.wait_for(get_content_vectorizer(filtered_games), timeout=10.0))
+        )
+        catalog = await timed_stage("content_catalog", get_content_catalog(vectorizer))
+        excluded = exclusion_mask(filtered_games, excluded_games)
+        valid = np.broadcast_to(~excluded, (len(members), len(game_ids)))
+        if not valid.any():
+            return []
+        collab = None
+        informed = collaborative_members(model, members, libraries) if model is not None else None
+        if informed is not None and informed.any():
+            with stage_seconds.time(stage="collaborative"), span("collaborative"):
+                scores = group_collaborative_scores(
+                    model, catalog_item_factors(model, filtered_games), [members[row] for row in np.flatnonzero(informed)], libraries
+                )
+                collab = aggregate_group_scores(scores, valid[informed], strategy)
+        with stage_seconds.time(stage="content"), span("content"):
+            profiles = [profile_store.get(steamid, libraries[steamid], catalog) for steamid in members]
+            scores = catalog.group_scores(profiles, filtered_games)
+            content = aggregate_group_scores(scores, valid, strategy)
+        with stage_seconds.time(stage="fusion"):
+            return fuse_scores(game_ids, collab, content, excluded, n, FUSION_METHOD)
+    except asyncio.TimeoutError:
+        logger.error(f"Group recommendation timed out, pending: {open_spans()}")
+        return []
+    except Exception as e:
+        logger.error(f"Error in group recommendations: {str(e)}")
+        return []
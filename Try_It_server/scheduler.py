@@ -0,0 +1,233 @@
+import psycopg
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from Try_It_bd import db_connect
+from job_queue import insert_job
+
+
+SCHEDULER_ENABLED = os.environ.get("TRYIT_SCHEDULER_ENABLED", "1") == "1"
+SCHEDULER_INTERVAL = 60.0
+SCHEDULER_LOCK_KEY = 7315001
+SEARCH_DAYS = 366
+FIELD_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+FINISHED_STATUSES = ("done", "failed")
+scheduler_task = None
+
+
+def parse_cron_field(field: str, low: int, high: int) -> List[int]:
+    values = set()
+    for part in field.split(","):
+        expr, _, step = part.partition("/")
+        if expr == "*":
+            start, end = low, high
+        elif "-" in expr:
+            start, end = (int(value) for value in expr.split("-"))
+        else:
+            start = end = int(expr)
+            if step:
+                end = high
+        if start < low or end > high or start > end:
+            raise ValueError(f"Cron field '{field}' is out of range {low}-{high}")
+        values.update(range(start, end + 1, int(step) if step else 1))
+    return sorted(values)
+
+
+class CronSchedule:
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: '{expression}'")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            parse_cron_field(field, low, high) for field, (low, high) in zip(fields, FIELD_RANGES)
+        )
+        self.weekdays = sorted({weekday % 7 for weekday in self.weekdays})
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    def matches_day(self, day: datetime) -> bool:
+        if day.month not in self.months:
+            return False
+        day_match = day.day in self.days
+        weekday_match = (day.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day_match and weekday_match
+        return day_match or weekday_match
+
+    def next_after(self, moment: datetime) -> Optional[datetime]:
+        moment = moment.replace(second=0, microsecond=0)
+        for offset in range(SEARCH_DAYS):
+            day = moment.replace(hour=0, minute=0) + timedelta(days=offset)
+            if not self.matches_day(day):
+                continue
+            for hour in self.hours:
+                for minute in self.minutes:
+                    candidate = day.replace(hour=hour, minute=minute)
+                    if candidate > moment:
+                        return candidate
+        return None
+
+    def last_at_or_before(self, moment: datetime) -> Optional[datetime]:
+        moment = moment.replace(second=0, microsecond=0)
+        for offset in range(SEARCH_DAYS):
+            day = moment.replace(hour=0, minute=0) - timedelta(days=offset)
+            if not self.matches_day(day):
+                continue
+            for hour in reversed(self.hours):
+                for minute in reversed(self.minutes):
+                    candidate = day.replace(hour=hour, minute=minute)
+                    if candidate <= moment:
+                        return candidate
+        return None
+
+
+class Schedule:
+    def __init__(self, name: str, cron: str, window_minutes: int, stages: List[str]):
+        self.name = name
+        self.cron = CronSchedule(cron)
+        self.window = timedelta(minutes=window_minutes)
+        self.stages = stages
+
+    def current_window(self, now: datetime) -> Optional[datetime]:
+        start = self.cron.last_at_or_before(now)
+        if start is not None and now < start + self.window:
+            return start
+        return None
+
+
+SCHEDULES = [
+    Schedule(
+        "weekly_refresh",
+        os.environ.get("TRYIT_REFRESH_CRON", "0 4 * * 1"),
+        int(os.environ.get("TRYIT_REFRESH_WINDOW_MINUTES", 240)),
+        ["refresh_users", "sync_catalog", "build_models", "similar_games", "precompute"]
+    )
+]
+
+
+async def create_schedule_table():
+    try:
+        conn = await db_connect()
+        async with conn:
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                                  CREATE TABLE IF NOT EXISTS try_it."schedule_run" (
+                                      "name" TEXT PRIMARY KEY,
+                                      "window_start" TIMESTAMP NOT NULL,
+                                      "enqueued_at" TIMESTAMP NOT NULL DEFAULT now(),
+                                      "job_ids" BIGINT[] NOT NULL
+                                  )
+                                  """)
+                await conn.commit()
+    except psycopg.Error as err:
+        print("DB error in create_schedule_table:", err)
+
+
+async def start_scheduled_run(schedule: Schedule, window_start: datetime) -> Optional[List[int]]:
+    conn = await db_connect()
+    async with conn:
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT pg_try_advisory_xact_lock(%s) AS locked", (SCHEDULER_LOCK_KEY, ))
+            if not (await cur.fetchone())["locked"]:
+                return None
+            await cur.execute("""
+                              SELECT r."window_start",
+                                  ARRAY(
+                                      SELECT j."status" FROM try_it."job" j WHERE j."jobID" = ANY(r."job_ids")
+                                  ) AS statuses
+                              FROM try_it."schedule_run" r WHERE r."name" = %s
+                              """, (schedule.name, ))
+            last_run = await cur.fetchone()
+            if last_run and last_run["window_start"] >= window_start:
+                return None
+            if last_run and any(status not in FINISHED_STATUSES for status in last_run["statuses"]):
+                print(f"Scheduled run {schedule.name} skipped, previous run is still in progress")
+                return None
+            job_ids, previous = [], None
+            for stage in schedule.stages:
+                previous = await insert_job(cur, stage, {"schedule": schedule.name}, depends_on=previous)
+                job_ids.append(previous)
+            await cur.execute("""
+                              INSERT INTO try_it."schedule_run" ("name", "window_start", "enqueued_at", "job_ids")
+                              VALUES (%s, %s, now(), %s)
+                              ON CONFLICT ("name") DO UPDATE SET
+                              "window_start" = EXCLUDED."window_start",
+                              "enqueued_at" = EXCLUDED."enqueued_at",
+                              "job_ids" = EXCLUDED."job_ids"
+                              """, (schedule.name, window_start, job_ids, ))
+            await conn.commit()
+            return job_ids
+
+
+async def scheduler_tick(now: datetime = None):
+    now = now or datetime.now()
+    for schedule in SCHEDULES:
+        window_start = schedule.current_window(now)
+        if window_start is None:
+            continue
+        job_ids = await start_scheduled_run(schedule, window_start)
+        if job_ids:
+            print(f"Scheduled run {schedule.name} for window {window_start} enqueued jobs {job_ids}")
+
+
+async def scheduler_loop():
+    while True:
+        try:
+            await scheduler_tick()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error in scheduler: {str(e)}")
+        await asyncio.sleep(SCHEDULER_INTERVAL)
+
+
+async def start_scheduler():
+    global scheduler_task
+    if not SCHEDULER_ENABLED or scheduler_task is not None:
+        return
+    await create_schedule_table()
+    scheduler_task = asyncio.create_task(scheduler_loop())
+
+
+async def get_scheduler_status(now: datetime = None) -> List[Dict]:
+    now = now or datetime.now()
+    runs = {}
+    try:
+        conn = await db_connect()
+        async with conn:
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                                  SELECT r."name", r."window_start", r."enqueued_at",
+                                      COALESCE(jsonb_agg(jsonb_build_object(
+                                          'job_id', j."jobID", 'stage', j."kind", 'status', j."status",
+                                          'attempts', j."attempts", 'error', j."error",
+                                          'started_at', j."started_at", 'finished_at', j."finished_at"
+                                      ) ORDER BY j."jobID") FILTER (WHERE j."jobID" IS NOT NULL), '[]') AS stages
+                                  FROM try_it."schedule_run" r
+                                  LEFT JOIN try_it."job" j ON j."jobID" = ANY(r."job_ids")
+                                  GROUP BY r."name", r."window_start", r."enqueued_at"
+                                  """)
+                runs = {row["name"]: row for row in await cur.fetchall()}
+    except psycopg.Error as err:
+        print("DB error in get_scheduler_status:", err)
+    status = []
+    for schedule in SCHEDULES:
+        last_run = runs.get(schedule.name)
+        window_start = schedule.current_window(now)
+        status.append({
+            "name": schedule.name,
+            "cron": schedule.cron.expression,
+            "window_minutes": int(schedule.window.total_seconds() // 60),
+            "stages": schedule.stages,
+            "enabled": SCHEDULER_ENABLED,
+            "in_window": window_start is not None,
+            "next_window_start": schedule.cron.next_after(now),
+            "last_run": {
+                "window_start": last_run["window_start"],
+                "enqueued_at": last_run["enqueued_at"],
+                "stages": last_run["stages"]
+            } if last_run else None
+        })
+    return status
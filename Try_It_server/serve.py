@@ -0,0 +1,37 @@
+import argparse
+import asyncio
+import os
+import uvicorn
+
+
+async def preload(refresh: bool):
+    from recommend import train_models, load_model, load_tfidf
+    from model_store import current_snapshot_version, publish_snapshot
+    if current_snapshot_version() and not refresh:
+        return
+    if await load_model() is None or await load_tfidf() is None:
+        await train_models()
+    version = await publish_snapshot()
+    print(f"Preloaded model snapshot {version}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Production entry point: preload a model snapshot and run several workers")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=443)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--model-store", default=os.environ.get("TRYIT_MODEL_STORE", "model_store"))
+    parser.add_argument("--refresh", action="store_true", help="publish a new snapshot even if one exists")
+    parser.add_argument("--ssl-keyfile")
+    parser.add_argument("--ssl-certfile")
+    args = parser.parse_args()
+    os.environ["TRYIT_MODEL_STORE"] = os.path.abspath(args.model_store)
+    asyncio.run(preload(args.refresh))
+    uvicorn.run(
+        "Try_It_server:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        ssl_keyfile=args.ssl_keyfile,
+        ssl_certfile=args.ssl_certfile
+    )
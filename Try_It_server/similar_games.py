@@ -0,0 +1,109 @@
+import numpy as np
+import asyncio
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+from recommend import load_model, load_tfidf, get_filtered_game_features, logger
+
+
+SIMILAR_GAMES_PATH = os.environ.get("TRYIT_SIMILAR_GAMES_PATH", "similar_games.npz")
+SIMILAR_GAMES_K = 50
+SIMILAR_BLOCK_SIZE = 256
+CONTENT_WEIGHT = 0.5
+neighbor_table = None
+
+
+class NeighborTable:
+    def __init__(self, game_ids: np.ndarray, neighbors: np.ndarray, scores: np.ndarray, mtime: float = None):
+        self.game_ids = game_ids.tolist()
+        self.neighbors = neighbors
+        self.scores = scores
+        self.mtime = mtime
+        self.index = {game_id: row for row, game_id in enumerate(self.game_ids)}
+
+    def similar(self, game_id: str, k: int = SIMILAR_GAMES_K) -> Optional[List[Tuple[str, float]]]:
+        row = self.index.get(game_id)
+        if row is None:
+            return None
+        return [
+            (self.game_ids[idx], float(score))
+            for idx, score in zip(self.neighbors[row, :k], self.scores[row, :k])
+        ]
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+def compute_neighbors(
+    model,
+    vectorizer,
+    game_features: Dict[str, List[str]],
+    k: int = SIMILAR_GAMES_K,
+    block_size: int = SIMILAR_BLOCK_SIZE,
+    content_weight: float = CONTENT_WEIGHT
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    game_ids = list(game_features.keys())
+    k = min(k, len(game_ids) - 1)
+    content = vectorizer.transform([game_features[gid] for gid in game_ids]).astype(np.float32).tocsr()
+    factors = normalize_rows(model.item_vectors(model.item_index(game_ids))) if model is not None else None
+    if factors is None:
+        content_weight = 1.0
+    neighbors = np.empty((len(game_ids), k), dtype=np.int32)
+    scores = np.empty((len(game_ids), k), dtype=np.float16)
+    for start in range(0, len(game_ids), block_size):
+        end = min(start + block_size, len(game_ids))
+        similarity = np.ascontiguousarray((content @ (content[start:end].toarray().T * content_weight)).T)
+        if factors is not None:
+            similarity += factors[start:end] @ (factors.T * (1.0 - content_weight))
+        similarity[np.arange(end - start), np.arange(start, end)] = -np.inf
+        top = np.argpartition(similarity, -k, axis=1)[:, -k:]
+        top_scores = np.take_along_axis(similarity, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        neighbors[start:end] = np.take_along_axis(top, order, axis=1)
+        scores[start:end] = np.take_along_axis(top_scores, order, axis=1)
+    return np.asarray(game_ids), neighbors, scores
+
+
+def save_neighbors(path: str, game_ids: np.ndarray, neighbors: np.ndarray, scores: np.ndarray):
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, game_ids=game_ids, neighbors=neighbors, scores=scores)
+    os.replace(tmp_path, path)
+
+
+def load_neighbors(path: str = SIMILAR_GAMES_PATH) -> Optional[NeighborTable]:
+    try:
+        mtime = os.path.getmtime(path)
+        with np.load(path) as data:
+            return NeighborTable(data["game_ids"], data["neighbors"], data["scores"], mtime)
+    except OSError:
+        return None
+
+
+def get_neighbor_table() -> Optional[NeighborTable]:
+    global neighbor_table
+    try:
+        mtime = os.path.getmtime(SIMILAR_GAMES_PATH)
+    except OSError:
+        return neighbor_table
+    if neighbor_table is None or neighbor_table.mtime != mtime:
+        neighbor_table = load_neighbors(SIMILAR_GAMES_PATH) or neighbor_table
+    return neighbor_table
+
+
+async def build_similar_games(k: int = SIMILAR_GAMES_K, block_size: int = SIMILAR_BLOCK_SIZE):
+    global neighbor_table
+    model = await load_model()
+    vectorizer = await load_tfidf()
+    game_features = await get_filtered_game_features()
+    if vectorizer is None or len(game_features) < 2:
+        logger.info("Skipping similar games, TF-IDF vectorizer or catalog is missing")
+        return
+    started = time.perf_counter()
+    game_ids, neighbors, scores = await asyncio.to_thread(
+        compute_neighbors, model, vectorizer, game_features, k, block_size
+    )
+    await asyncio.to_thread(save_neighbors, SIMILAR_GAMES_PATH, game_ids, neighbors, scores)
+    neighbor_table = load_neighbors(SIMILAR_GAMES_PATH)
+    logger.info(f"Built similar games for {len(game_ids)} games in {time.perf_counter() - started:.1f}s")
@@ -3,14 +3,19 @@ import aiohttp
 import re
 import asyncio
 import random
+import os
 
 
-APP_URL = "https://store.steampowered.com/app/"
+APP_URL = os.environ.get("STEAM_STORE_URL", "https://store.steampowered.com") + "/app/"
+REQUEST_DELAY = (
+    float(os.environ.get("STEAM_REQUEST_DELAY_MIN", 1)),
+    float(os.environ.get("STEAM_REQUEST_DELAY_MAX", 2))
+)
 
 
 async def parse_game (app_id):
     try:
-        await asyncio.sleep(random.uniform(1, 2))
+        await asyncio.sleep(random.uniform(*REQUEST_DELAY))
         headers = {
             "User-Agent": "Mozilla/5.0 ((Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36)"    
         }
@@ -0,0 +1,238 @@
+from aiohttp import web
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "steam")
+SYNTHETIC_TAGS = ["Action", "Adventure", "Indie", "RPG", "Strategy", "Simulation", "Puzzle", "Horror", "Open World", "Survival"]
+SYNTHETIC_GENRES = ["Action", "Adventure", "Indie", "RPG", "Strategy", "Casual"]
+SYNTHETIC_FEATURES = ["Single-player", "Multi-player", "Online Co-op", "Online PvP", "Steam Achievements", "Full controller support"]
+STORE_PAGE_TEMPLATE = """<html><body>
+<div class="apphub_AppName">{title}</div>
+<div class="game_header_image_ctn"><img src="{image_url}"></div>
+<div class="game_description_snippet">{description}</div>
+<div class="user_reviews_summary_row">{rating}% of the {reviews} user reviews for this game are positive.</div>
+<b>Genre:</b> <span>{genres}</span>
+{tags}
+{features}
+</body></html>
+"""
+
+
+class SteamStubConfig:
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, rate_limit=0.0, synthetic=False, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.synthetic = synthetic
+        self.random = random.Random(seed)
+
+
+class SteamStub:
+    def __init__(self, config: SteamStubConfig, fixtures_dir: str = FIXTURES_DIR):
+        self.config = config
+        self.fixtures_dir = fixtures_dir
+        self.stats = {"requests": 0, "errors": 0, "throttled": 0}
+        self.tokens = config.rate_limit
+        self.last_refill = time.monotonic()
+
+    def load_json(self, *parts):
+        path = os.path.join(self.fixtures_dir, *parts)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def take_token(self):
+        if not self.config.rate_limit:
+            return True
+        now = time.monotonic()
+        self.tokens = min(self.config.rate_limit, self.tokens + (now - self.last_refill) * self.config.rate_limit)
+        self.last_refill = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    @web.middleware
+    async def conditions(self, request, handler):
+        self.stats["requests"] += 1
+        if not self.take_token():
+            self.stats["throttled"] += 1
+            return web.Response(status=429, headers={"Retry-After": "1"})
+        delay = self.config.latency + self.config.random.uniform(0, self.config.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self.config.error_rate and self.config.random.random() < self.config.error_rate:
+            self.stats["errors"] += 1
+            return web.Response(status=500)
+        return await handler(request)
+
+    async def app_list(self, request):
+        data = self.load_json("app_list.json")
+        if data is None:
+            data = {"applist": {"apps": []}}
+        return web.json_response(data)
+
+    async def player_summaries(self, request):
+        summaries = self.load_json("player_summaries.json") or {}
+        players = []
+        for steamid in request.query.get("steamids", "").split(","):
+            if steamid in summaries:
+                players.append(summaries[steamid])
+            elif self.config.synthetic and steamid:
+                players.append({"steamid": steamid, "personaname": f"player_{steamid[-6:]}"})
+        return web.json_response({"response": {"players": players}})
+
+    async def owned_games(self, request):
+        steamid = request.query.get("steamid", "")
+        data = self.load_json("owned_games", f"{steamid}.json")
+        if data is None:
+            data = {"response": {"game_count": 0, "games": []}}
+            if self.config.synthetic:
+                data = self.synthetic_owned_games(steamid)
+        return web.json_response(data)
+
+    async def friend_list(self, request):
+        steamid = request.query.get("steamid", "")
+        data = self.load_json("friends", f"{steamid}.json")
+        if data is None:
+            data = {"friendslist": {"friends": []}}
+        return web.json_response(data)
+
+    async def store_page(self, request):
+        appid = request.match_info["appid"]
+        path = os.path.join(self.fixtures_dir, "store", f"{appid}.html")
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return web.Response(text=f.read(), content_type="text/html")
+        if self.config.synthetic:
+            return web.Response(text=synthetic_store_page(int(appid)), content_type="text/html")
+        return web.Response(status=404)
+
+    def synthetic_owned_games(self, steamid):
+        app_list = self.load_json("app_list.json") or {"applist": {"apps": []}}
+        apps = [app["appid"] for app in app_list["applist"]["apps"]]
+        rng = random.Random(steamid)
+        owned = rng.sample(apps, min(len(apps), rng.randint(1, 40)))
+        games = [{"appid": appid, "playtime_forever": int(rng.paretovariate(1.2) * 30)} for appid in owned]
+        return {"response": {"game_count": len(games), "games": games}}
+
+    def build_app(self):
+        app = web.Application(middlewares=[self.conditions])
+        app.router.add_get("/ISteamApps/GetAppList/v2/", self.app_list)
+        app.router.add_get("/ISteamUser/GetPlayerSummaries/v0002/", self.player_summaries)
+        app.router.add_get("/IPlayerService/GetOwnedGames/v0001/", self.owned_games)
+        app.router.add_get("/ISteamUser/GetFriendList/v0001/", self.friend_list)
+        app.router.add_get("/app/{appid}/", self.store_page)
+        return app
+
+
+def synthetic_store_page(appid: int) -> str:
+    rng = random.Random(appid)
+    tags = rng.sample(SYNTHETIC_TAGS, rng.randint(2, 6))
+    genres = rng.sample(SYNTHETIC_GENRES, rng.randint(1, 3))
+    features = rng.sample(SYNTHETIC_FEATURES, rng.randint(1, 4))
+    return STORE_PAGE_TEMPLATE.format(
+        title=f"Game {appid}",
+        description=f"Synthetic description for game {appid}.",
+        image_url=f"https://example.invalid/apps/{appid}/header.jpg",
+        rating=rng.randint(20, 99),
+        reviews=rng.randint(10, 100000),
+        genres=", ".join(genres),
+        tags="\n".join(f'<a class="app_tag">{tag}</a>' for tag in tags),
+        features="\n".join(
+            f'<a class="game_area_details_specs_ctn"><div class="label">{feature}</div></a>' for feature in features
+        )
+    )
+
+
+def write_synthetic_fixtures(n_games: int, n_users: int, fixtures_dir: str = FIXTURES_DIR, seed: int = 0):
+    rng = random.Random(seed)
+    os.makedirs(os.path.join(fixtures_dir, "owned_games"), exist_ok=True)
+    os.makedirs(os.path.join(fixtures_dir, "friends"), exist_ok=True)
+    os.makedirs(os.path.join(fixtures_dir, "store"), exist_ok=True)
+    appids = [10 * (i + 1) for i in range(n_games)]
+    steamids = [str(76561198000000000 + i) for i in range(n_users)]
+    with open(os.path.join(fixtures_dir, "app_list.json"), "w", encoding="utf-8") as f:
+        json.dump({"applist": {"apps": [{"appid": appid, "name": f"Game {appid}"} for appid in appids]}}, f)
+    with open(os.path.join(fixtures_dir, "player_summaries.json"), "w", encoding="utf-8") as f:
+        json.dump({steamid: {"steamid": steamid, "personaname": f"player_{i}"} for i, steamid in enumerate(steamids)}, f)
+    for steamid in steamids:
+        owned = rng.sample(appids, min(len(appids), rng.randint(1, 15)))
+        games = [{"appid": appid, "playtime_forever": int(rng.paretovariate(1.2) * 30)} for appid in owned]
+        with open(os.path.join(fixtures_dir, "owned_games", f"{steamid}.json"), "w", encoding="utf-8") as f:
+            json.dump({"response": {"game_count": len(games), "games": games}}, f)
+        friends = [
+            {"steamid": friend, "relationship": "friend", "friend_since": 1500000000}
+            for friend in rng.sample(steamids, min(len(steamids), 3)) if friend != steamid
+        ]
+        with open(os.path.join(fixtures_dir, "friends", f"{steamid}.json"), "w", encoding="utf-8") as f:
+            json.dump({"friendslist": {"friends": friends}}, f)
+    for appid in appids:
+        with open(os.path.join(fixtures_dir, "store", f"{appid}.html"), "w", encoding="utf-8") as f:
+            f.write(synthetic_store_page(appid))
+
+
+async def record_fixtures(steamids, appids, fixtures_dir: str = FIXTURES_DIR):
+    from test_steamAPI import get_app_list, get_games, get_friends, API_KEY, STEAM_API_URL
+    from steam_parser import APP_URL
+    import aiohttp
+    os.makedirs(os.path.join(fixtures_dir, "owned_games"), exist_ok=True)
+    os.makedirs(os.path.join(fixtures_dir, "friends"), exist_ok=True)
+    os.makedirs(os.path.join(fixtures_dir, "store"), exist_ok=True)
+    with open(os.path.join(fixtures_dir, "app_list.json"), "w", encoding="utf-8") as f:
+        json.dump(await get_app_list(), f)
+    summaries = {}
+    async with aiohttp.ClientSession() as session:
+        async with session.get(
+            f"{STEAM_API_URL}/ISteamUser/GetPlayerSummaries/v0002/",
+            params={"key": API_KEY, "steamids": ",".join(steamids)}
+        ) as response:
+            for player in (await response.json())["response"].get("players", []):
+                summaries[player["steamid"]] = player
+        for appid in appids:
+            async with session.get(APP_URL + str(appid) + "/?l=english") as response:
+                if response.status == 200:
+                    with open(os.path.join(fixtures_dir, "store", f"{appid}.html"), "w", encoding="utf-8") as f:
+                        f.write(await response.text())
+    with open(os.path.join(fixtures_dir, "player_summaries.json"), "w", encoding="utf-8") as f:
+        json.dump(summaries, f)
+    for steamid in steamids:
+        with open(os.path.join(fixtures_dir, "owned_games", f"{steamid}.json"), "w", encoding="utf-8") as f:
+            json.dump(await get_games(steamid), f)
+        with open(os.path.join(fixtures_dir, "friends", f"{steamid}.json"), "w", encoding="utf-8") as f:
+            json.dump(await get_friends(steamid), f)
+
+
+async def start_stub(config: SteamStubConfig, host: str = "127.0.0.1", port: int = 8765, fixtures_dir: str = FIXTURES_DIR):
+    stub = SteamStub(config, fixtures_dir)
+    runner = web.AppRunner(stub.build_app())
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    return stub, runner
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local stand-in for the Steam Web API and store pages")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    parser.add_argument("--latency", type=float, default=0.0, help="base response delay, seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra uniform random delay, seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 500")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="requests per second before answering 429, 0 disables")
+    parser.add_argument("--synthetic", action="store_true", help="generate responses for ids missing from the fixtures")
+    parser.add_argument("--generate", nargs=2, type=int, metavar=("GAMES", "USERS"), help="write synthetic fixtures and exit")
+    args = parser.parse_args()
+    if args.generate:
+        write_synthetic_fixtures(args.generate[0], args.generate[1], args.fixtures)
+    else:
+        config = SteamStubConfig(args.latency, args.jitter, args.error_rate, args.rate_limit, args.synthetic)
+        web.run_app(SteamStub(config, args.fixtures).build_app(), host=args.host, port=args.port)
@@ -0,0 +1,195 @@
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from recommend import MULTIPLAYER_CATEGORIES
+
+
+FIRST_APPID = 10
+FIRST_STEAMID = 76561198000000000
+OTHER_CATEGORIES = [
+    "Single-player",
+    "Steam Achievements",
+    "Full controller support",
+    "Steam Trading Cards",
+    "Steam Cloud",
+    "Steam Workshop",
+    "In-App Purchases",
+    "Remote Play Together",
+    "Family Sharing"
+]
+
+
+def zipf_weights(n: int, exponent: float) -> np.ndarray:
+    weights = 1.0 / np.arange(1, n + 1, dtype=np.float64) ** exponent
+    return weights / weights.sum()
+
+
+def sample_ragged(rng: np.random.Generator, counts: np.ndarray, weights: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    owners = np.repeat(np.arange(len(counts), dtype=np.int64), counts)
+    picks = np.searchsorted(np.cumsum(weights), rng.random(len(owners)), side="right")
+    picks = np.minimum(picks, len(weights) - 1)
+    pairs = np.unique(owners * len(weights) + picks)
+    return pairs // len(weights), pairs % len(weights)
+
+
+def generate_catalog(
+    n_games: int,
+    n_tags: int = 400,
+    n_genres: int = 30,
+    mean_tags: int = 15,
+    multiplayer_share: float = 0.35,
+    seed: int = 0
+) -> Dict[str, List[str]]:
+    rng = np.random.default_rng(seed)
+    tag_names = [f"Tag {i}" for i in range(n_tags)]
+    genre_names = [f"Genre {i}" for i in range(n_genres)]
+    tag_games, tag_ids = sample_ragged(
+        rng, rng.poisson(mean_tags, n_games).clip(1, n_tags), zipf_weights(n_tags, 1.0)
+    )
+    genre_games, genre_ids = sample_ragged(
+        rng, rng.integers(1, 4, n_games), zipf_weights(n_genres, 1.2)
+    )
+    tag_bounds = np.searchsorted(tag_games, np.arange(n_games + 1))
+    genre_bounds = np.searchsorted(genre_games, np.arange(n_games + 1))
+    ratings = rng.normal(75, 12, n_games).clip(10, 99).astype(int)
+    multiplayer = rng.random(n_games) < multiplayer_share
+    catalog = {}
+    for idx in range(n_games):
+        features = [f"rating:{ratings[idx]}"]
+        features.extend(tag_names[t] for t in tag_ids[tag_bounds[idx]:tag_bounds[idx + 1]])
+        features.extend(genre_names[g] for g in genre_ids[genre_bounds[idx]:genre_bounds[idx + 1]])
+        features.extend(rng.choice(OTHER_CATEGORIES, rng.integers(1, 4), replace=False).tolist())
+        if multiplayer[idx]:
+            features.extend(rng.choice(MULTIPLAYER_CATEGORIES, rng.integers(1, 3), replace=False).tolist())
+        catalog[str(FIRST_APPID + 10 * idx)] = features
+    return catalog
+
+
+def generate_libraries(
+    n_users: int,
+    game_ids: List[str],
+    mean_library: float = 60.0,
+    library_shape: float = 1.5,
+    popularity_exponent: float = 1.0,
+    unplayed_share: float = 0.15,
+    seed: int = 0
+) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed + 1)
+    scale = mean_library * (library_shape - 1) / library_shape
+    sizes = np.minimum((rng.pareto(library_shape, n_users) + 1) * scale, len(game_ids)).astype(np.int64)
+    popularity = zipf_weights(len(game_ids), popularity_exponent)[rng.permutation(len(game_ids))]
+    owners, games = sample_ragged(rng, np.maximum(sizes, 1), popularity)
+    playtime = np.round(rng.lognormal(5.0, 1.6, len(owners))).astype(np.int64)
+    playtime[rng.random(len(owners)) < unplayed_share] = 0
+    user_ids = [str(FIRST_STEAMID + idx) for idx in range(n_users)]
+    return user_ids, owners, games, playtime
+
+
+def split_features(features: List[str]) -> Dict:
+    split = {"rating": None, "tags": [], "genres": [], "features": []}
+    for feature in features:
+        if feature.startswith("rating:"):
+            split["rating"] = int(feature[len("rating:"):])
+        elif feature.startswith("Tag "):
+            split["tags"].append(feature)
+        elif feature.startswith("Genre "):
+            split["genres"].append(feature)
+        else:
+            split["features"].append(feature)
+    return split
+
+
+def login_for(steamid64: str) -> str:
+    return f"user{int(steamid64) - FIRST_STEAMID}"
+
+
+class InMemoryDataSource:
+    def __init__(
+        self,
+        game_features: Dict[str, List[str]],
+        user_ids: List[str],
+        owners: np.ndarray,
+        games: np.ndarray,
+        playtime: np.ndarray,
+        wishlists: Optional[Dict[str, List[str]]] = None,
+        blacklists: Optional[Dict[str, List[str]]] = None
+    ):
+        self.game_features = game_features
+        self.game_ids = list(game_features.keys())
+        self.user_ids = user_ids
+        self.user_index = {uid: idx for idx, uid in enumerate(user_ids)}
+        order = np.argsort(owners, kind="stable")
+        self.owners = owners[order]
+        self.games = games[order]
+        self.playtime = playtime[order]
+        self.bounds = np.searchsorted(self.owners, np.arange(len(user_ids) + 1))
+        self.wishlists = wishlists or {}
+        self.blacklists = blacklists or {}
+        self.interactions = None
+
+    @classmethod
+    def generate(cls, n_games: int, n_users: int, seed: int = 0, **library_options):
+        game_features = generate_catalog(n_games, seed=seed)
+        user_ids, owners, games, playtime = generate_libraries(
+            n_users, list(game_features.keys()), seed=seed, **library_options
+        )
+        return cls(game_features, user_ids, owners, games, playtime)
+
+    def library(self, steamid64: str) -> List[Tuple[str, int]]:
+        idx = self.user_index.get(str(steamid64))
+        if idx is None:
+            return []
+        start, end = self.bounds[idx], self.bounds[idx + 1]
+        return [
+            (self.game_ids[game], int(minutes))
+            for game, minutes in zip(self.games[start:end], self.playtime[start:end])
+        ]
+
+    def sample_users(self, n: int, seed: int = 0, min_played: int = 2) -> List[str]:
+        played = np.bincount(self.owners[self.playtime > 0], minlength=len(self.user_ids))
+        candidates = np.flatnonzero(played >= min_played)
+        rng = np.random.default_rng(seed)
+        chosen = rng.choice(candidates, min(n, len(candidates)), replace=False)
+        return [self.user_ids[idx] for idx in chosen]
+
+    def seed_user_lists(self, steamids: List[str], size: int = 5, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        for steamid64 in steamids:
+            picks = rng.choice(len(self.game_ids), 2 * size, replace=False)
+            self.wishlists[login_for(steamid64)] = [self.game_ids[idx] for idx in picks[:size]]
+            self.blacklists[login_for(steamid64)] = [self.game_ids[idx] for idx in picks[size:]]
+
+    def stats(self) -> Dict:
+        sizes = np.diff(self.bounds)
+        return {
+            "games": len(self.game_ids),
+            "users": len(self.user_ids),
+            "library_rows": int(len(self.owners)),
+            "played_rows": int((self.playtime > 0).sum()),
+            "library_size_p50": float(np.percentile(sizes, 50)),
+            "library_size_p99": float(np.percentile(sizes, 99)),
+            "library_size_max": int(sizes.max()) if len(sizes) else 0
+        }
+
+    async def get_user_game_interactions(self):
+        if self.interactions is None:
+            played = np.flatnonzero(self.playtime > 0)
+            self.interactions = [
+                (self.user_ids[owner], self.game_ids[game], int(minutes))
+                for owner, game, minutes in zip(self.owners[played], self.games[played], self.playtime[played])
+            ]
+        return self.interactions
+
+    async def get_game_features(self):
+        return self.game_features
+
+    async def get_user_games_ids(self, steamid64):
+        return self.library(steamid64)
+
+    async def get_user_libraries(self, steamids):
+        return {steamid64: self.library(steamid64) for steamid64 in steamids}
+
+    async def get_wishlist_from_db(self, login: str):
+        return self.wishlists.get(login, [])
+
+    async def get_blacklist_from_db(self, login: str):
+        return self.blacklists.get(login, [])
@@ -4,6 +4,7 @@ import asyncio
 import random
 import functools
 import logging
+import os
 
 
 logging.basicConfig(level=logging.INFO)
@@ -11,7 +12,11 @@ logger = logging.getLogger(__name__)
 
 
 API_KEY = "***********"
-STEAM_API_URL = "http://api.steampowered.com"
+STEAM_API_URL = os.environ.get("STEAM_API_URL", "http://api.steampowered.com")
+REQUEST_DELAY = (
+    float(os.environ.get("STEAM_REQUEST_DELAY_MIN", 1)),
+    float(os.environ.get("STEAM_REQUEST_DELAY_MAX", 2))
+)
 
 
 def retry_on_error(max_retries=10, delay=2):
@@ -45,7 +50,7 @@ def retry_on_error(max_retries=10, delay=2):
 @retry_on_error(max_retries=10, delay=2)
 async def get_app_list():
     try:
-        await asyncio.sleep(random.uniform(1, 2))
+        await asyncio.sleep(random.uniform(*REQUEST_DELAY))
         async with aiohttp.ClientSession() as session:
             async with session.get(f"{STEAM_API_URL}/ISteamApps/GetAppList/v2/") as response:
                 if response.status != 200:
@@ -58,7 +63,7 @@ async def get_app_list():
 @retry_on_error(max_retries=10, delay=2)
 async def get_nickname(SteamID64):
     try:
-        await asyncio.sleep(random.uniform(1, 2))
+        await asyncio.sleep(random.uniform(*REQUEST_DELAY))
         async with aiohttp.ClientSession() as session:
             async with session.get(
                 f"{STEAM_API_URL}/ISteamUser/GetPlayerSummaries/v0002/",
@@ -78,7 +83,7 @@ async def get_nickname(SteamID64):
 @retry_on_error(max_retries=10, delay=2)
 async def get_games(SteamID64):
     try:
-        await asyncio.sleep(random.uniform(1, 2))
+        await asyncio.sleep(random.uniform(*REQUEST_DELAY))
         async with aiohttp.ClientSession() as session:
             async with session.get(
                 f"{STEAM_API_URL}/IPlayerService/GetOwnedGames/v0001/",
@@ -99,7 +104,7 @@ async def get_games(SteamID64):
 @retry_on_error(max_retries=10, delay=2)
 async def get_friends(SteamID64):
     try:
-        await asyncio.sleep(random.uniform(1, 2))
+        await asyncio.sleep(random.uniform(*REQUEST_DELAY))
         async with aiohttp.ClientSession() as session:
             async with session.get(
                 f"{STEAM_API_URL}/ISteamUser/GetFriendList/v0001/",
@@ -0,0 +1,180 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+import psycopg
+import cProfile
+import json
+import os
+import random
+import time
+import uuid
+from typing import Dict, List, Optional
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+
+TRACE_HEADER = "x-trace"
+PROFILE_HEADER = "x-profile"
+TRACE_SAMPLE_RATE = float(os.environ.get("TRYIT_TRACE_SAMPLE_RATE", 0))
+TRACE_DIR = os.environ.get("TRYIT_TRACE_DIR")
+PROFILING_ENABLED = os.environ.get("TRYIT_PROFILING_ENABLED") == "1"
+MAX_SQL_LENGTH = 500
+current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("name", "attrs", "start", "end", "children")
+
+    def __init__(self, name: str, attrs: Dict):
+        self.name = name
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.end = None
+        self.children: List[Span] = []
+
+    def duration_ms(self) -> float:
+        return ((self.end or time.perf_counter()) - self.start) * 1000
+
+    def to_dict(self, origin: float = None) -> Dict:
+        origin = self.start if origin is None else origin
+        return {
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000, 3),
+            "duration_ms": round(self.duration_ms(), 3),
+            "open": self.end is None,
+            "attrs": self.attrs,
+            "children": [child.to_dict(origin) for child in self.children]
+        }
+
+
+@contextmanager
+def span(name: str, **attrs):
+    parent = current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, attrs)
+    parent.children.append(child)
+    token = current_span.set(child)
+    try:
+        yield child
+    finally:
+        child.end = time.perf_counter()
+        current_span.reset(token)
+
+
+def tracing_requested(headers) -> bool:
+    if headers.get(TRACE_HEADER) == "1":
+        return True
+    return TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE
+
+
+@contextmanager
+def trace(name: str, **attrs):
+    root = Span(name, attrs)
+    token = current_span.set(root)
+    try:
+        yield root
+    finally:
+        root.end = time.perf_counter()
+        current_span.reset(token)
+
+
+def server_timing(root: Span) -> str:
+    totals = {}
+    for child in root.children:
+        stats = totals.setdefault(child.name, [0.0, 0])
+        stats[0] += child.duration_ms()
+        stats[1] += 1
+    stack = list(root.children)
+    sql_time, sql_count = 0.0, 0
+    while stack:
+        node = stack.pop()
+        if node.name == "sql":
+            sql_time += node.duration_ms()
+            sql_count += 1
+        stack.extend(node.children)
+    entries = [f"total;dur={root.duration_ms():.1f}"]
+    entries.extend(
+        f'{name};dur={duration:.1f};desc="x{count}"' if count > 1 else f"{name};dur={duration:.1f}"
+        for name, (duration, count) in totals.items()
+    )
+    if sql_count:
+        entries.append(f'sql;dur={sql_time:.1f};desc="{sql_count} queries"')
+    return ", ".join(entries)
+
+
+def open_spans() -> str:
+    root = current_span.get()
+    if root is None:
+        return "no trace"
+    names = []
+    stack = [(root, root.name)]
+    while stack:
+        node, path = stack.pop()
+        pending = [child for child in node.children if child.end is None]
+        if not pending and node.end is None and node is not root:
+            names.append(f"{path} ({node.duration_ms():.0f} ms)")
+        stack.extend((child, f"{path}/{child.name}") for child in pending)
+    return ", ".join(names) or "no pending spans"
+
+
+def dump_trace(root: Span) -> Optional[str]:
+    if not TRACE_DIR:
+        return None
+    os.makedirs(TRACE_DIR, exist_ok=True)
+    path = os.path.join(TRACE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(root.to_dict(), f, indent=2, default=str)
+    return path
+
+
+class Profiler:
+    def __init__(self):
+        self.profiler = pyinstrument.Profiler(async_mode="enabled") if pyinstrument else cProfile.Profile()
+
+    def __enter__(self):
+        if pyinstrument:
+            self.profiler.start()
+        else:
+            self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        if pyinstrument:
+            self.profiler.stop()
+        else:
+            self.profiler.disable()
+
+    def dump(self) -> Optional[str]:
+        if not TRACE_DIR:
+            return None
+        os.makedirs(TRACE_DIR, exist_ok=True)
+        stem = os.path.join(TRACE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}")
+        if pyinstrument:
+            path = stem + ".html"
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(self.profiler.output_html())
+        else:
+            path = stem + ".prof"
+            self.profiler.dump_stats(path)
+        return path
+
+
+class TracedAsyncCursor(psycopg.AsyncCursor):
+    async def execute(self, query, params=None, **kwargs):
+        if current_span.get() is None:
+            return await super().execute(query, params, **kwargs)
+        with span("sql", statement=" ".join(str(query).split())[:MAX_SQL_LENGTH]) as sql_span:
+            result = await super().execute(query, params, **kwargs)
+            sql_span.attrs["rows"] = self.rowcount
+            return result
+
+    async def executemany(self, query, params_seq, **kwargs):
+        if current_span.get() is None:
+            return await super().executemany(query, params_seq, **kwargs)
+        with span("sql", statement=" ".join(str(query).split())[:MAX_SQL_LENGTH], many=True) as sql_span:
+            result = await super().executemany(query, params_seq, **kwargs)
+            sql_span.attrs["rows"] = self.rowcount
+            return result